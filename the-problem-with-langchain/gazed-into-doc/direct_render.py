@@ -0,0 +1,94 @@
+"""
+工具结果直接渲染（Direct Render） - 跳过最后一次"格式化"LLM调用
+
+example4 中 search_recipes_typed 已经返回了结构化的recipe字典，
+Agent却还要再发起一次完整的LLM调用，只为把它们重新排版成列表（还经常漏掉ID）。
+
+这里为单个工具开启"直接渲染"模式：
+- 工具输出用本地模板渲染成最终回答
+- 工具设置 return_direct=True，AgentExecutor 拿到观察结果后直接结束，不再调用LLM
+
+对于以搜索为主的查询，这样可以省掉一半的LLM往返时间和费用，且ID一定不会丢。
+
+限制：return_direct=True 时，AgentExecutor 在这个工具第一次被调用后就结束，
+模型没有机会再调用其他工具、换个关键词重新搜索，或者把几次结果合并成一个回答。
+只应该给"一次调用就能完整回答"的工具开启（例如示例4中按关键词列出食谱）；
+需要多步推理的Agent应保留普通工具，让模型自己组织最终回答。
+"""
+
+import functools
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Type
+
+
+@dataclass
+class RenderTemplate:
+    """本地渲染模板，占位符使用 str.format 语法"""
+    row: str  # 每条记录的模板，可使用记录的字段以及 {index}（从1开始）
+    header: str = ""  # 列表前的文字，可使用 {count} 和工具参数（如 {query}）
+    footer: str = ""
+    empty: str = "No results found."  # 没有结果时的回答
+    separator: str = "\n"
+
+    def render(self, rows: list[Any], **tool_args: Any) -> str:
+        """把工具返回的记录列表渲染成最终回答"""
+        records = [_as_dict(row) for row in rows]
+        if not records:
+            return self.empty.format(count=0, **tool_args)
+
+        parts = []
+        if self.header:
+            parts.append(self.header.format(count=len(records), **tool_args))
+        parts.append(self.separator.join(
+            self.row.format(index=i, **record) for i, record in enumerate(records, 1)
+        ))
+        if self.footer:
+            parts.append(self.footer.format(count=len(records), **tool_args))
+        return "\n".join(parts)
+
+
+def _as_dict(row: Any) -> dict[str, Any]:
+    """兼容字典和pydantic模型（v1的 .dict() / v2的 .model_dump()）"""
+    if isinstance(row, dict):
+        return row
+    if hasattr(row, "model_dump"):
+        return row.model_dump()
+    return row.dict()
+
+
+def make_direct_render_tool(
+    func: Callable[..., list[Any]],
+    template: RenderTemplate,
+    name: str,
+    description: str,
+    args_schema: Optional[Type[Any]] = None,
+):
+    """
+    创建一个开启直接渲染模式的StructuredTool
+
+    调用这个工具就是Agent的最后一步（见模块说明中的限制），
+    不要把它和需要组合结果的其他工具放进同一个Agent。
+
+    Args:
+        func: 返回记录列表的工具函数
+        template: 本地渲染模板
+        name: 工具名称
+        description: 工具描述
+        args_schema: 工具参数模型（如 RecipeSearchInput）
+
+    Returns:
+        return_direct=True 的 StructuredTool，其输出就是最终回答
+    """
+    from langchain_core.tools import StructuredTool
+
+    @functools.wraps(func)
+    def rendered(**kwargs: Any) -> str:
+        return template.render(func(**kwargs), **kwargs)
+
+    return StructuredTool.from_function(
+        func=rendered,
+        name=name,
+        description=description,
+        args_schema=args_schema,
+        return_direct=True,
+    )
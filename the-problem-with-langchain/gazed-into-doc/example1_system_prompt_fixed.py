@@ -40,7 +40,7 @@ llm = ChatOpenAI(
     model="deepseek-chat",
     temperature=0,
     openai_api_key=os.environ.get("DEEPSEEK_API_KEY"),
-    openai_api_base="https://api.deepseek.com"
+    openai_api_base=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 )
 
 # 创建agent
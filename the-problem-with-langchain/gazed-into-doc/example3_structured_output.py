@@ -1,4 +1,5 @@
 import os
+import sys
 from typing import List, Dict
 from langchain_openai import ChatOpenAI
 from langchain.agents import AgentExecutor, create_react_agent
@@ -6,6 +7,10 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools import Tool, StructuredTool
 from langchain_core.pydantic_v1 import BaseModel, Field
 
+# 复用 hello-world 中的追踪模块
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "hello-world"))
+from agent_tracing import Tracer, trace_path
+
 # 定义结构化输出模型
 class Recipe(BaseModel):
     """Recipe information"""
@@ -60,15 +65,15 @@ CRITICAL RULES:
 prompt = ChatPromptTemplate.from_messages([
     ("system", system_prompt + "\n\nYou have access to the following tools:\n\n{tools}\n\nUse the following format:\n\nQuestion: the input question you must answer\nThought: you should always think about what to do\nAction: the action to take, should be one of [{tool_names}]\nAction Input: the input to the action\nObservation: the result of the action\n... (this Thought/Action/Action Input/Observation can repeat N times)\nThought: I now know the final answer\nFinal Answer: the final answer to the original input question"),
     MessagesPlaceholder(variable_name="chat_history", optional=True),
-    ("human", "{input}"),
-    MessagesPlaceholder(variable_name="agent_scratchpad"),
+    # create_react_agent 把中间步骤格式化成字符串（Thought/Action/Observation），不能用 MessagesPlaceholder
+    ("human", "Question: {input}\n{agent_scratchpad}"),
 ])
 
 llm = ChatOpenAI(
     model="deepseek-chat",
     temperature=0,
     openai_api_key=os.environ.get("DEEPSEEK_API_KEY"),
-    openai_api_base="https://api.deepseek.com"
+    openai_api_base=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 )
 
 agent = create_react_agent(llm, tools, prompt)
@@ -85,7 +90,12 @@ print("=" * 80)
 print("Testing Structured Output in LangChain v1.0")
 print("=" * 80)
 
-result = agent_executor.invoke({"input": "Find me some dessert recipes"})
+# ✅ 通过回调记录每次LLM调用、解析和工具执行的耗时
+tracer = Tracer("example3-react-agent")
+result = agent_executor.invoke(
+    {"input": "Find me some dessert recipes"},
+    config={"callbacks": [tracer.callback_handler()]}
+)
 
 print("\n" + "=" * 80)
 print("📋 Final Agent Output:")
@@ -112,3 +122,45 @@ if "recipe|" in output:
 else:
     print("\n⚠️  WARNING: Recipe IDs might be missing from the output")
 
+# 耗时分布：每一秒花在了哪里
+tracer.print_summary()
+trace_file = trace_path("example3_trace.json")
+tracer.save(trace_file)
+print(f"📁 时间线已保存到 {trace_file}（用 chrome://tracing 或 ui.perfetto.dev 打开）")
+
+# ============================================================================
+# 结构化流式输出：边生成边解析，每个Recipe一完成就立即可用
+# ============================================================================
+import time
+from streaming_json import stream_validated
+
+print("\n" + "=" * 80)
+print("⚡ Structured Streaming Output (Recipe objects as soon as they close)")
+print("=" * 80)
+
+json_system_prompt = """You are a helpful recipe assistant.
+Answer ONLY with a JSON object of this exact shape:
+{"query": "<original query>", "recipes": [{"recipe_id": "recipe|XXXXX", "name": "<name>", "category": "<category>"}]}
+Include EVERY recipe from the search results. Never omit the recipe_id."""
+
+query = "Find me some dessert recipes"
+observation = search_recipes_structured(query)
+
+# 请求JSON输出，并以流的形式接收
+json_llm = llm.bind(response_format={"type": "json_object"})
+chunks = (
+    str(chunk.content)
+    for chunk in json_llm.stream([
+        ("system", json_system_prompt),
+        ("human", f"Question: {query}\n\nSearch results:\n{observation}"),
+    ])
+)
+
+start = time.time()
+streamed_recipes = []
+for recipe in stream_validated(chunks, Recipe, on_error=lambda obj, e: print(f"⚠️  Invalid recipe skipped: {obj}")):
+    streamed_recipes.append(recipe)
+    # 下游（UI、下单服务）可以在这里立即处理这条结果
+    print(f"[{time.time() - start:.2f}s] 🍰 {recipe.recipe_id} - {recipe.name} ({recipe.category})")
+
+print(f"\n✅ Streamed {len(streamed_recipes)} validated Recipe objects in {time.time() - start:.2f}s")
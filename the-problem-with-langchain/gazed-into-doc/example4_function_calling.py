@@ -1,10 +1,20 @@
 import os
+import sys
 from typing import List
 from langchain_openai import ChatOpenAI
 from langchain.agents import AgentExecutor, create_openai_functions_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools import StructuredTool
 from langchain_core.pydantic_v1 import BaseModel, Field
+from fast_validation import compiled_tool
+
+# 复用 hello-world 中的追踪模块，统计每次运行实际发起的LLM调用次数
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "hello-world"))
+from agent_tracing import Tracer
+
+
+def count_llm_calls(tracer: Tracer) -> int:
+    return int(tracer.summary().get("llm", {}).get("count", 0))
 
 # 定义工具输入模型
 class RecipeSearchInput(BaseModel):
@@ -25,8 +35,9 @@ def search_recipes_typed(query: str) -> List[dict]:
     ]
 
 # 创建结构化工具
+# ✅ 工具输出用编译后的 RecipeInfo 校验器整批校验，直接序列化成JSON交给模型（见 fast_validation.py）
 recipe_search_tool = StructuredTool.from_function(
-    func=search_recipes_typed,
+    func=compiled_tool(returns=RecipeInfo)(search_recipes_typed),
     name="SearchRecipes",
     description="Search for recipes based on a query. Returns a list of recipes with ID, name, and category.",
     args_schema=RecipeSearchInput,
@@ -56,7 +67,7 @@ llm = ChatOpenAI(
     model="deepseek-chat",
     temperature=0,
     openai_api_key=os.environ.get("DEEPSEEK_API_KEY"),
-    openai_api_base="https://api.deepseek.com"
+    openai_api_base=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 )
 
 # ✅ 使用OpenAI Functions agent（更可靠的结构化输出）
@@ -74,7 +85,9 @@ print("Testing DeepSeek Function Calling in LangChain v1.0")
 print("=" * 80)
 print("This approach uses DeepSeek's native function calling for reliable structured output\n")
 
-result = agent_executor.invoke({"input": "Find me dessert recipes"})
+baseline_tracer = Tracer("function-calling")
+result = agent_executor.invoke({"input": "Find me dessert recipes"},
+                               config={"callbacks": [baseline_tracer.callback_handler()]})
 
 print("\n" + "=" * 80)
 print("📋 Final Output:")
@@ -93,3 +106,48 @@ import re
 recipe_ids = re.findall(r'recipe\|\d+', result["output"])
 print(f"\n✅ Extracted {len(recipe_ids)} Recipe IDs from final output: {recipe_ids}")
 
+
+# ============================================================================
+# 直接渲染模式：工具结果用本地模板渲染，跳过最后一次LLM格式化调用
+# ============================================================================
+import time
+from direct_render import RenderTemplate, make_direct_render_tool
+
+print("\n" + "=" * 80)
+print("⚡ Direct Render Mode (no second LLM round trip)")
+print("=" * 80)
+
+recipe_template = RenderTemplate(
+    header='Here are {count} recipes for "{query}":',
+    row="{index}. {name}\n   - Recipe ID: {recipe_id}\n   - Category: {category}",
+    empty='Sorry, no recipes found for "{query}".'
+)
+
+direct_tools = [
+    make_direct_render_tool(
+        search_recipes_typed,
+        recipe_template,
+        name="SearchRecipes",
+        description="Search for recipes based on a query. Returns a list of recipes with ID, name, and category.",
+        args_schema=RecipeSearchInput
+    )
+]
+
+direct_executor = AgentExecutor(
+    agent=create_openai_functions_agent(llm, direct_tools, prompt),
+    tools=direct_tools,
+    verbose=True,
+    return_intermediate_steps=True
+)
+
+direct_tracer = Tracer("direct-render")
+start = time.time()
+direct_result = direct_executor.invoke({"input": "Find me dessert recipes"},
+                                       config={"callbacks": [direct_tracer.callback_handler()]})
+elapsed = time.time() - start
+
+print("\n📋 Final Output (rendered locally):")
+print(direct_result["output"])
+direct_ids = re.findall(r'recipe\|\d+', direct_result["output"])
+print(f"\n✅ {len(direct_ids)} Recipe IDs, {count_llm_calls(direct_tracer)} LLM call(s) "
+      f"instead of {count_llm_calls(baseline_tracer)}, {elapsed:.2f}s")
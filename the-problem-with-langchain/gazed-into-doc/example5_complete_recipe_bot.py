@@ -1,39 +1,48 @@
 import os
 import re
-from typing import List, Dict, Any
-from langchain_openai import ChatOpenAI
-from langchain.agents import AgentExecutor, create_openai_functions_agent
+import sys
+from typing import List, Dict, Any, Optional
+from langchain.agents import create_openai_functions_agent
 from langchain.memory import ConversationBufferMemory
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools import StructuredTool
 from langchain_core.pydantic_v1 import BaseModel, Field
+from query_router import GREETING_RESPONSE, OFF_TOPIC_RESPONSE, QueryRouter
+from recipe_data import ALL_RECIPES, RECIPE_DB, category_request
+from run_budget import BudgetedAgentExecutor, BudgetedChatOpenAI, budgeted_tool
+from semantic_search import SemanticIndex, recipe_encoder, recipe_text
+from tool_cache import ToolCache
 
-# 模拟recipe数据库
-RECIPE_DB = {
-    "dessert": [
-        {"recipe_id": "recipe|167188", "name": "Creamy Strawberry Pie", "category": "dessert", "difficulty": "easy"},
-        {"recipe_id": "recipe|1488243", "name": "Summer Strawberry Pie", "category": "dessert", "difficulty": "medium"},
-        {"recipe_id": "recipe|299514", "name": "Pudding Cake", "category": "dessert", "difficulty": "easy"},
-    ],
-    "dinner": [
-        {"recipe_id": "recipe|1774221", "name": "Crab Dip Your Guests will Like", "category": "dinner", "difficulty": "easy"},
-        {"recipe_id": "recipe|836179", "name": "Easy Chicken Casserole", "category": "dinner", "difficulty": "easy"},
-        {"recipe_id": "recipe|1980633", "name": "Easy Microwave Curry Doria", "category": "dinner", "difficulty": "easy"},
-    ]
-}
+# 复用 hello-world 中的追踪模块
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "hello-world"))
+from agent_tracing import Tracer, trace_memory, trace_path
+
+# 每轮对话的SLA：时间预算（秒）和token预算
+TURN_DEADLINE_S = 5.0
+TURN_TOKEN_BUDGET = 4000
+
+# 本地语义索引：查询不只是分类名时（如 "a sugary treat for the kids"）按哈希向量相似度检索
+recipe_index = SemanticIndex.build(ALL_RECIPES, text=recipe_text, encoder=recipe_encoder())
+
+# 工具输入模型：缓存键来自校验并规范化后的参数
+class RecipeSearchInput(BaseModel):
+    query: str = Field(description="Keywords such as 'dessert' or 'dinner'")
+
+# 同一查询在各个会话之间、以及解析出错重试时复用结果
+tool_cache = ToolCache()
 
 # 工具函数
+@tool_cache.cached("SearchRecipes", ttl_s=300, maxsize=1024, args_schema=RecipeSearchInput)
 def search_recipes(query: str) -> str:
     """根据查询搜索食谱"""
-    query_lower = query.lower()
-    results = []
-    
-    # 简单的关键词匹配
-    for category, recipes in RECIPE_DB.items():
-        if category in query_lower or any(word in query_lower for word in ["dinner", "dessert", "meal"]):
-            results.extend(recipes)
-    
-    # 如果没有匹配，返回dessert作为默认
+    # 只有分类名的查询（"dessert"、"dinner recipes"）直接按分类列出；
+    # 其余查询（"something sweet for after dinner"）按语义检索排序，不因为出现了分类名就列出整个分类
+    categories = category_request(query)
+    if categories is not None:
+        results = [recipe for category in categories for recipe in RECIPE_DB[category]]
+    else:
+        results = [recipe for _score, recipe in recipe_index.search(query, k=3, min_score=0.1)]
+    # 语义检索也没有结果时返回dessert作为默认
     if not results:
         results = RECIPE_DB["dessert"]
     
@@ -51,8 +60,9 @@ def search_recipes(query: str) -> str:
 # 创建工具
 tools = [
     StructuredTool.from_function(
-        func=search_recipes,
+        func=budgeted_tool(search_recipes),
         name="SearchRecipes",
+        args_schema=RecipeSearchInput,
         description="Search for recipes based on keywords like 'dessert', 'dinner', etc. Returns Recipe ID, name, category, and difficulty."
     )
 ]
@@ -78,16 +88,21 @@ prompt = ChatPromptTemplate.from_messages([
 ])
 
 # 初始化组件
-llm = ChatOpenAI(
+# ✅ 每次LLM调用的 timeout / max_tokens 都从本轮剩余预算推导
+llm = BudgetedChatOpenAI(
     model="deepseek-chat",
     temperature=0.7,
     openai_api_key=os.environ.get("DEEPSEEK_API_KEY"),
-    openai_api_base="https://api.deepseek.com"
+    openai_api_base=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 )  # 稍高的temperature增加趣味性
 agent = create_openai_functions_agent(llm, tools, prompt)
 memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
 
-agent_executor = AgentExecutor(
+# 追踪LLM调用、工具执行以及记忆读写的耗时
+tracer = Tracer("example5-recipe-bot")
+trace_memory(memory, tracer)
+
+agent_executor = BudgetedAgentExecutor(
     agent=agent,
     tools=tools,
     memory=memory,
@@ -97,6 +112,24 @@ agent_executor = AgentExecutor(
     max_iterations=3
 )
 
+# Agent之前的本地路由：问候、无关话题和明确的搜索不调用LLM
+router = QueryRouter.load_or_train()
+
+def answer_locally(query: str) -> Optional[str]:
+    """路由到本地处理时返回回答（并写入记忆，后续Agent轮次仍能看到）；需要Agent时返回None"""
+    route = router.classify(query)
+    if route.label == "greeting":
+        response = GREETING_RESPONSE
+    elif route.label == "off_topic":
+        response = OFF_TOPIC_RESPONSE
+    elif route.label == "direct_search":
+        response = f"Coming right up, fresh from the recipe box! 🎪\n\n{search_recipes(route.category)}"
+    else:
+        return None
+    memory.save_context({"input": query}, {"output": response})
+    print(f"⚡ Routed locally: {route.label} ({route.source}, confidence {route.confidence:.2f})")
+    return response
+
 # 交互式聊天循环
 def chat():
     print("=" * 80)
@@ -123,10 +156,32 @@ def chat():
         print(f"{'='*80}\n")
         
         try:
-            result = agent_executor.invoke({"input": query})
+            with tracer.span(f"route: {query}", category="route"):
+                local_response = answer_locally(query)
+            if local_response is not None:
+                print(f"🤖 Chef: {local_response}\n")
+                continue
+
+            with tracer.span(f"turn: {query}", category="turn"):
+                with tool_cache.recording() as cache_records:
+                    result = agent_executor.invoke_with_budget(
+                        {"input": query},
+                        deadline_s=TURN_DEADLINE_S,
+                        token_budget=TURN_TOKEN_BUDGET,
+                        config={"callbacks": [tracer.callback_handler()]}
+                    )
+                tool_cache.with_cache_metadata(result, cache_records)
             response = result["output"]
             
             print(f"🤖 Chef: {response}\n")
+            print(f"⏱️  {result['elapsed_s']:.2f}s, {result['tokens_used']} tokens")
+            if result.get("budget_exhausted"):
+                print(f"⚠️  Budget exhausted, returned partial answer: {result['budget_reason']}")
+            
+            for step_metadata in result["intermediate_steps_metadata"]:
+                if "cache" in step_metadata:
+                    print(f"🗄️  {step_metadata['tool']}: cache {step_metadata['cache']} "
+                          f"(hit rate {step_metadata['tool_hit_rate']:.0%})")
             
             # 验证Recipe ID
             if result.get("intermediate_steps"):
@@ -142,6 +197,12 @@ def chat():
             print(f"❌ Error: {e}")
         
         print()
+    
+    print(f"🧭 Router: {router.stats.report()}")
+    tracer.print_summary()
+    trace_file = trace_path("example5_trace.json")
+    tracer.save(trace_file)
+    print(f"📁 时间线已保存到 {trace_file}（用 chrome://tracing 或 ui.perfetto.dev 打开）")
 
 if __name__ == "__main__":
     chat()
@@ -0,0 +1,261 @@
+"""
+编译式批量校验 - 工具输入/输出模型只编译一次，整批校验，直接序列化为JSON
+
+示例中的 RecipeSearchInput、RecipeInfo、Recipe、RecipeSearchResult 都经过
+langchain_core.pydantic_v1 兼容层：每一行都要构造一个v1模型对象（纯Python逐字段校验），
+再 .dict() 复制成字典、json.dumps 成字符串交给SDK。真实目录一次返回几千条 RecipeInfo 时，
+这是Agent里明显的CPU热点。
+
+compile_schema(model) 把模型（v1兼容层或v2均可）的字段翻译成 pydantic-core 的核心schema，
+每个模型只编译一次（结果缓存），得到：
+- validate_many(rows)：整个列表一次进入Rust校验器，返回校验后的字典列表（不构造模型对象）
+- validate_json(data)：直接从目录返回的JSON字节校验，省掉 json.loads
+- dump_json(rows)：按同一个schema直接序列化成SDK需要的JSON字符串，没有中间的 .dict() 复制
+- 语义与v1一致：多余的字段忽略、缺省值补齐（default_factory 每行调用一次，不共享可变对象）、
+  数字可以转成字符串字段
+
+pydantic-core 是 pydantic v2 的依赖，LangChain 0.3 已经安装，不需要新的依赖。
+
+用法:
+    recipes = compile_schema(RecipeInfo)
+    rows = recipes.validate_many(catalog_rows)             # 失败时抛出 pydantic_core.ValidationError
+    content = recipes.dump_json(rows)                      # 工具消息的 content
+
+    @compiled_tool(args_schema=RecipeSearchInput, returns=RecipeInfo)
+    def search_recipes(query: str) -> list[dict]: ...      # 返回校验后的JSON字符串
+
+    python fast_validation.py --rows 10000                 # 基准测试
+"""
+
+import functools
+import inspect
+import types
+import typing
+from typing import Any, Callable, Optional, Type, Union
+
+from pydantic_core import SchemaSerializer, SchemaValidator, core_schema
+
+_SCALARS: dict[Any, Callable[[], core_schema.CoreSchema]] = {
+    # v1的str字段接受数字（recipe_id=123 → "123"），编译后保持同样的语义
+    str: lambda: core_schema.str_schema(coerce_numbers_to_str=True),
+    int: core_schema.int_schema,
+    float: core_schema.float_schema,
+    bool: core_schema.bool_schema,
+    Any: core_schema.any_schema,
+}
+
+
+def _fields(model: Type[Any]) -> list[tuple[str, Any, bool, Any, Optional[Callable[[], Any]], Optional[str]]]:
+    """(字段名, 类型注解, 是否必填, 缺省值, 缺省值工厂, 别名)；兼容v1兼容层和v2模型"""
+    if hasattr(model, "model_fields"):  # pydantic v2
+        return [(name, info.annotation, info.is_required(), info.default, info.default_factory, info.alias)
+                for name, info in model.model_fields.items()]
+    return [(name, field.annotation, field.required, field.default, field.default_factory,
+             field.alias if field.alias != name else None)
+            for name, field in model.__fields__.items()]
+
+
+def _is_model(annotation: Any) -> bool:
+    return isinstance(annotation, type) and (hasattr(annotation, "model_fields") or hasattr(annotation, "__fields__"))
+
+
+def _annotation_schema(annotation: Any, definitions: dict[str, core_schema.CoreSchema]) -> core_schema.CoreSchema:
+    """把类型注解翻译成核心schema；不支持的类型抛出 TypeError"""
+    if annotation in _SCALARS:
+        return _SCALARS[annotation]()
+    if annotation is type(None):
+        return core_schema.none_schema()
+    if _is_model(annotation):
+        return _model_schema(annotation, definitions)
+
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin in (list, typing.List):
+        return core_schema.list_schema(_annotation_schema(args[0], definitions) if args else None)
+    if origin in (dict, typing.Dict):
+        keys, values = args or (Any, Any)
+        return core_schema.dict_schema(_annotation_schema(keys, definitions), _annotation_schema(values, definitions))
+    if origin is typing.Literal:
+        return core_schema.literal_schema(list(args))
+    if origin in (Union, types.UnionType):
+        members = [arg for arg in args if arg is not type(None)]
+        inner = (_annotation_schema(members[0], definitions) if len(members) == 1
+                 else core_schema.union_schema([_annotation_schema(arg, definitions) for arg in members]))
+        return core_schema.nullable_schema(inner) if len(members) < len(args) else inner
+    raise TypeError(f"unsupported annotation for compiled validation: {annotation!r}")
+
+
+def _model_schema(model: Type[Any], definitions: dict[str, core_schema.CoreSchema]) -> core_schema.CoreSchema:
+    """模型 → TypedDict形式的核心schema（校验结果是普通字典），嵌套模型通过引用共享"""
+    ref = f"{model.__module__}.{model.__qualname__}:{id(model)}"
+    if ref not in definitions:
+        definitions[ref] = core_schema.any_schema()  # 占位，支持自引用的模型
+        fields = {}
+        for name, annotation, required, default, default_factory, alias in _fields(model):
+            schema = _annotation_schema(annotation, definitions)
+            if default_factory is not None:
+                # 工厂交给校验器每行调用，[] / {} 这样的缺省值不会在行之间共享
+                schema = core_schema.with_default_schema(schema, default_factory=default_factory)
+            elif not required:
+                schema = core_schema.with_default_schema(schema, default=default)
+            # 有别名时别名和字段名都接受（模型对象 .dict() 出来的是字段名）
+            fields[name] = core_schema.typed_dict_field(
+                schema, required=required, validation_alias=[[alias], [name]] if alias else None)
+        definitions[ref] = core_schema.typed_dict_schema(fields, ref=ref, cls_name=model.__name__)
+    return core_schema.definition_reference_schema(ref)
+
+
+class CompiledSchema:
+    """一个模型编译后的校验器和序列化器"""
+
+    def __init__(self, model: Type[Any]):
+        self.model = model
+        definitions: dict[str, core_schema.CoreSchema] = {}
+        row = _model_schema(model, definitions)
+
+        def build(schema: core_schema.CoreSchema) -> core_schema.CoreSchema:
+            return core_schema.definitions_schema(schema, list(definitions.values()))
+
+        self._one = SchemaValidator(build(row))
+        self._many = SchemaValidator(build(core_schema.list_schema(row)))
+        self._serialize_one = SchemaSerializer(build(row))
+        self._serialize_many = SchemaSerializer(build(core_schema.list_schema(row)))
+
+    def __repr__(self) -> str:
+        return f"CompiledSchema({self.model.__name__})"
+
+    def validate(self, data: Any) -> dict[str, Any]:
+        """校验一条记录（字典或模型对象），返回字典"""
+        if not isinstance(data, dict) and _is_model(type(data)):
+            data = data.model_dump() if hasattr(data, "model_dump") else data.dict()
+        return self._one.validate_python(data)
+
+    def validate_many(self, rows: Any) -> list[dict[str, Any]]:
+        """整批校验字典列表，一次调用完成；任何一行出错都抛出 ValidationError（错误位置包含行号）"""
+        return self._many.validate_python(rows)
+
+    def validate_json(self, data: Union[str, bytes]) -> Any:
+        """直接校验JSON文本：是数组时按列表校验，否则按单条记录校验"""
+        text = data.lstrip()
+        if text[:1] in ("[", b"["):
+            return self._many.validate_json(data)
+        return self._one.validate_json(data)
+
+    def dump_json(self, data: Any, indent: Optional[int] = None) -> str:
+        """把校验后的记录（单条或列表）直接序列化成JSON字符串，例如工具消息的 content"""
+        serializer = self._serialize_many if isinstance(data, list) else self._serialize_one
+        return serializer.to_json(data, indent=indent).decode("utf-8")
+
+
+@functools.lru_cache(maxsize=None)
+def compile_schema(model: Type[Any]) -> CompiledSchema:
+    """编译模型（每个模型只编译一次）"""
+    return CompiledSchema(model)
+
+
+def compiled_tool(
+    args_schema: Optional[Type[Any]] = None,
+    returns: Optional[Type[Any]] = None,
+) -> Callable[[Callable[..., Any]], Callable[..., str]]:
+    """
+    工具函数装饰器：参数用 args_schema 校验，返回的记录列表用 returns 整批校验并序列化成JSON字符串
+
+    保留原函数签名，StructuredTool.from_function 可以照常使用。
+    """
+    arguments = compile_schema(args_schema) if args_schema is not None else None
+    result = compile_schema(returns) if returns is not None else None
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., str]:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> str:
+            if arguments is not None:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                kwargs, args = arguments.validate(dict(bound.arguments)), ()
+            value = func(*args, **kwargs)
+            if result is None:
+                return value if isinstance(value, str) else str(value)
+            rows = result.validate_many(value) if isinstance(value, list) else result.validate(value)
+            return result.dump_json(rows)
+
+        return wrapper
+
+    return decorator
+
+
+def main():
+    """10k行工具输出：v1兼容层逐行构造模型 vs 编译后整批校验+直接序列化"""
+    import argparse
+    import json
+    import time
+    import warnings
+    from typing import List
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # 基准测试正是要对比兼容层
+        from langchain_core.pydantic_v1 import BaseModel, Field
+
+    parser = argparse.ArgumentParser(description="编译式批量校验基准测试")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5, help="每种方式运行几次，取最快一次")
+    args = parser.parse_args()
+
+    class RecipeInfo(BaseModel):
+        recipe_id: str
+        name: str
+        category: str
+        tags: List[str] = Field(default_factory=list)
+
+    class Recipe(BaseModel):
+        """Recipe information"""
+        recipe_id: str = Field(description="The unique recipe ID")
+        name: str = Field(description="The recipe name")
+        category: str = Field(description="Recipe category")
+
+    class RecipeSearchResult(BaseModel):
+        """Search result with multiple recipes"""
+        recipes: List[Recipe] = Field(description="List of recipes found")
+        query: str = Field(description="Original search query")
+
+    categories = ["dessert", "dinner", "breakfast", "lunch", "snack"]
+    rows = [{"recipe_id": f"recipe|{100000 + i}", "name": f"Recipe number {i} with strawberries",
+             "category": categories[i % len(categories)], "difficulty": "easy"} for i in range(args.rows)]
+    raw = json.dumps(rows)
+    result = {"query": "dessert", "recipes": rows}
+
+    def best(func: Callable[[], Any]) -> float:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    start = time.perf_counter()
+    compiled_info, compiled_result = compile_schema(RecipeInfo), compile_schema(RecipeSearchResult)
+    compile_time = time.perf_counter() - start
+
+    # 两种方式的输出应该一致（包括 default_factory 补齐的 tags，且每行是独立的列表）
+    expected = json.dumps([RecipeInfo(**row).dict() for row in rows], separators=(",", ":"))
+    validated = compiled_info.validate_many(rows)
+    assert compiled_info.dump_json(validated) == expected
+    assert len(rows) < 2 or validated[0]["tags"] is not validated[1]["tags"]
+
+    cases = [
+        ("RecipeInfo list", lambda: json.dumps([RecipeInfo(**row).dict() for row in rows]),
+         lambda: compiled_info.dump_json(compiled_info.validate_many(rows))),
+        ("RecipeInfo from JSON", lambda: json.dumps([RecipeInfo(**row).dict() for row in json.loads(raw)]),
+         lambda: compiled_info.dump_json(compiled_info.validate_json(raw))),
+        ("RecipeSearchResult", lambda: RecipeSearchResult(**result).json(),
+         lambda: compiled_result.dump_json(compiled_result.validate(result))),
+    ]
+    print(f"⚙️  {args.rows} 行，编译两个schema共 {compile_time * 1000:.1f}ms（每个模型只编译一次）\n")
+    print(f"{'case':<22} {'v1 shim':>10} {'compiled':>10} {'speedup':>8}")
+    for name, baseline, compiled in cases:
+        slow, fast = best(baseline), best(compiled)
+        print(f"{name:<22} {slow * 1000:>8.1f}ms {fast * 1000:>8.1f}ms {slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Prompt的token占用分析与自动压缩
+
+示例1/2/3 的 system prompt 都粘贴了同一段ReAct格式说明，Agent每走一步都要重新发送一遍；
+learn-AI-app-dev-from-scratch 的 few-shot 示例中，方式3（FewShotChatMessagePromptTemplate）
+把每个示例展开成一对消息，每条消息都有固定开销，方式2 则只有一条system消息。
+
+analyze() 把消息列表拆成若干段（角色说明、工具列表、ReAct格式、few-shot示例、用户输入、
+每条消息的固定开销），统计每段的token数。compact() 生成语义等价的压缩版本：
+- few-shot 的 human/ai 消息对折叠进system消息（方式3 → 方式2 的形状）
+- 相邻的同角色消息合并
+- ReAct格式说明换成更短的等价写法（保留解析器依赖的 Action / Action Input / Final Answer 等关键字）
+- 工具描述只保留前几句、工具列表标题缩短，重复出现的说明行只保留第一次
+- 多余的空白和空行去掉
+
+token数优先用 tiktoken（cl100k_base，需要能加载编码文件），否则用本地估算（英文按词片、中文按字）。
+
+用法:
+    footprint = analyze(messages)          # messages: OpenAI格式dict列表或LangChain消息
+    print(footprint.report())
+    result = compact(messages)
+    print(result.report())
+
+    python prompt_footprint.py             # 分析示例1/2/3的ReAct prompt和few-shot方式2/方式3
+    python prompt_footprint.py --steps 4   # 按每次Agent调用4步计算重复发送的token
+"""
+
+import argparse
+import ast
+import contextlib
+import functools
+import io
+import re
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+HERE = Path(__file__).resolve().parent
+FEWSHOT_EXAMPLE = HERE.parents[1] / "learn-AI-app-dev-from-scratch" / "langchain_v1_fewshot_example.py"
+
+# OpenAI聊天格式中每条消息的固定开销（角色标记和分隔符），以及回复前缀
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMING = 3
+
+_ROLE_NAMES = {"human": "user", "ai": "assistant", "system": "system", "user": "user", "assistant": "assistant"}
+_TOKEN_RE = re.compile(r"[一-鿿　-〿＀-￯]|[A-Za-z]+|\d{1,3}|\s+|[^\w\s]", re.UNICODE)
+_EXAMPLE_RE = re.compile(r"^\s*Input:\s*(?P<input>.*?)\s*\n\s*Output:\s*(?P<output>.*?)\s*$", re.DOTALL)
+_TOOLS_HEADER = "You have access to the following tools:"
+_REACT_RE = re.compile(
+    r"Use the following format:\s*\n\s*\nQuestion:.*?\nAction: the action to take, should be one of \[(?P<names>[^\]]*)\]"
+    r".*?Final Answer: the final answer to the original input question",
+    re.DOTALL,
+)
+COMPACT_TOOLS_HEADER = "Tools:"
+COMPACT_REACT = (
+    "Use this format:\n"
+    "Question: the input question\n"
+    "Thought: your reasoning\n"
+    "Action: one of [{names}]\n"
+    "Action Input: the action input\n"
+    "Observation: the action result\n"
+    "... (repeat Thought/Action/Action Input/Observation as needed)\n"
+    "Thought: I now know the final answer\n"
+    "Final Answer: the final answer"
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding() -> Any:
+    """tiktoken的编码器；未安装或无法加载编码文件（如离线）时返回None"""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """文本的token数（tiktoken，或本地估算）"""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    total = 0
+    for piece in _TOKEN_RE.findall(text):
+        if piece.isspace():
+            total += piece.count("\n") > 1  # 单个空格并入下一个词，空行单独算一个
+        elif piece.isalpha() and piece.isascii():
+            total += (len(piece) + 5) // 6  # 常见英文单词是一个token，长词按约6个字符一个token
+        else:
+            total += 1
+    return max(total, 1) if text else 0
+
+
+def tokenizer_name() -> str:
+    return "tiktoken cl100k_base" if _encoding() is not None else "local estimate"
+
+
+def to_messages(prompt: Any) -> list[dict[str, str]]:
+    """把 OpenAI格式的dict列表、LangChain消息列表、ChatPromptValue 统一为 [{"role", "content"}]"""
+    if hasattr(prompt, "to_messages"):
+        prompt = prompt.to_messages()
+    if isinstance(prompt, str):
+        return messages_from_buffer_string(prompt)
+    messages = []
+    for message in prompt:
+        if isinstance(message, dict):
+            role, content = message.get("role", "user"), message.get("content") or ""
+        else:
+            role, content = getattr(message, "type", "user"), getattr(message, "content", "")
+        messages.append({"role": _ROLE_NAMES.get(role, role), "content": str(content)})
+    return messages
+
+
+def messages_from_buffer_string(text: str) -> list[dict[str, str]]:
+    """解析 ChatPromptTemplate.format() 的输出（"System: ...\\nHuman: ..."）"""
+    messages: list[dict[str, str]] = []
+    for line in text.split("\n"):
+        match = re.match(r"^(System|Human|AI): ?(.*)$", line)
+        if match:
+            messages.append({"role": _ROLE_NAMES[match.group(1).lower()], "content": match.group(2)})
+        elif messages:
+            messages[-1]["content"] += "\n" + line
+        else:
+            messages.append({"role": "user", "content": line})
+    return messages
+
+
+@dataclass
+class Segment:
+    """消息中的一段"""
+    message: int  # 所在消息的下标（-1 表示整体开销）
+    role: str
+    label: str
+    text: str
+    tokens: int
+
+
+@dataclass
+class Footprint:
+    """一个prompt的token占用"""
+    segments: list[Segment]
+
+    @property
+    def total(self) -> int:
+        return sum(segment.tokens for segment in self.segments)
+
+    def by_label(self) -> dict[str, int]:
+        totals: dict[str, int] = {}
+        for segment in self.segments:
+            totals[segment.label] = totals.get(segment.label, 0) + segment.tokens
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def report(self, detail: bool = False) -> str:
+        lines = [f"   {'segment':<20} {'tokens':>7} {'share':>6}"]
+        for label, tokens in self.by_label().items():
+            lines.append(f"   {label:<20} {tokens:>7} {tokens / self.total:>6.0%}")
+        lines.append(f"   {'total':<20} {self.total:>7}")
+        if detail:
+            for segment in self.segments:
+                preview = segment.text.replace("\n", "⏎")[:60]
+                lines.append(f"     [{segment.message:>2}] {segment.role:<9} {segment.label:<18} {segment.tokens:>5}  {preview}")
+        return "\n".join(lines)
+
+
+def _label_paragraphs(role: str, content: str) -> list[tuple[str, str]]:
+    """把一条消息按空行切成段并标注类型；工具列表和ReAct格式说明包含空行，按标题整体识别"""
+    if role != "system":
+        if _EXAMPLE_RE.match(content) or re.match(r"^\s*(Input|Output):", content):
+            return [("few-shot example", content)]
+        return [("user input" if role == "user" else "assistant", content)]
+
+    labeled: list[tuple[str, str]] = []
+    pending: Optional[str] = None  # 标题之后的下一段属于同一类
+    for paragraph in re.split(r"\n\s*\n", content):
+        if not paragraph.strip():
+            continue
+        if pending is not None:
+            labeled.append((pending, paragraph))
+            pending = None
+            continue
+        if paragraph.strip() == _TOOLS_HEADER:
+            labeled.append(("tools", paragraph))
+            pending = "tools"
+        elif paragraph.lstrip().startswith(COMPACT_TOOLS_HEADER + "\n"):
+            labeled.append(("tools", paragraph))
+        elif paragraph.strip().startswith(("Use the following format", "Use this format")):
+            labeled.append(("react format", paragraph))
+            pending = "react format" if paragraph.strip().endswith(":") else None
+        elif _EXAMPLE_RE.match(paragraph):
+            labeled.append(("few-shot example", paragraph))
+        else:
+            labeled.append(("instructions", paragraph))
+    return labeled
+
+
+def analyze(prompt: Any) -> Footprint:
+    """统计prompt每一段的token数"""
+    messages = to_messages(prompt)
+    segments = []
+    for index, message in enumerate(messages):
+        segments.append(Segment(index, message["role"], "message overhead", "", MESSAGE_OVERHEAD))
+        for label, text in _label_paragraphs(message["role"], message["content"]):
+            segments.append(Segment(index, message["role"], label, text, count_tokens(text)))
+    segments.append(Segment(-1, "", "message overhead", "", REPLY_PRIMING))
+    return Footprint(segments)
+
+
+@dataclass
+class CompactionResult:
+    """压缩结果"""
+    messages: list[dict[str, str]]
+    before: Footprint
+    after: Footprint
+    changes: list[str] = field(default_factory=list)
+
+    @property
+    def saved(self) -> int:
+        return self.before.total - self.after.total
+
+    def report(self, steps: int = 1) -> str:
+        ratio = self.saved / self.before.total if self.before.total else 0.0
+        lines = [f"   {self.before.total} → {self.after.total} tokens（节省 {self.saved}，{ratio:.0%}）"]
+        if steps > 1:
+            lines.append(f"   每次Agent调用 {steps} 步共重复发送 {self.before.total * steps} → "
+                         f"{self.after.total * steps} tokens（节省 {self.saved * steps}）")
+        lines += [f"   - {change}" for change in self.changes]
+        return "\n".join(lines)
+
+
+def _normalize_line(line: str) -> str:
+    line = re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line)
+    return re.sub(r"[\W_]+", " ", line).strip().lower()
+
+
+def _fold_examples(messages: list[dict[str, str]], changes: list[str]) -> list[dict[str, str]]:
+    """system消息之后的 (user "Input: x", assistant "Output: y") 消息对折叠进system消息"""
+    if not messages or messages[0]["role"] != "system":
+        return messages
+    examples, index = [], 1
+    while index + 1 < len(messages) - 1:
+        user, assistant = messages[index], messages[index + 1]
+        if user["role"] != "user" or assistant["role"] != "assistant":
+            break
+        if not (user["content"].lstrip().startswith("Input:") and assistant["content"].lstrip().startswith("Output:")):
+            break
+        examples.append(f"{user['content'].strip()}\n{assistant['content'].strip()}")
+        index += 2
+    if not examples:
+        return messages
+    changes.append(f"{len(examples)} 对few-shot消息折叠进system消息（省掉 {len(examples) * 2} 条消息的固定开销）")
+    system = {"role": "system", "content": messages[0]["content"].rstrip() + "\n\n" + "\n\n".join(examples)}
+    return [system] + messages[index:]
+
+
+def _merge_adjacent(messages: list[dict[str, str]], changes: list[str]) -> list[dict[str, str]]:
+    merged: list[dict[str, str]] = []
+    for message in messages:
+        if merged and merged[-1]["role"] == message["role"]:
+            merged[-1] = {"role": message["role"], "content": merged[-1]["content"] + "\n\n" + message["content"]}
+            changes.append(f"合并相邻的 {message['role']} 消息")
+        else:
+            merged.append(dict(message))
+    return merged
+
+
+def _terse_tools(content: str, sentences: int, changes: list[str]) -> str:
+    """工具列表中每个工具的描述只保留前几句"""
+    header = content.find(_TOOLS_HEADER)
+    if header < 0:
+        return content
+    start = header + len(_TOOLS_HEADER)
+    # 标题后可能有空行；工具列表到下一个空行为止，没有空行时到文本末尾
+    body = start + len(content[start:]) - len(content[start:].lstrip("\n"))
+    end = content.find("\n\n", body)
+    end = len(content) if end < 0 else end
+    lines = []
+    for line in content[start:end].split("\n"):
+        name, sep, description = line.partition(": ")
+        if sep and description:
+            kept = re.split(r"(?<=[.!?])\s+", description.strip())
+            if len(kept) > sentences:
+                changes.append(f"工具 {name.strip()} 的描述只保留前 {sentences} 句")
+                description = " ".join(kept[:sentences])
+            line = f"{name}: {description}"
+        lines.append(line)
+    return content[:start] + "\n".join(lines) + content[end:]
+
+
+def compact_text(content: str, tool_sentences: Optional[int] = 1, changes: Optional[list[str]] = None) -> str:
+    """
+    压缩一段system文本（也可以直接用于含 {tools}/{tool_names} 变量的模板字符串）
+
+    Args:
+        content: 原文本
+        tool_sentences: 每个工具描述保留的句数，None表示不截断
+        changes: 传入列表时记录做了哪些改动
+
+    压缩后反而更长时（某一步的替换写法比原文长）返回原文本，并在 changes 中说明。
+    """
+    applied: list[str] = []
+    original = content
+    match = _REACT_RE.search(content)
+    if match:
+        content = content[:match.start()] + COMPACT_REACT.format(names=match.group("names")) + content[match.end():]
+        applied.append("ReAct格式说明换成等价的短写法")
+    if tool_sentences is not None:
+        content = _terse_tools(content, tool_sentences, applied)
+    if _TOOLS_HEADER + "\n" in content:
+        content = re.sub(re.escape(_TOOLS_HEADER) + r"\n\n?", COMPACT_TOOLS_HEADER + "\n", content, count=1)
+        applied.append(f"工具列表标题缩短为 {COMPACT_TOOLS_HEADER!r}")
+
+    lines, seen, dropped = [], set(), 0
+    for line in content.split("\n"):
+        line = line.rstrip()
+        key = _normalize_line(line)
+        if len(key) >= 20 and key in seen:
+            dropped += 1
+            continue
+        seen.add(key)
+        lines.append(line)
+    if dropped:
+        applied.append(f"删除 {dropped} 行重复的说明")
+    compacted = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+    if len(compacted) > len(original):
+        # 原文本身已经很短（如自定义的短ReAct说明），换成"标准短写法"反而变长
+        applied = [f"压缩后变长（{len(original)} → {len(compacted)} 字符），保留原文本"]
+        compacted = original
+    if changes is not None:
+        changes.extend(applied)
+    return compacted
+
+
+def compact(prompt: Any, tool_sentences: Optional[int] = 1) -> CompactionResult:
+    """生成压缩后的消息列表，并统计前后的token数"""
+    messages = to_messages(prompt)
+    changes: list[str] = []
+    compacted = _merge_adjacent(_fold_examples(messages, changes), changes)
+    for message in compacted:
+        if message["role"] == "system":
+            message["content"] = compact_text(message["content"], tool_sentences, changes)
+        else:
+            message["content"] = message["content"].strip()
+    return CompactionResult(compacted, analyze(messages), analyze(compacted), changes)
+
+
+# ---- 从示例源码中提取prompt（示例脚本在导入时就会调用API，所以静态解析而不是import）----
+def _eval_string(node: ast.AST, names: dict[str, str]) -> Optional[str]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Name):
+        return names.get(node.id)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left, right = _eval_string(node.left, names), _eval_string(node.right, names)
+        return left + right if left is not None and right is not None else None
+    return None
+
+
+def extract_react_prompt(path: Path, question: str = "What's a good pasta recipe?") -> list[dict[str, str]]:
+    """
+    从示例脚本中静态提取 ReAct Agent 第一步实际发送的消息
+
+    读取模块级的字符串常量、ChatPromptTemplate.from_messages 的消息元组和 Tool(name=, description=)，
+    按 create_react_agent 的方式填入 {tools}（"名称: 描述"）和 {tool_names}。
+    """
+    tree = ast.parse(Path(path).read_text(encoding="utf-8"))
+    names: dict[str, str] = {}
+    tools: list[tuple[str, str]] = []
+    templates: list[tuple[str, str]] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            value = _eval_string(node.value, names)
+            if value is not None:
+                names[node.targets[0].id] = value
+        if not isinstance(node, ast.Call):
+            continue
+        func = node.func.attr if isinstance(node.func, ast.Attribute) else getattr(node.func, "id", "")
+        if func == "Tool":
+            keywords = {kw.arg: _eval_string(kw.value, names) for kw in node.keywords}
+            if keywords.get("name"):
+                tools.append((keywords["name"] or "", keywords.get("description") or ""))
+        elif func == "from_messages" and node.args and isinstance(node.args[0], ast.List) and not templates:
+            for item in node.args[0].elts:
+                if isinstance(item, ast.Tuple) and len(item.elts) == 2:
+                    role = _eval_string(item.elts[0], names)
+                    text = _eval_string(item.elts[1], names)
+                    if role is not None and text is not None:
+                        templates.append((role, text))
+
+    values = {
+        "tools": "\n".join(f"{name}: {description}" for name, description in tools),
+        "tool_names": ", ".join(name for name, _ in tools),
+        "input": question,
+        "agent_scratchpad": "",  # 第一步还没有中间步骤
+    }
+    return [{"role": _ROLE_NAMES.get(role, role), "content": re.sub(
+        r"\{(\w+)\}", lambda m: values.get(m.group(1), m.group(0)), text)} for role, text in templates]
+
+
+def fewshot_prompts() -> dict[str, list[dict[str, str]]]:
+    """运行 few-shot 示例的方式2和方式3，取得它们生成的prompt"""
+    sys.path.insert(0, str(FEWSHOT_EXAMPLE.parent))
+    try:
+        import langchain_v1_fewshot_example as fewshot
+    finally:
+        sys.path.pop(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {
+            "few-shot 方式2 (ChatPromptTemplate)": to_messages(fewshot.method2_chat_prompt_template()),
+            "few-shot 方式3 (FewShotChatMessagePromptTemplate)": to_messages(fewshot.method3_fewshot_template()),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt的token占用分析与压缩")
+    parser.add_argument("--steps", type=int, default=3, help="一次Agent调用的步数（prompt重复发送的次数）")
+    parser.add_argument("--detail", action="store_true", help="显示每一段")
+    parser.add_argument("--show", action="store_true", help="打印压缩后的消息")
+    parser.add_argument("--tool-sentences", type=int, default=1, help="工具描述保留的句数")
+    args = parser.parse_args()
+
+    prompts = {path.stem: extract_react_prompt(path) for path in sorted(HERE.glob("example[123]_*.py"))}
+    try:
+        prompts.update(fewshot_prompts())
+    except ImportError as e:
+        print(f"⚠️  跳过 few-shot 示例: {e}")
+
+    print(f"🔢 token计数: {tokenizer_name()}")
+    for name, messages in prompts.items():
+        steps = args.steps if "few-shot" not in name else 1
+        result = compact(messages, args.tool_sentences)
+        print(f"\n📏 {name}（{len(messages)} 条消息）")
+        print(result.before.report(args.detail))
+        print(f"🗜️  压缩后（{len(result.messages)} 条消息）")
+        print(result.report(steps))
+        if args.show:
+            for message in result.messages:
+                print(f"   --- {message['role']} ---\n" + "\n".join(f"   {line}" for line in message["content"].split("\n")))
+
+
+if __name__ == "__main__":
+    main()
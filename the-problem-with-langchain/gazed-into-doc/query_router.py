@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+本地查询路由 - 问候和无关话题不调用LLM
+
+example5 的 system prompt 让Agent自己去"把话题拉回烹饪"、"用双关语打招呼"，
+于是 "Tell me about the weather" 和 "Hi there!" 都要花一次完整的Agent调用（有时两次）。
+
+QueryRouter 在Agent之前对每轮输入分类：
+- greeting：问候 → 固定的人设回复
+- off_topic：与食物无关 → 固定的人设回复，把话题拉回烹饪
+- direct_search：明确的"找某类食谱" → 直接调用 search_recipes
+- needs_agent：其他情况 → 交给Agent
+
+分类先走关键词规则，规则无法判断时用一个小的线性模型（哈希特征 + softmax回归，
+在标注过的对话上离线训练，权重保存为JSON）；置信度不够时一律交给Agent。
+固定回复是拒绝式的，所以偏向保守：问候规则只匹配纯问候（"Hi! Any vegan options?" 不算），
+无关话题的关键词规则还要模型同意，提到食物或食材的输入不会被当成问候或无关话题。
+stats 记录有多少轮完全没有调用LLM。
+
+用法:
+    router = QueryRouter.load_or_train()
+    route = router.classify("Tell me about the weather")   # Route(label="off_topic", ...)
+
+    python query_router.py --train --data labeled_turns.jsonl   # 重新训练并保存权重
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from semantic_search import HashingEncoder
+
+LABELS = ["greeting", "off_topic", "direct_search", "needs_agent"]
+# 训练出的权重放在用户缓存目录，不写进源码目录；没有权重文件时用种子数据现场训练
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "the-problem-with-langchain"
+DEFAULT_WEIGHTS_PATH = CACHE_DIR / "query_router_weights.json"
+
+# 人设回复（与 example5 的 system prompt 保持同样的语气）
+GREETING_RESPONSE = (
+    "Well, butter my biscuits, hello there! 🎪👨‍🍳 I'm your whimsical kitchen companion, "
+    "ready to whisk up something wonderful. Looking for a dinner idea or a sweet little dessert?"
+)
+OFF_TOPIC_RESPONSE = (
+    "Ooh, that's a bit outside my kitchen, friend! 🍳 I only know how to stir the pot when it comes to food. "
+    "Shall I find you a fun dinner or a dreamy dessert instead?"
+)
+
+# 纯问候：问候词之后只能跟称呼和寒暄（"how are you?"），不能再有别的问题或请求
+_GREETING_RE = re.compile(
+    r"^\s*(hi|hello|hey|hiya|howdy|yo|greetings|good (morning|afternoon|evening))"
+    r"([\s,!.]+(there|chef|again|friend|everyone|all|nice to meet you|how are you( doing)?( today)?))*"
+    r"[\s,!.?]*$",
+    re.IGNORECASE,
+)
+_FOOD_RE = re.compile(
+    r"\b(recipes?|cook|cooking|bake|baking|dinner|dessert|lunch|breakfast|meals?|food|eat|dish|dishes|"
+    r"snacks?|sweet|pies?|cakes?|chicken|curry|casserole|soups?|salads?|pasta|ingredients?|kitchen|"
+    r"stock|broth|sauce|vegetables?|vegan|vegetarian|gluten|dairy|eggs?|butter|flour|sugar|milk|cream|cheese|"
+    r"rice|beef|pork|fish|tofu|fruit|strawberry|strawberries|spices?|oven|fry|roast|grill|substitute)\b",
+    re.IGNORECASE,
+)
+# 只用于提名：匹配之后还要模型也判为 off_topic（见 _classify）
+_OFF_TOPIC_RE = re.compile(
+    r"\b(weather|news|stock market|stocks|football|soccer|sports?|movie|movies|politics|president|election|"
+    r"taxes|car|cars|computer|computers|poem|capital)\b",
+    re.IGNORECASE,
+)
+_SEARCH_RE = re.compile(
+    r"^\s*(please\s+)?(show|find|give|list|search|get)\s+(me\s+)?(some\s+|a\s+few\s+|all\s+)?"
+    r"(?P<category>dessert|dinner)\s+recipes?\s*[.!?]*\s*$",
+    re.IGNORECASE,
+)
+_CATEGORY_RE = re.compile(r"\b(dessert|dinner)s?\b", re.IGNORECASE)
+
+# 种子训练数据：从示例对话中整理出来的标注样本（可以用 --data 追加导出的对话）
+SEED_EXAMPLES = [
+    ("Hi there!", "greeting"), ("Hello!", "greeting"), ("hey", "greeting"), ("Good morning chef", "greeting"),
+    ("Howdy!", "greeting"), ("hi, how are you?", "greeting"), ("Hello again", "greeting"),
+    ("Tell me about the weather", "off_topic"), ("What's the weather like today?", "off_topic"),
+    ("Who won the football game?", "off_topic"), ("What is the capital of France?", "off_topic"),
+    ("Can you help me with my taxes?", "off_topic"), ("Tell me a joke about computers", "off_topic"),
+    ("What's the latest news?", "off_topic"), ("How do I fix my car?", "off_topic"),
+    ("Write me a poem about the ocean", "off_topic"), ("What time is it in Tokyo?", "off_topic"),
+    ("Show me some dessert recipes", "direct_search"), ("Find dinner recipes", "direct_search"),
+    ("dessert recipes please", "direct_search"), ("List dinner recipes", "direct_search"),
+    ("Give me a dessert recipe", "direct_search"), ("Search for dessert recipes", "direct_search"),
+    ("What's a fun and easy dinner?", "needs_agent"), ("Which dessert is the easiest to make?", "needs_agent"),
+    ("Can I make the strawberry pie without an oven?", "needs_agent"),
+    ("What can I bake with leftover strawberries?", "needs_agent"),
+    ("How long does the chicken casserole take?", "needs_agent"),
+    ("Compare the two strawberry pies for me", "needs_agent"),
+    ("I have chicken and rice, what can I cook?", "needs_agent"),
+    ("What should I serve at a dinner party for six?", "needs_agent"),
+]
+
+# 评估数据：不参与训练（与 SEED_EXAMPLES 没有重复），命令行演示在这些输入上报告准确率
+EVAL_EXAMPLES = [
+    ("Good evening!", "greeting"), ("hello chef, nice to meet you", "greeting"),
+    ("Who is the president?", "off_topic"), ("Recommend a good movie", "off_topic"),
+    ("How do I change a flat tire?", "off_topic"), ("What's the score of the game?", "off_topic"),
+    ("Show me dinner recipes", "direct_search"), ("find some dessert recipes please", "direct_search"),
+    ("Something sweet for after dinner", "needs_agent"), ("Which dinner takes the least time?", "needs_agent"),
+    ("Can I freeze the pudding cake?", "needs_agent"),
+    ("Can I use vegetable stock instead?", "needs_agent"), ("Hi! Any vegan options?", "needs_agent"),
+]
+
+
+@dataclass
+class Route:
+    """一轮输入的路由结果"""
+    label: str
+    confidence: float
+    source: str  # "rule"、"model" 或 "rule+model"
+    category: Optional[str] = None  # direct_search 时的食谱分类
+
+
+@dataclass
+class RouterStats:
+    """路由统计"""
+    counts: dict[str, int] = field(default_factory=lambda: {label: 0 for label in LABELS})
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def served_locally(self) -> float:
+        """完全没有调用LLM的轮次比例"""
+        return (self.total - self.counts["needs_agent"]) / self.total if self.total else 0.0
+
+    def report(self) -> str:
+        parts = ", ".join(f"{label} {count}" for label, count in self.counts.items())
+        return f"{self.total} turns ({parts}); {self.served_locally:.0%} served without an LLM call"
+
+
+class QueryRouter:
+    """关键词规则 + softmax回归的本地分类器"""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, encoder: Optional[HashingEncoder] = None,
+                 min_confidence: float = 0.6):
+        """
+        Args:
+            weights: (特征维度, 类别数) 的权重矩阵
+            bias: (类别数,) 的偏置
+            encoder: 特征编码器，维度必须与权重一致
+            min_confidence: 模型置信度低于此值时交给Agent
+        """
+        self.encoder = encoder or HashingEncoder(dim=weights.shape[0])
+        self.weights = weights
+        self.bias = bias
+        self.min_confidence = min_confidence
+        self.stats = RouterStats()
+
+    @classmethod
+    def train(cls, examples: list[tuple[str, str]], dim: int = 256, epochs: int = 300,
+              learning_rate: float = 0.5, l2: float = 1e-3, seed: int = 0) -> "QueryRouter":
+        """用全批量梯度下降训练softmax回归（样本很少，毫秒级完成）"""
+        encoder = HashingEncoder(dim=dim)
+        features = encoder.encode_batch([text for text, _ in examples])
+        targets = np.zeros((len(examples), len(LABELS)), dtype=np.float32)
+        for i, (_, label) in enumerate(examples):
+            targets[i, LABELS.index(label)] = 1.0
+
+        rng = np.random.default_rng(seed)
+        weights = rng.normal(0, 0.01, (dim, len(LABELS))).astype(np.float32)
+        bias = np.zeros(len(LABELS), dtype=np.float32)
+        for _ in range(epochs):
+            probs = _softmax(features @ weights + bias)
+            grad = (probs - targets) / len(examples)
+            weights -= learning_rate * (features.T @ grad + l2 * weights)
+            bias -= learning_rate * grad.sum(axis=0)
+        return cls(weights, bias, encoder)
+
+    def save(self, path: Path = DEFAULT_WEIGHTS_PATH):
+        """保存权重为JSON"""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(json.dumps({
+            "labels": LABELS, "dim": self.encoder.dim,
+            "weights": self.weights.tolist(), "bias": self.bias.tolist(),
+        }), encoding="utf-8")
+
+    @classmethod
+    def load_or_train(cls, path: Path = DEFAULT_WEIGHTS_PATH) -> "QueryRouter":
+        """有权重文件时加载，否则用种子数据现场训练"""
+        path = Path(path)
+        if not path.exists():
+            return cls.train(SEED_EXAMPLES)
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data["labels"] != LABELS:
+            raise ValueError(f"weights in {path} were trained for labels {data['labels']}, expected {LABELS}")
+        return cls(np.asarray(data["weights"], dtype=np.float32), np.asarray(data["bias"], dtype=np.float32),
+                   HashingEncoder(dim=data["dim"]))
+
+    def predict(self, text: str) -> tuple[str, float]:
+        """只用线性模型预测 (类别, 概率)"""
+        probs = _softmax(self.encoder.encode(text) @ self.weights + self.bias)
+        best = int(np.argmax(probs))
+        return LABELS[best], float(probs[best])
+
+    def classify(self, text: str) -> Route:
+        """先规则、后模型；结果计入 stats"""
+        route = self._classify(text)
+        self.stats.counts[route.label] += 1
+        return route
+
+    def _classify(self, text: str) -> Route:
+        mentions_food = _FOOD_RE.search(text) is not None
+        if _GREETING_RE.match(text) and not mentions_food:
+            return Route("greeting", 1.0, "rule")
+        search = _SEARCH_RE.match(text)
+        if search:
+            return Route("direct_search", 1.0, "rule", category=search.group("category").lower())
+
+        label, confidence = self.predict(text)
+        if _OFF_TOPIC_RE.search(text) and not mentions_food:
+            # 关键词可能有别的意思（"stock"、"car"），拒绝之前要模型也这么认为
+            if label == "off_topic":
+                return Route("off_topic", confidence, "rule+model")
+            return Route("needs_agent", confidence, "rule+model")
+        if confidence < self.min_confidence:
+            return Route("needs_agent", confidence, "model")
+        if label in ("greeting", "off_topic") and mentions_food:
+            # 提到了食物就不用固定回复，宁可多花一次调用也不要错误地拒绝
+            return Route("needs_agent", confidence, "model")
+        if label == "greeting" and "?" in text:
+            # 规则没认出的问候里带着问题（"Hey, what should I make?"），要交给Agent回答
+            return Route("needs_agent", confidence, "model")
+        if label == "direct_search":
+            category = _CATEGORY_RE.search(text)
+            if category is None:
+                return Route("needs_agent", confidence, "model")
+            return Route(label, confidence, "model", category=category.group(1).lower())
+        return Route(label, confidence, "model")
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+def _load_examples(path: Path) -> list[tuple[str, str]]:
+    """读取 JSONL 标注数据，每行 {"text": ..., "label": ...}"""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                if row["label"] not in LABELS:
+                    raise ValueError(f"unknown label {row['label']!r} in {path}")
+                examples.append((row["text"], row["label"]))
+    return examples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地查询路由")
+    parser.add_argument("query", nargs="*", help="要分类的输入")
+    parser.add_argument("--train", action="store_true", help="训练并保存权重")
+    parser.add_argument("--data", type=Path, action="append", default=[], help="追加的JSONL标注数据")
+    parser.add_argument("--weights", type=Path, default=DEFAULT_WEIGHTS_PATH, help="权重文件路径")
+    args = parser.parse_args()
+
+    if args.train:
+        examples = SEED_EXAMPLES + [example for path in args.data for example in _load_examples(path)]
+        # 评估数据永远不进入训练集
+        eval_texts = {text.lower() for text, _ in EVAL_EXAMPLES}
+        examples = [(text, label) for text, label in examples if text.lower() not in eval_texts]
+        # 留出一部分样本估计准确率
+        shuffled = examples[:]
+        random.Random(0).shuffle(shuffled)
+        held_out = shuffled[: max(1, len(shuffled) // 5)]
+        trial = QueryRouter.train(shuffled[len(held_out):])
+        accuracy = sum(trial.predict(text)[0] == label for text, label in held_out) / len(held_out)
+        router = QueryRouter.train(examples)
+        router.save(args.weights)
+        print(f"🧠 {len(examples)} 条样本，留出集准确率 {accuracy:.0%}，权重已保存到 {args.weights}")
+    else:
+        router = QueryRouter.load_or_train(args.weights)
+
+    if args.query:
+        query = " ".join(args.query)
+        route = router.classify(query)
+        print(f"  {route.label:<14} {route.confidence:.2f} ({route.source})  {query}")
+    else:
+        # 在没有参与训练的评估数据上演示
+        correct = 0
+        for query, expected in EVAL_EXAMPLES:
+            route = router.classify(query)
+            correct += route.label == expected
+            mark = "✅" if route.label == expected else f"❌ expected {expected}"
+            print(f"  {route.label:<14} {route.confidence:.2f} ({route.source})  {query}  {mark}")
+        print(f"🎯 评估集准确率 {correct / len(EVAL_EXAMPLES):.0%}（{correct}/{len(EVAL_EXAMPLES)}，均未参与训练）")
+    print(f"📊 {router.stats.report()}")
+
+
+if __name__ == "__main__":
+    main()
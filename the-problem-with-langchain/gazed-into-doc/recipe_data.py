@@ -0,0 +1,50 @@
+"""
+模拟的recipe数据库 - 示例5和 semantic_search.py 的命令行共用
+
+只有数据和纯函数，导入时不创建LLM、不需要API密钥。
+"""
+
+import re
+from typing import Any, Optional
+
+RECIPE_DB: dict[str, list[dict[str, Any]]] = {
+    "dessert": [
+        {"recipe_id": "recipe|167188", "name": "Creamy Strawberry Pie", "category": "dessert", "difficulty": "easy"},
+        {"recipe_id": "recipe|1488243", "name": "Summer Strawberry Pie", "category": "dessert", "difficulty": "medium"},
+        {"recipe_id": "recipe|299514", "name": "Pudding Cake", "category": "dessert", "difficulty": "easy"},
+    ],
+    "dinner": [
+        {"recipe_id": "recipe|1774221", "name": "Crab Dip Your Guests will Like", "category": "dinner", "difficulty": "easy"},
+        {"recipe_id": "recipe|836179", "name": "Easy Chicken Casserole", "category": "dinner", "difficulty": "easy"},
+        {"recipe_id": "recipe|1980633", "name": "Easy Microwave Curry Doria", "category": "dinner", "difficulty": "easy"},
+    ]
+}
+
+ALL_RECIPES = [recipe for recipes in RECIPE_DB.values() for recipe in recipes]
+
+# "show me some dessert recipes please" 里除了分类名之外的词
+_FILLER_WORDS = frozenset(
+    "a all any find for get give idea ideas list me please recipe recipes search show some the".split()
+)
+
+
+def category_request(query: str) -> Optional[list[str]]:
+    """
+    查询只由分类名组成时（"dessert"、"dinner recipes"、"Desserts"），返回这些分类；否则返回None
+
+    "meal" 泛指所有分类。"something sweet for after dinner" 里的 "dinner" 只是修饰语，
+    不算分类请求，应该交给语义检索。
+    """
+    words = [word for word in re.findall(r"[a-z]+", query.lower()) if word not in _FILLER_WORDS]
+    if not words:
+        return None
+    categories = []
+    for word in words:
+        singular = word[:-1] if word.endswith("s") else word
+        if singular == "meal":
+            categories.extend(RECIPE_DB)
+        elif singular in RECIPE_DB:
+            categories.append(singular)
+        else:
+            return None
+    return list(dict.fromkeys(categories))
@@ -0,0 +1,343 @@
+"""
+截止时间与token预算 - 在Agent运行中逐层传递
+
+示例中的Agent只会在 max_iterations（示例5是3，示例2是5）时停下，没有时间或token的概念，
+一个慢步骤就能打破5秒的SLA。
+
+这里让每次Agent调用都带上一个 RunBudget（截止时间 + token预算）：
+- 每次LLM调用：剩余时间作为请求 timeout，剩余token作为 max_tokens；
+  流式调用时httpx的timeout只限制每次读取，所以由后台线程读取流、调用方按截止时间等待，
+  超时即放弃并关闭流（释放连接）
+- 每次工具调用：在剩余时间内完成，否则放弃等待（工具和流式读取各用一个线程池，慢的上游流不会占满工具的线程）
+- 剩余预算放不下下一步时，停止循环并返回已经拿到的部分结果，而不是报错
+
+用法:
+    llm = BudgetedChatOpenAI(model="deepseek-chat", ...)
+    tools = [Tool(name="SearchRecipes", func=budgeted_tool(search_recipes), ...)]
+    agent_executor = BudgetedAgentExecutor(agent=agent, tools=tools, ...)
+    result = agent_executor.invoke_with_budget({"input": "..."}, deadline_s=5, token_budget=3000)
+"""
+
+import contextvars
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction
+from langchain_openai import ChatOpenAI
+
+
+class BudgetExceeded(Exception):
+    """剩余的时间或token不足以完成下一步"""
+
+
+class RunBudget:
+    """一次Agent运行的截止时间和token预算"""
+
+    def __init__(
+        self,
+        deadline_s: Optional[float] = None,
+        token_budget: Optional[int] = None,
+        min_step_seconds: float = 0.5,
+        min_step_tokens: int = 64,
+    ):
+        """
+        Args:
+            deadline_s: 从现在开始的时间预算（秒），None表示不限
+            token_budget: 整次运行的token预算（prompt + completion），None表示不限
+            min_step_seconds: 剩余时间少于这个值时，不再开始新的一步
+            min_step_tokens: 剩余token少于这个值时，不再开始新的一步
+        """
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + deadline_s if deadline_s is not None else None
+        self.token_budget = token_budget
+        self.min_step_seconds = min_step_seconds
+        self.min_step_tokens = min_step_tokens
+        self.tokens_used = 0
+        self.exhausted_reason: Optional[str] = None
+        self.steps: list[tuple[AgentAction, str]] = []  # 指向AgentExecutor的中间步骤列表
+
+    def remaining_seconds(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def remaining_tokens(self) -> Optional[int]:
+        if self.token_budget is None:
+            return None
+        return self.token_budget - self.tokens_used
+
+    def charge(self, tokens: int):
+        """记录一次调用消耗的token"""
+        self.tokens_used += tokens
+
+    def check_step(self, what: str = "step"):
+        """剩余预算放不下下一步时抛出 BudgetExceeded"""
+        seconds = self.remaining_seconds()
+        if seconds is not None and seconds < self.min_step_seconds:
+            self.exhausted_reason = f"deadline reached before {what} ({seconds:.2f}s left)"
+            raise BudgetExceeded(self.exhausted_reason)
+        tokens = self.remaining_tokens()
+        if tokens is not None and tokens < self.min_step_tokens:
+            self.exhausted_reason = f"token budget reached before {what} ({tokens} tokens left)"
+            raise BudgetExceeded(self.exhausted_reason)
+
+    def llm_kwargs(self, prompt_tokens: int, max_tokens: Optional[int] = None) -> dict[str, Any]:
+        """根据剩余预算计算本次LLM调用的 timeout 和 max_tokens"""
+        kwargs: dict[str, Any] = {}
+        seconds = self.remaining_seconds()
+        if seconds is not None:
+            kwargs["timeout"] = max(seconds, 0.001)
+        tokens = self.remaining_tokens()
+        if tokens is not None:
+            completion_room = tokens - prompt_tokens
+            if completion_room < self.min_step_tokens:
+                self.exhausted_reason = f"prompt ({prompt_tokens} tokens) leaves no room within the token budget"
+                raise BudgetExceeded(self.exhausted_reason)
+            kwargs["max_tokens"] = min(completion_room, max_tokens) if max_tokens else completion_room
+        return kwargs
+
+
+# 工具调用在这个共享线程池中执行，调用方按截止时间等待结果；
+# 超时后线程本身无法强制终止，会在原调用结束后归还到池中
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="run-budget")
+# 流式读取单独用一个线程池，每个流占一个线程直到读完或被关闭；
+# 被放弃的流在当前这次读取返回（最迟到httpx的读超时，即调用开始时的剩余时间）后关闭
+_stream_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="run-budget-stream")
+_STREAM_END = object()
+
+
+class _StreamFailed:
+    """后台读取流时抛出的异常，交给调用方重新抛出"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_current_budget: contextvars.ContextVar[Optional[RunBudget]] = contextvars.ContextVar("run_budget", default=None)
+
+
+def current_budget() -> Optional[RunBudget]:
+    """当前上下文中生效的预算（没有时为None）"""
+    return _current_budget.get()
+
+
+@contextmanager
+def budget_scope(budget: RunBudget) -> Iterator[RunBudget]:
+    """在这个作用域内，所有LLM调用和工具调用都受该预算约束"""
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def _estimate_prompt_tokens(messages: list[Any]) -> int:
+    """粗略估算prompt的token数（约4个字符一个token）"""
+    return sum(len(str(getattr(msg, "content", msg))) for msg in messages) // 4 + 4 * len(messages)
+
+
+class BudgetedChatOpenAI(ChatOpenAI):
+    """每次调用都从当前预算中推导 timeout 和 max_tokens，并按实际用量扣减"""
+
+    # 重试会让单次调用的耗时超出截止时间，预算模式下默认不重试
+    max_retries: Optional[int] = 0
+
+    # 流式调用时也要拿到用量，才能按实际token扣减预算（AgentExecutor默认以流式调用LLM）
+    stream_usage: bool = True
+
+    def _budget_kwargs(self, messages, kwargs: dict[str, Any]) -> Optional[RunBudget]:
+        """把当前预算转换为 timeout / max_tokens 写入请求参数"""
+        budget = current_budget()
+        if budget is not None:
+            budget.check_step("LLM call")
+            kwargs.update(budget.llm_kwargs(_estimate_prompt_tokens(messages), self.max_tokens))
+        return budget
+
+    @staticmethod
+    def _deadline_error(budget: RunBudget, error: Exception) -> Exception:
+        """调用在截止时间被取消时，把超时异常转换为 BudgetExceeded"""
+        remaining = budget.remaining_seconds()
+        if remaining is not None and remaining <= 0:
+            budget.exhausted_reason = f"LLM call cancelled at deadline ({type(error).__name__})"
+            return BudgetExceeded(budget.exhausted_reason)
+        return error
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        budget = self._budget_kwargs(messages, kwargs)
+        if budget is None:
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        try:
+            result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        except Exception as e:
+            raise self._deadline_error(budget, e) from e
+
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        budget.charge(int(usage.get("total_tokens") or 0))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        budget = self._budget_kwargs(messages, kwargs)
+        if budget is None:
+            yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return
+
+        try:
+            stream = super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            for chunk in _iterate_before_deadline(stream, budget):
+                usage = getattr(chunk.message, "usage_metadata", None)
+                if usage:
+                    budget.charge(int(usage.get("total_tokens") or 0))
+                yield chunk
+        except BudgetExceeded:
+            raise
+        except Exception as e:
+            raise self._deadline_error(budget, e) from e
+
+
+def _pump(iterator: Iterator[Any], items: "queue.Queue[Any]", stop: threading.Event):
+    """在后台线程中读取整个流；调用方放弃（stop）或读完后关闭流，释放底层的HTTP连接"""
+    try:
+        while not stop.is_set():
+            item = next(iterator, _STREAM_END)
+            items.put(item)
+            if item is _STREAM_END:
+                return
+    except BaseException as e:
+        items.put(_StreamFailed(e))
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+
+def _iterate_before_deadline(iterable: Any, budget: RunBudget) -> Iterator[Any]:
+    """
+    逐个取出元素，每次最多等到截止时间；超时抛出 BudgetExceeded
+
+    httpx的timeout是每次读取的超时，服务端不断地慢慢吐token时整个流可以远远超过截止时间。
+    这里由后台线程读取流，调用方按剩余时间等待；放弃时通知后台线程关闭流。
+    """
+    items: "queue.Queue[Any]" = queue.Queue()
+    stop = threading.Event()
+    _stream_executor.submit(contextvars.copy_context().run, _pump, iter(iterable), items, stop)
+    try:
+        while True:
+            remaining = budget.remaining_seconds()
+            try:
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                item = items.get(timeout=remaining)
+            except queue.Empty as e:
+                budget.exhausted_reason = "LLM stream cancelled at deadline"
+                raise BudgetExceeded(budget.exhausted_reason) from e
+            if item is _STREAM_END:
+                return
+            if isinstance(item, _StreamFailed):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def budgeted_tool(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    让工具函数受当前预算约束：在剩余时间内完成，否则放弃等待并抛出 BudgetExceeded
+
+    没有预算时直接调用原函数。
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        budget = current_budget()
+        if budget is None or budget.remaining_seconds() is None:
+            return func(*args, **kwargs)
+
+        budget.check_step(f"tool {func.__name__}")
+        # 在共享线程池中执行，超时后不再等待（线程本身无法强制终止）
+        future = _executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+        try:
+            return future.result(timeout=budget.remaining_seconds())
+        except FutureTimeoutError as e:
+            future.cancel()
+            budget.exhausted_reason = f"tool {func.__name__} cancelled at deadline"
+            raise BudgetExceeded(budget.exhausted_reason) from e
+
+    return wrapper
+
+
+class BudgetedAgentExecutor(AgentExecutor):
+    """预算用尽时停止Agent循环，返回目前为止最好的部分结果"""
+
+    def invoke_with_budget(
+        self,
+        inputs: dict[str, Any],
+        deadline_s: Optional[float] = None,
+        token_budget: Optional[int] = None,
+        **kwargs: Any,
+    ) -> dict[str, Any]:
+        """
+        在截止时间和token预算内运行Agent
+
+        Args:
+            inputs: Agent输入，如 {"input": "..."}
+            deadline_s: 时间预算（秒）
+            token_budget: token预算
+            **kwargs: 透传给 invoke（如 config）
+
+        Returns:
+            Agent输出；预算用尽时额外包含 budget_exhausted=True 和原因
+        """
+        budget = RunBudget(deadline_s=deadline_s, token_budget=token_budget)
+        with budget_scope(budget):
+            result = self.invoke(inputs, **kwargs)
+        result["elapsed_s"] = time.monotonic() - budget.started_at
+        result["tokens_used"] = budget.tokens_used
+        return result
+
+    def _should_continue(self, iterations: int, time_elapsed: float) -> bool:
+        budget = current_budget()
+        if budget is not None:
+            budget.check_step("next agent step")
+        return super()._should_continue(iterations, time_elapsed)
+
+    def _take_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        budget = current_budget()
+        if budget is not None:
+            # 记住中间步骤列表，预算用尽时从中提取部分结果
+            budget.steps = intermediate_steps
+        return super()._take_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager)
+
+    def _call(self, inputs, run_manager=None):
+        try:
+            return super()._call(inputs, run_manager=run_manager)
+        except BudgetExceeded as e:
+            budget = current_budget()
+            steps = list(budget.steps) if budget is not None else []
+            output_key = (self._action_agent.return_values or ["output"])[0]
+            output: dict[str, Any] = {
+                output_key: self._partial_answer(steps),
+                "budget_exhausted": True,
+                "budget_reason": str(e),
+            }
+            if self.return_intermediate_steps:
+                output["intermediate_steps"] = steps
+            if run_manager:
+                run_manager.on_text(f"\n⏱️  Budget exhausted: {e}\n", verbose=self.verbose)
+            return output
+
+    @staticmethod
+    def _partial_answer(steps: list[tuple[AgentAction, str]]) -> str:
+        """用最后一个有效的工具观察结果作为部分答案"""
+        for action, observation in reversed(steps):
+            if action.tool != "_Exception" and str(observation).strip():
+                return (f"I reached my time/token budget before finishing, but here is what I found so far "
+                        f"(from {action.tool}):\n{observation}")
+        return "Sorry, I couldn't finish within the time/token budget. Please try again."
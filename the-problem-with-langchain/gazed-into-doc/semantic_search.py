@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+不依赖Embedding API的语义检索 - 哈希n-gram向量 + NumPy top-k
+
+example5 的关键词匹配无法把 "a sugary treat for the kids" 这类描述映射到 dessert，
+这类查询只能多花一轮LLM调用去追问；离线环境下又不能调用Embedding API。
+
+这里用哈希技巧（hashing trick）在本地构造向量：
+- 每条食谱的文本（名称、分类以及分类的描述词）拆成单词、相邻两词和字符n-gram，
+  用稳定的哈希（blake2b，跨进程一致）映射到固定维度，带符号累加后做L2归一化
+- 所有向量存成一个 float32 矩阵，可以保存为 .npy 并以 memmap 方式加载
+- 查询 = 一次矩阵-向量乘法（余弦相似度）+ argpartition 取 top-k；
+  批量查询用一次矩阵乘法处理多个查询
+- 区分分类的线索词（"sweet"、"after dinner"）加权，"something sweet for after dinner"
+  里的 sweet 压过单独的 dinner
+- 行数很大时（百万级）用 PartitionedIndex：球面k-means把矩阵按簇重排，
+  查询只扫描最近的 nprobe 个簇（近似top-k，基准测试同时报告召回率）
+
+用法:
+    index = SemanticIndex.build(recipes, text=recipe_text, encoder=recipe_encoder())
+    for score, recipe in index.search("a sugary treat for the kids", k=3):
+        print(score, recipe["name"])
+
+    python3 semantic_search.py --bench 1000000   # 在有簇结构的随机矩阵上测量查询延迟和召回率
+"""
+
+import argparse
+import functools
+import hashlib
+import json
+import re
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence
+
+import numpy as np
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# 检索时忽略的虚词：它们在哈希向量里只会带来冲突噪声，并稀释真正有区分度的词
+ENGLISH_STOPWORDS = frozenset(
+    "a an and any are for from i in is it me my of on or please some something that the this to with".split()
+)
+
+# 分类的描述词：哈希向量本身不懂同义词，把常见的说法写进分类文本里
+# （只写通用的同义词，不写演示用的查询，否则演示只是在匹配自己）
+CATEGORY_TERMS = {
+    "dessert": "dessert sweet sweets treat cake pie pudding baking sugar after dinner after meal",
+    "dinner": "dinner supper main course evening meal savory hearty family meal",
+}
+
+# 能决定分类的线索词及其权重（单词或相邻两词）。"after dinner" 里的 dinner 指的是时间，
+# 不加权时它和 "dinner" 分类的词一样重，会把甜点查询拉向晚餐
+CATEGORY_CUE_WEIGHTS = {
+    "sweet": 2.0, "sweets": 2.0, "sugary": 2.0, "after dinner": 2.0, "after meal": 2.0,
+    "savory": 2.0, "hearty": 2.0,
+}
+
+
+@functools.lru_cache(maxsize=1 << 20)
+def _feature_hash(feature: str) -> int:
+    """稳定的64位特征哈希（内置hash()每个进程不同；crc32是线性的，"crab"和"cake"会落到同一维）"""
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HashingEncoder:
+    """把文本编码为归一化的哈希n-gram向量"""
+
+    def __init__(
+        self,
+        dim: int = 256,
+        char_ngrams: tuple[int, int] = (3, 5),
+        word_weight: float = 1.0,
+        bigram_weight: float = 1.5,
+        char_weight: float = 0.3,
+        stopwords: frozenset[str] = frozenset(),
+        term_weights: Optional[dict[str, float]] = None,
+    ):
+        """
+        Args:
+            dim: 向量维度（矩阵每行占 dim*4 字节）
+            char_ngrams: 字符n-gram的长度范围（包含两端），容忍拼写和词形变化
+            word_weight: 单词特征的权重
+            bigram_weight: 相邻两词特征的权重（"after dinner" 比单独的 "dinner" 更有区分度）
+            char_weight: 字符n-gram特征的权重
+            stopwords: 不产生任何特征的词（如 ENGLISH_STOPWORDS）
+            term_weights: 单词或相邻两词（"after dinner"）的额外权重倍数（如 CATEGORY_CUE_WEIGHTS）
+        """
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+        self.word_weight = word_weight
+        self.bigram_weight = bigram_weight
+        self.char_weight = char_weight
+        self.stopwords = stopwords
+        self.term_weights = term_weights or {}
+
+    def features(self, text: str) -> list[tuple[str, float]]:
+        """文本的 (特征, 权重) 列表"""
+        words = [word for word in _WORD_RE.findall(text.lower()) if word not in self.stopwords]
+        weights = self.term_weights
+        features = [(f"w:{w}", self.word_weight * weights.get(w, 1.0)) for w in words]
+        features += [(f"b:{a} {b}", self.bigram_weight * weights.get(f"{a} {b}", 1.0)) for a, b in zip(words, words[1:])]
+        low, high = self.char_ngrams
+        for word in words:
+            padded = f"<{word}>"
+            for n in range(low, high + 1):
+                features += [(f"c:{padded[i:i + n]}", self.char_weight) for i in range(len(padded) - n + 1)]
+        return features
+
+    def encode(self, text: str) -> np.ndarray:
+        """编码单条文本，返回长度为 dim 的 float32 单位向量（空文本为零向量）"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self.features(text):
+            h = _feature_hash(feature)
+            # 最高位决定符号，减小哈希冲突带来的偏差
+            vector[h % self.dim] += weight if h >> 63 else -weight
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def encode_batch(self, texts: Sequence[str]) -> np.ndarray:
+        """编码多条文本，返回 (len(texts), dim) 的 float32 矩阵"""
+        matrix = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            matrix[i] = self.encode(text)
+        return matrix
+
+
+def top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    沿最后一维取得分最高的k个（降序）
+
+    先用 argpartition 在 O(n) 内找出前k个，再只对这k个排序。
+    """
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        empty = np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+        return empty, scores[..., :0]
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape).copy()
+    candidate_scores = np.take_along_axis(scores, candidates, axis=-1)
+    order = np.argsort(-candidate_scores, axis=-1)
+    return np.take_along_axis(candidates, order, axis=-1), np.take_along_axis(candidate_scores, order, axis=-1)
+
+
+class SemanticIndex:
+    """归一化向量矩阵 + 原始记录"""
+
+    def __init__(self, matrix: np.ndarray, records: list[Any], encoder: Optional[HashingEncoder] = None):
+        """
+        Args:
+            matrix: (记录数, dim) 的 float32 矩阵，每行已归一化（可以是memmap）
+            records: 与矩阵各行对应的记录
+            encoder: 查询使用的编码器，维度必须与矩阵一致
+        """
+        self.encoder = encoder or HashingEncoder(dim=matrix.shape[1])
+        if self.encoder.dim != matrix.shape[1]:
+            raise ValueError(f"encoder dim {self.encoder.dim} != matrix dim {matrix.shape[1]}")
+        self.matrix = matrix
+        self.records = records
+
+    @classmethod
+    def build(
+        cls,
+        records: list[Any],
+        text: Callable[[Any], str] = str,
+        encoder: Optional[HashingEncoder] = None,
+    ) -> "SemanticIndex":
+        """为一组记录建立索引，text 把记录转换为被编码的文本"""
+        encoder = encoder or HashingEncoder()
+        return cls(encoder.encode_batch([text(record) for record in records]), list(records), encoder)
+
+    def save(self, path: Path):
+        """保存为 <path>.npy（矩阵）和 <path>.json（记录），矩阵可以memmap加载"""
+        path = Path(path)
+        np.save(path.with_suffix(".npy"), np.ascontiguousarray(self.matrix, dtype=np.float32))
+        path.with_suffix(".json").write_text(json.dumps(self.records, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True, encoder: Optional[HashingEncoder] = None) -> "SemanticIndex":
+        """加载索引；mmap=True 时矩阵按需从磁盘分页读入，不占用常驻内存"""
+        path = Path(path)
+        matrix = np.load(path.with_suffix(".npy"), mmap_mode="r" if mmap else None)
+        records = json.loads(path.with_suffix(".json").read_text(encoding="utf-8"))
+        return cls(matrix, records, encoder)
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.0) -> list[tuple[float, Any]]:
+        """单个查询：返回 [(余弦相似度, 记录), ...]，按相似度降序"""
+        return self.search_batch([query], k=k, min_score=min_score)[0]
+
+    def search_batch(self, queries: Sequence[str], k: int = 3, min_score: float = 0.0) -> list[list[tuple[float, Any]]]:
+        """批量查询：一次矩阵乘法得到所有查询对所有记录的相似度"""
+        return self.search_vectors(self.encoder.encode_batch(queries), k, min_score)
+
+    def search_vectors(self, vectors: np.ndarray, k: int = 3, min_score: float = 0.0) -> list[list[tuple[float, Any]]]:
+        """用已编码的查询向量（(n, dim)，已归一化）检索"""
+        indices, top_scores = top_k(vectors @ self.matrix.T, k)
+        return [
+            [(float(score), self.records[int(i)]) for i, score in zip(row_indices, row_scores) if score > min_score]
+            for row_indices, row_scores in zip(indices, top_scores)
+        ]
+
+
+def spherical_kmeans(matrix: np.ndarray, clusters: int, iterations: int = 8, sample: int = 65536,
+                     seed: int = 0) -> np.ndarray:
+    """在最多 sample 行的随机样本上做球面k-means，返回 (clusters, dim) 的单位向量簇中心"""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(matrix), size=min(sample, len(matrix)), replace=False)
+    data = np.asarray(matrix[np.sort(rows)], dtype=np.float32)
+    centroids = data[rng.choice(len(data), size=clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # 空簇保留原来的中心
+        centroids = np.where(empty[:, None], centroids, sums / np.where(norms == 0, 1.0, norms))
+    return centroids.astype(np.float32)
+
+
+class PartitionedIndex(SemanticIndex):
+    """
+    按簇重排的向量矩阵：查询先和簇中心比较，只扫描最近的 nprobe 个簇
+
+    每个簇在矩阵中是连续的一段，扫描就是几次小的矩阵-向量乘法；
+    扫描量约为 行数 × nprobe / 簇数，结果是近似的top-k（真正的近邻可能落在没扫描的簇里）。
+    """
+
+    def __init__(self, matrix: np.ndarray, records: list[Any], centroids: np.ndarray, offsets: np.ndarray,
+                 encoder: Optional[HashingEncoder] = None, nprobe: int = 16):
+        """
+        Args:
+            matrix: 已按簇重排的矩阵，第 c 个簇是 matrix[offsets[c]:offsets[c + 1]]
+            records: 与矩阵各行对应的记录（同样重排过）
+            centroids: (簇数, dim) 的簇中心
+            offsets: 长度为 簇数+1 的各簇起始行
+            encoder: 查询使用的编码器
+            nprobe: 每个查询扫描的簇数（越大越准、越慢）
+        """
+        super().__init__(matrix, records, encoder)
+        self.centroids = centroids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, records: list[Any], clusters: Optional[int] = None,
+                    encoder: Optional[HashingEncoder] = None, nprobe: int = 16,
+                    chunk_rows: int = 65536) -> "PartitionedIndex":
+        """对已编码的矩阵聚类（默认 √行数 个簇）并按簇重排"""
+        clusters = clusters or max(1, int(np.sqrt(len(matrix))))
+        centroids = spherical_kmeans(matrix, clusters)
+        assignment = np.concatenate([
+            np.argmax(np.asarray(matrix[start:start + chunk_rows]) @ centroids.T, axis=1)
+            for start in range(0, len(matrix), chunk_rows)
+        ])
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=clusters))])
+        return cls(np.ascontiguousarray(matrix[order]), [records[int(i)] for i in order], centroids, offsets,
+                   encoder, nprobe)
+
+    @classmethod
+    def build(cls, records: list[Any], text: Callable[[Any], str] = str,
+              encoder: Optional[HashingEncoder] = None) -> "PartitionedIndex":
+        encoder = encoder or HashingEncoder()
+        return cls.from_matrix(encoder.encode_batch([text(record) for record in records]), list(records),
+                               encoder=encoder)
+
+    def save(self, path: Path):
+        """在 SemanticIndex 的两个文件之外，把簇中心和各簇起始行保存为 <path>.ivf.npz"""
+        super().save(path)
+        np.savez(Path(path).with_suffix(".ivf.npz"), centroids=self.centroids, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True, encoder: Optional[HashingEncoder] = None,
+             nprobe: int = 16) -> "PartitionedIndex":
+        base = SemanticIndex.load(path, mmap, encoder)
+        partitions = np.load(Path(path).with_suffix(".ivf.npz"))
+        return cls(base.matrix, base.records, partitions["centroids"], partitions["offsets"], base.encoder, nprobe)
+
+    def search_vectors(self, vectors: np.ndarray, k: int = 3, min_score: float = 0.0) -> list[list[tuple[float, Any]]]:
+        probes, _ = top_k(vectors @ self.centroids.T, self.nprobe)
+        results = []
+        for vector, clusters in zip(vectors, probes):
+            rows = [np.arange(self.offsets[c], self.offsets[c + 1]) for c in clusters]
+            scores = np.concatenate([self.matrix[self.offsets[c]:self.offsets[c + 1]] @ vector for c in clusters])
+            candidates = np.concatenate(rows)
+            best, best_scores = top_k(scores, k)
+            results.append([(float(score), self.records[int(candidates[i])])
+                            for i, score in zip(best, best_scores) if score > min_score])
+        return results
+
+
+def recipe_text(recipe: dict[str, Any]) -> str:
+    """食谱的检索文本：名称 + 分类 + 分类描述词"""
+    category = recipe.get("category", "")
+    return f"{recipe['name']} {category} {CATEGORY_TERMS.get(category, '')}"
+
+
+def recipe_encoder() -> HashingEncoder:
+    """食谱检索使用的编码器：去掉虚词，分类线索词加权"""
+    return HashingEncoder(stopwords=ENGLISH_STOPWORDS, term_weights=CATEGORY_CUE_WEIGHTS)
+
+
+# 排序回归检查：查询 → 排在第一的结果应属于的分类（python semantic_search.py 不带查询时运行）
+RANKING_CHECKS = {
+    "something sweet for after dinner": "dessert",
+    "a sugary treat for the kids": "dessert",
+    "a warm meal for a cold evening": "dinner",
+    "dinner": "dinner",
+}
+
+
+def _benchmark(rows: int, dim: int, queries: int, batch: int, path: Optional[Path], nprobe: int):
+    """在有簇结构的随机单位向量矩阵上测量暴力扫描和分簇索引的延迟，以及分簇索引的召回率"""
+    rng = np.random.default_rng(0)
+    print(f"🧮 生成 {rows:,} x {dim} 的float32矩阵（{rows * dim * 4 / 2**20:.0f} MB）...")
+    # 真实的文本向量围绕主题聚集；均匀随机向量没有近邻结构，测不出分簇索引的召回率
+    topics = rng.standard_normal((max(1, rows // 500), dim), dtype=np.float32)
+    topics /= np.linalg.norm(topics, axis=1, keepdims=True)
+
+    def sample(n: int) -> np.ndarray:
+        vectors = topics[rng.integers(len(topics), size=n)] + rng.standard_normal((n, dim), dtype=np.float32) * 0.06
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    matrix = np.concatenate([sample(min(100_000, rows - start)) for start in range(0, rows, 100_000)])
+    if path is not None:
+        np.save(path, matrix)
+        matrix = np.load(path, mmap_mode="r")
+        print(f"💾 已保存并以memmap方式加载 {path}")
+    vectors = sample(queries)
+
+    def timed(index: SemanticIndex, label: str, count: int) -> list[list[tuple[float, Any]]]:
+        index.search_vectors(vectors[:1], k=10)  # 预热（memmap时把矩阵读入页缓存）
+        latencies, results = [], []
+        for vector in vectors[:count]:
+            start = time.perf_counter()
+            results += index.search_vectors(vector[None, :], k=10)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        print(f"🔍 {label}: p50 {latencies[len(latencies) // 2] * 1000:.2f}ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.2f}ms")
+        return results
+
+    exact_index = SemanticIndex(matrix, list(range(rows)), HashingEncoder(dim=dim))
+    exact = timed(exact_index, "暴力扫描，单个查询", min(queries, 20))
+    start = time.perf_counter()
+    for i in range(0, queries, batch):
+        exact_index.search_vectors(vectors[i:i + batch], k=10)
+    print(f"📦 暴力扫描，批量查询（每批{batch}个）: 平均每个查询 "
+          f"{(time.perf_counter() - start) / queries * 1000:.2f}ms")
+
+    start = time.perf_counter()
+    partitioned = PartitionedIndex.from_matrix(matrix, list(range(rows)), encoder=HashingEncoder(dim=dim),
+                                               nprobe=nprobe)
+    print(f"🗂️  分簇索引: {len(partitioned.centroids):,} 个簇，建立耗时 {time.perf_counter() - start:.1f}s")
+    approximate = timed(partitioned, f"分簇索引（nprobe={nprobe}），单个查询", queries)
+    exact += exact_index.search_vectors(vectors[len(exact):], k=10)
+    recall = np.mean([len({r for _, r in a} & {r for _, r in e}) / max(1, len(e))
+                      for a, e in zip(approximate, exact)])
+    print(f"🎯 分簇索引 recall@10: {recall:.1%}")
+
+
+def _check_rankings(index: SemanticIndex) -> bool:
+    """RANKING_CHECKS 中每个查询排在第一的结果是否属于预期的分类"""
+    ok = True
+    for query, expected in RANKING_CHECKS.items():
+        hits = index.search(query, k=1)
+        got = hits[0][1]["category"] if hits else None
+        ok &= got == expected
+        print(f"   {'✅' if got == expected else '❌'} {query!r} → {got}（预期 {expected}）")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="哈希向量语义检索")
+    parser.add_argument("query", nargs="*", help="查询，如 'a sugary treat for the kids'")
+    parser.add_argument("--k", type=int, default=3, help="返回条数")
+    parser.add_argument("--bench", type=int, metavar="ROWS", help="在 ROWS 行的随机矩阵上测量查询延迟")
+    parser.add_argument("--dim", type=int, default=256, help="向量维度（基准测试用）")
+    parser.add_argument("--queries", type=int, default=200, help="基准测试的查询数")
+    parser.add_argument("--batch", type=int, default=32, help="基准测试的批大小")
+    parser.add_argument("--nprobe", type=int, default=16, help="基准测试中分簇索引每个查询扫描的簇数")
+    parser.add_argument("--save", type=Path, help="基准测试矩阵保存为 .npy 并memmap加载")
+    args = parser.parse_args()
+
+    if args.bench:
+        _benchmark(args.bench, args.dim, args.queries, args.batch, args.save, args.nprobe)
+        return
+
+    from recipe_data import ALL_RECIPES
+
+    index = SemanticIndex.build(ALL_RECIPES, text=recipe_text, encoder=recipe_encoder())
+    # 默认查询都没有原样出现在描述词里
+    queries = [" ".join(args.query)] if args.query else [
+        "a sugary treat for the kids", "a warm meal for a cold evening", "something sweet for after dinner",
+        "creamy strawberry", "crab",
+    ]
+    for query, hits in zip(queries, index.search_batch(queries, k=args.k)):
+        print(f"🔍 {query}")
+        for score, recipe in hits:
+            print(f"   {score:.3f}  {recipe['recipe_id']}  {recipe['name']} ({recipe['category']})")
+    if not args.query:
+        print("🧪 排序回归检查")
+        if not _check_rankings(index):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+增量流式JSON解析 - 边接收边产出结构化对象
+
+example3 要等整段回答结束后再用正则提取 Recipe ID。
+这里在模型流式输出JSON的同时逐字符扫描，每当一个数组元素对象的右花括号到达，
+就立即解析并用 pydantic 模型校验，然后 yield 出去，下游（UI、下单服务）
+不必等整个回答结束就能处理第一条结果。
+
+支持的输出形状：
+    {"query": "...", "recipes": [{...}, {...}]}
+    [{...}, {...}]
+前面可以带 ```json 代码块标记或其他说明文字。
+"""
+
+import json
+from typing import Any, Iterable, Iterator, Optional, Type
+
+
+class StreamingJSONArrayParser:
+    """逐块喂入文本，产出所有"数组元素对象"（父容器是数组的对象）"""
+
+    def __init__(self, max_depth: int = 2):
+        """
+        Args:
+            max_depth: 数组所在的最大嵌套深度。默认2，既覆盖顶层数组，也覆盖根对象里的数组字段
+        """
+        self.max_depth = max_depth
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._buffer: list[str] = []  # 只保存当前元素对象的文本
+        self._capture_depth: Optional[int] = None
+
+    def feed(self, chunk: str) -> Iterator[dict[str, Any]]:
+        """喂入一段文本，产出本段中完成的元素对象"""
+        for char in chunk:
+            if not self._started:
+                # 跳过JSON开始之前的内容（如 ```json）
+                if char not in "{[":
+                    continue
+                self._started = True
+
+            if self._capture_depth is not None:
+                self._buffer.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                parent = self._stack[-1] if self._stack else None
+                if (char == "{" and parent == "[" and self._capture_depth is None
+                        and len(self._stack) <= self.max_depth):
+                    self._capture_depth = len(self._stack)
+                    self._buffer = [char]
+                self._stack.append(char)
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if char == "}" and self._capture_depth is not None and len(self._stack) == self._capture_depth:
+                    text = "".join(self._buffer)
+                    self._buffer = []
+                    self._capture_depth = None
+                    try:
+                        obj = json.loads(text)
+                    except json.JSONDecodeError:
+                        # 单个元素损坏时跳过，不影响后续元素
+                        continue
+                    yield obj
+
+    @property
+    def complete(self) -> bool:
+        """根容器是否已经闭合"""
+        return self._started and not self._stack
+
+
+def stream_validated(
+    chunks: Iterable[str],
+    model: Type[Any],
+    on_error: Optional[Any] = None,
+) -> Iterator[Any]:
+    """
+    从文本流中增量解析元素对象，并用pydantic模型校验后产出
+
+    Args:
+        chunks: 模型流式输出的文本片段
+        model: pydantic模型类（如 Recipe）
+        on_error: 可选回调 on_error(obj, exception)，校验失败的对象会被跳过
+
+    Yields:
+        校验通过的模型实例
+    """
+    parser = StreamingJSONArrayParser()
+    for chunk in chunks:
+        for obj in parser.feed(chunk):
+            try:
+                yield model(**obj)
+            except Exception as e:  # pydantic v1/v2 的 ValidationError 没有共同基类
+                if on_error is not None:
+                    on_error(obj, e)
@@ -0,0 +1,161 @@
+"""
+容错的ReAct输出解析器 - 在本地修复常见格式偏差，避免重新提示的LLM往返
+
+example2 依赖 handle_parsing_errors=True：热情洋溢、满是emoji的人设经常输出
+不合规的 "Thought/Action/Action Input" 块，每次解析失败都会再花一次完整的LLM调用
+（最多 max_iterations=5 次）。
+
+TolerantReActOutputParser 先尝试标准解析，失败后在本地修复以下偏差：
+- 缺少 "Action Input:"（如 "Action: SearchRecipes[pasta]" 或输入写在下一行）
+- 用 ```json 代码块包裹的 {"action": ..., "action_input": ...}
+- 工具名后面跟着emoji或标点（"SearchRecipes 🍝!!!"）
+- Final Answer 和 Action 混在一起（以先出现的为准）
+- 完全没有ReAct标记的闲聊回复（当作 Final Answer）；只有 "Thought:" 却没有 Action 的中间步骤
+  不能当作回答，交给重新提示
+- Action Input 后面模型自己编造的 "Observation:"（多行输入如JSON、代码保持完整）
+
+只有修复也失败时才抛出 OutputParserException，交给 handle_parsing_errors 重新提示。
+stats 记录 clean / repaired / reprompted 次数，用来衡量省下了多少次往返。
+"""
+
+import json
+import re
+from typing import Optional, Union
+
+from langchain.agents.output_parsers import ReActSingleInputOutputParser
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+from pydantic import Field
+
+FINAL_ANSWER_ACTION = "Final Answer:"
+
+_ACTION_RE = re.compile(r"Action\s*\d*\s*:[ \t]*(?P<action>[^\n]*)", re.IGNORECASE)
+_ACTION_INPUT_RE = re.compile(r"Action\s*\d*\s*Input\s*\d*\s*:[\s]*(?P<input>.*)", re.IGNORECASE | re.DOTALL)
+_FENCED_JSON_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+_BRACKET_INPUT_RE = re.compile(r"^(?P<tool>[^\[\(]+?)\s*[\[\(](?P<input>.*)[\]\)]\s*$")
+# 出现任何一个ReAct标记就说明模型还在推理过程中，不能把整段当作最终回答
+_REACT_MARKER_RE = re.compile(r"^\s*(?:Thought|Observation|Action\s*\d*\s*Input)\s*\d*\s*:",
+                              re.IGNORECASE | re.MULTILINE)
+
+
+def match_tool_name(raw: str, tool_names: list[str]) -> Optional[str]:
+    """把带emoji、标点或大小写偏差的工具名映射到已注册的工具名"""
+    cleaned = re.sub(r"[^\w]", "", raw).lower()
+    if not cleaned:
+        return None
+    for name in tool_names:
+        if re.sub(r"[^\w]", "", name).lower() == cleaned:
+            return name
+    # 工具名后面跟了多余的单词（如 "SearchRecipes now"）
+    for name in tool_names:
+        if cleaned.startswith(re.sub(r"[^\w]", "", name).lower()):
+            return name
+    return None
+
+
+def clean_tool_input(raw: str) -> str:
+    """去掉模型编造的 Observation 及其之后的内容、末尾的emoji/标点以及包裹的引号；多行输入保持完整"""
+    text = re.split(r"\n\s*Observation\s*:", raw, maxsplit=1)[0].strip()
+    end = len(text)
+    while end > 0 and not (text[end - 1].isalnum() or text[end - 1] in ")]}\"'?.%"):
+        end -= 1
+    return text[:end].strip().strip("\"'`").strip()
+
+
+def repair_react_output(text: str, tool_names: list[str]) -> Optional[Union[AgentAction, AgentFinish]]:
+    """
+    尝试在本地修复一段不合规的ReAct输出
+
+    Returns:
+        修复后的 AgentAction / AgentFinish；无法修复时返回 None
+    """
+    # 1. 代码块中的JSON动作
+    fenced = _FENCED_JSON_RE.search(text)
+    if fenced:
+        try:
+            payload = json.loads(fenced.group(1))
+        except json.JSONDecodeError:
+            payload = None
+        if isinstance(payload, dict):
+            raw_tool = str(payload.get("action") or payload.get("tool") or "")
+            tool_input = payload.get("action_input", payload.get("input", ""))
+            if raw_tool.strip().lower() == "final answer":
+                return AgentFinish({"output": str(tool_input)}, text)
+            tool = match_tool_name(raw_tool, tool_names)
+            if tool:
+                return AgentAction(tool, tool_input if isinstance(tool_input, str) else json.dumps(tool_input), text)
+
+    action_match = _ACTION_RE.search(text)
+    answer_pos = text.find(FINAL_ANSWER_ACTION)
+
+    # 2. Final Answer 和 Action 同时出现：以先出现的为准
+    if answer_pos != -1 and (action_match is None or answer_pos < action_match.start()):
+        answer = text[answer_pos + len(FINAL_ANSWER_ACTION):]
+        answer = re.split(r"\n\s*Action\s*\d*\s*:", answer, maxsplit=1)[0]
+        return AgentFinish({"output": answer.strip()}, text)
+
+    # 3. 没有Action：只有完全没有ReAct标记的闲聊回复才当作最终回答，
+    #    "Thought: I should search..." 这样的中间步骤交给 handle_parsing_errors 重新提示
+    if action_match is None:
+        answer = text.strip()
+        if not answer or _REACT_MARKER_RE.search(text):
+            return None
+        return AgentFinish({"output": answer}, text)
+
+    # 4. 有Action：修复工具名和输入
+    raw_action = action_match.group("action").strip()
+    tool_input: Optional[str] = None
+    input_match = _ACTION_INPUT_RE.search(text, action_match.end())
+    if input_match:
+        tool_input = clean_tool_input(input_match.group("input"))
+    else:
+        bracket = _BRACKET_INPUT_RE.match(raw_action)
+        if bracket:
+            raw_action, tool_input = bracket.group("tool"), bracket.group("input").strip().strip("\"'")
+        else:
+            # 输入写在 Action 的下一行
+            rest = text[action_match.end():].strip()
+            tool_input = clean_tool_input(rest) if rest else ""
+
+    tool = match_tool_name(raw_action, tool_names)
+    if tool is None:
+        return None
+    return AgentAction(tool, tool_input or "", text)
+
+
+class TolerantReActOutputParser(ReActSingleInputOutputParser):
+    """先标准解析，失败时本地修复，修复失败才交给 handle_parsing_errors 重新提示"""
+
+    tool_names: list[str] = Field(default_factory=list)
+    stats: dict[str, int] = Field(default_factory=lambda: {"clean": 0, "repaired": 0, "reprompted": 0})
+
+    def parse(self, text: str) -> Union[AgentAction, AgentFinish]:
+        try:
+            result = super().parse(text)
+        except OutputParserException:
+            repaired = repair_react_output(text, self.tool_names)
+            if repaired is None:
+                self.stats["reprompted"] += 1
+                raise
+            self.stats["repaired"] += 1
+            return repaired
+
+        # 标准解析成功，但工具名带emoji或输入里有编造的Observation时，AgentExecutor仍会多跑一轮
+        if isinstance(result, AgentAction) and self.tool_names and result.tool not in self.tool_names:
+            tool = match_tool_name(result.tool, self.tool_names)
+            if tool is not None:
+                self.stats["repaired"] += 1
+                return AgentAction(tool, clean_tool_input(str(result.tool_input)), text)
+        if isinstance(result, AgentAction) and isinstance(result.tool_input, str) and "Observation" in result.tool_input:
+            self.stats["repaired"] += 1
+            return AgentAction(result.tool, clean_tool_input(result.tool_input), text)
+
+        self.stats["clean"] += 1
+        return result
+
+    def report(self) -> str:
+        """返回一行统计：多少次本地修复替代了重新提示"""
+        total = sum(self.stats.values())
+        return (f"parsed {total} outputs: {self.stats['clean']} clean, "
+                f"{self.stats['repaired']} repaired locally (round trips saved), "
+                f"{self.stats['reprompted']} re-prompted")
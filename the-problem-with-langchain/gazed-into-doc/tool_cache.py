@@ -0,0 +1,214 @@
+"""
+工具结果缓存 - TTL、容量上限、规范化参数作为键、并发去重
+
+Recipe Agent 在每个会话里、以及每次解析出错重试后，都会用同样的查询再次调用 search_recipes，
+而在生产环境中每次调用都是一次真实的目录查询。
+
+ToolCache 为Agent工具提供带缓存的装饰器：
+- 键：用 args_schema（如 RecipeSearchInput）校验后的参数，字符串统一去空白、转小写
+- 每个工具单独设置 TTL 和容量上限（LRU淘汰）
+- 并发去重：相同参数的调用正在执行时，后来者等待同一个结果，而不是再查一次
+- 统计：每个工具的命中率；with_cache_metadata() 把命中信息附加到Agent的中间步骤上
+
+用法:
+    tool_cache = ToolCache()
+
+    @tool_cache.cached("SearchRecipes", ttl_s=300, maxsize=1024, args_schema=RecipeSearchInput)
+    def search_recipes(query: str) -> str: ...
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Type
+
+
+def _normalize(value: Any) -> Any:
+    """字符串去首尾空白、合并空白、转小写；递归处理列表和字典"""
+    if isinstance(value, str):
+        return " ".join(value.split()).lower()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _schema_dump(model: Any) -> dict[str, Any]:
+    """兼容pydantic v1（.dict()）和v2（.model_dump()）"""
+    return model.model_dump() if hasattr(model, "model_dump") else model.dict()
+
+
+class _InFlight:
+    """一次正在执行的调用，供相同参数的并发调用者等待"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _ToolResultCache:
+    """单个工具的LRU + TTL缓存"""
+
+    def __init__(self, name: str, ttl_s: float, maxsize: int):
+        self.name = name
+        self.ttl_s = ttl_s
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self.in_flight: dict[str, _InFlight] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0  # 等待了正在执行的相同调用
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses + self.deduplicated
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "deduplicated": self.deduplicated,
+            "size": len(self.entries),
+            "hit_rate": (self.hits + self.deduplicated) / total if total else 0.0,
+        }
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> tuple[Any, str]:
+        """返回 (结果, 来源)，来源为 "hit" / "dedup" / "miss" """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value, "hit"
+                del self.entries[key]
+
+            waiting = self.in_flight.get(key)
+            if waiting is None:
+                waiting = self.in_flight[key] = _InFlight()
+                owner = True
+                self.misses += 1
+            else:
+                owner = False
+                self.deduplicated += 1
+
+        if not owner:
+            waiting.done.wait()
+            if waiting.error is not None:
+                raise waiting.error
+            return waiting.result, "dedup"
+
+        try:
+            value = compute()
+        except BaseException as e:
+            # 失败的结果不缓存，但要通知正在等待的调用者
+            waiting.error = e
+            raise
+        else:
+            waiting.result = value
+            with self.lock:
+                self.entries[key] = (time.monotonic() + self.ttl_s, value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+            return value, "miss"
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+            waiting.done.set()
+
+
+class ToolCache:
+    """Agent工具缓存的注册表"""
+
+    def __init__(self):
+        self.caches: dict[str, _ToolResultCache] = {}
+        # 每个上下文（会话/线程）各自记录，互不干扰
+        self._records: contextvars.ContextVar[Optional[list[dict[str, Any]]]] = contextvars.ContextVar(
+            f"tool_cache_records_{id(self)}", default=None
+        )
+
+    def cached(
+        self,
+        name: str,
+        ttl_s: float = 300.0,
+        maxsize: int = 256,
+        args_schema: Optional[Type[Any]] = None,
+    ) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """
+        把工具函数包装为带缓存的版本（保留原函数签名，StructuredTool可以照常推导参数）
+
+        Args:
+            name: 工具名（与Agent中的工具名一致，用于统计和中间步骤元数据）
+            ttl_s: 缓存有效期（秒）
+            maxsize: 最多缓存多少个不同参数的结果
+            args_schema: 参数模型，用于校验并规范化参数（如 RecipeSearchInput）
+        """
+        cache = self.caches[name] = _ToolResultCache(name, ttl_s, maxsize)
+
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                arguments = dict(bound.arguments)
+                if args_schema is not None:
+                    # 校验失败会抛出异常，和未缓存的工具行为一致
+                    arguments = _schema_dump(args_schema(**arguments))
+                key = json.dumps(_normalize(arguments), sort_keys=True, ensure_ascii=False, default=str)
+                value, source = cache.get_or_compute(key, lambda: func(*args, **kwargs))
+                self._record(name, key, source)
+                return value
+
+            return wrapper
+
+        return decorator
+
+    def _record(self, name: str, key: str, source: str):
+        records = self._records.get()
+        if records is not None:
+            records.append({"tool": name, "key": key, "cache": source})
+
+    @contextmanager
+    def recording(self) -> Iterator[list[dict[str, Any]]]:
+        """记录这个作用域内每次缓存工具调用的命中情况（按调用顺序）"""
+        records: list[dict[str, Any]] = []
+        token = self._records.set(records)
+        try:
+            yield records
+        finally:
+            self._records.reset(token)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """每个工具的命中统计"""
+        return {name: cache.stats() for name, cache in self.caches.items()}
+
+    def with_cache_metadata(self, result: dict[str, Any], records: list[dict[str, Any]]) -> dict[str, Any]:
+        """
+        把缓存命中信息附加到Agent输出的中间步骤上
+
+        result["intermediate_steps_metadata"] 与 result["intermediate_steps"] 一一对应，
+        每项包含本次调用的缓存来源（hit/dedup/miss）以及该工具当前的命中率。
+        """
+        pending = list(records)
+        metadata = []
+        for action, _observation in result.get("intermediate_steps", []):
+            entry: dict[str, Any] = {"tool": action.tool}
+            if action.tool in self.caches:
+                match = next((r for r in pending if r["tool"] == action.tool), None)
+                if match is not None:
+                    pending.remove(match)
+                    entry["cache"] = match["cache"]
+                entry["tool_hit_rate"] = self.caches[action.tool].stats()["hit_rate"]
+            metadata.append(entry)
+        result["intermediate_steps_metadata"] = metadata
+        result["tool_cache"] = self.stats()
+        return result
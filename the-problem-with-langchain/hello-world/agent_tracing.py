@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Agent 步骤追踪 - 导出 Chrome trace / Perfetto 时间线
+
+verbose=True 只会打印一大段文字，却看不到每一步花了多少时间。
+这里用"span"记录每一次LLM调用、输出解析、工具执行、记忆读写的起止时间，
+span可以嵌套，并携带token数量等参数，最后导出为 Chrome trace JSON，
+用 chrome://tracing 或 https://ui.perfetto.dev 打开即可看到时间线。
+
+两种用法：
+- 手写Agent循环：with tracer.span("llm", category="llm"): ...
+- LangChain AgentExecutor：config={"callbacks": [tracer.callback_handler()]}
+
+示例用 trace_path() 决定trace文件的位置：默认写到系统临时目录，不会落在源码目录里，
+设置 AGENT_TRACE_DIR 环境变量可以改到其他目录。
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+from uuid import UUID
+
+
+def trace_path(filename: str) -> str:
+    """trace文件的输出路径：AGENT_TRACE_DIR 指定的目录，默认系统临时目录"""
+    directory = os.environ.get("AGENT_TRACE_DIR") or tempfile.gettempdir()
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+@dataclass
+class Span:
+    """一段有起止时间的操作"""
+    name: str
+    category: str
+    start_us: float
+    end_us: Optional[float] = None
+    tid: int = 0
+    args: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> float:
+        if self.end_us is None:
+            return 0.0
+        return (self.end_us - self.start_us) / 1000
+
+
+class Tracer:
+    """收集span并导出为Chrome trace格式"""
+
+    def __init__(self, name: str = "agent-run"):
+        """
+        Args:
+            name: 本次追踪的名称（显示为进程名）
+        """
+        self.name = name
+        self.spans: list[Span] = []
+        self.instants: list[dict[str, Any]] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._origin) * 1_000_000
+
+    def start_span(self, name: str, category: str = "agent", **args: Any) -> Span:
+        """开始一个span（需要配合 end_span 使用）"""
+        span = Span(name=name, category=category, start_us=self._now_us(),
+                    tid=threading.get_ident(), args=dict(args))
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def end_span(self, span: Span, **args: Any) -> Span:
+        """结束一个span，可以追加参数（如token数量）"""
+        span.end_us = self._now_us()
+        span.args.update(args)
+        return span
+
+    @contextmanager
+    def span(self, name: str, category: str = "agent", **args: Any) -> Iterator[Span]:
+        """以上下文管理器的方式记录一个span，异常会记录在span参数中"""
+        current = self.start_span(name, category, **args)
+        try:
+            yield current
+        except BaseException as e:
+            current.args["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.end_span(current)
+
+    def instant(self, name: str, category: str = "agent", **args: Any):
+        """记录一个瞬时事件（如Agent决定调用哪个工具）"""
+        with self._lock:
+            self.instants.append({
+                "name": name, "cat": category, "ph": "i", "s": "t",
+                "ts": self._now_us(), "pid": os.getpid(), "tid": threading.get_ident(), "args": args,
+            })
+
+    def to_chrome_trace(self) -> dict[str, Any]:
+        """导出为Chrome trace事件格式（"X"完整事件，按开始时间排序）"""
+        pid = os.getpid()
+        events: list[dict[str, Any]] = [
+            {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.name}},
+        ]
+        for span in sorted(self.spans, key=lambda s: s.start_us):
+            end_us = span.end_us if span.end_us is not None else self._now_us()
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": span.start_us,
+                "dur": end_us - span.start_us,
+                "pid": pid,
+                "tid": span.tid,
+                "args": span.args,
+            })
+        events.extend(self.instants)
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, path: str):
+        """保存为Chrome trace JSON文件"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False, default=str)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """按类别汇总：次数、总耗时（ms）、token数"""
+        totals: dict[str, dict[str, float]] = {}
+        for span in self.spans:
+            entry = totals.setdefault(span.category, {"count": 0, "total_ms": 0.0, "tokens": 0})
+            entry["count"] += 1
+            entry["total_ms"] += span.duration_ms
+            entry["tokens"] += span.args.get("total_tokens", 0) or 0
+        return totals
+
+    def print_summary(self):
+        """打印各类别耗时汇总"""
+        print("\n⏱️  追踪汇总（按类别）:")
+        for category, entry in sorted(self.summary().items(), key=lambda kv: -kv[1]["total_ms"]):
+            tokens = f", {int(entry['tokens'])} tokens" if entry["tokens"] else ""
+            print(f"   {category:<8} {int(entry['count'])}次, {entry['total_ms']:.1f} ms{tokens}")
+
+    def callback_handler(self):
+        """创建一个LangChain回调处理器，把AgentExecutor的各个步骤记录为span"""
+        return _make_callback_handler(self)
+
+
+def trace_memory(memory: Any, tracer: Tracer) -> Any:
+    """
+    给LangChain的memory对象加上追踪（load_memory_variables / save_context）
+
+    LangChain的回调不覆盖记忆读写，这里直接包装实例上的这两个方法。
+    """
+    load, save = memory.load_memory_variables, memory.save_context
+
+    def traced_load(inputs: dict[str, Any]) -> dict[str, Any]:
+        with tracer.span("memory.load", category="memory"):
+            return load(inputs)
+
+    def traced_save(inputs: dict[str, Any], outputs: dict[str, Any]) -> None:
+        with tracer.span("memory.save", category="memory"):
+            save(inputs, outputs)
+
+    # memory是pydantic模型，绕过字段校验直接设置实例属性
+    object.__setattr__(memory, "load_memory_variables", traced_load)
+    object.__setattr__(memory, "save_context", traced_save)
+    return memory
+
+
+def _token_usage(response: Any) -> dict[str, int]:
+    """从LLMResult中取出token用量"""
+    usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+    if not usage:
+        for generations in getattr(response, "generations", None) or []:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    return {
+                        "prompt_tokens": metadata.get("input_tokens", 0),
+                        "completion_tokens": metadata.get("output_tokens", 0),
+                        "total_tokens": metadata.get("total_tokens", 0),
+                    }
+    return {key: usage[key] for key in ("prompt_tokens", "completion_tokens", "total_tokens") if key in usage}
+
+
+def _make_callback_handler(tracer: Tracer):
+    # 延迟导入，没有安装LangChain时本模块的其余部分仍然可用
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TracingCallbackHandler(BaseCallbackHandler):
+        """把LangChain回调事件转换为span"""
+
+        def __init__(self):
+            self._open: dict[UUID, Span] = {}
+
+        def _start(self, run_id: UUID, name: str, category: str, **args: Any):
+            self._open[run_id] = tracer.start_span(name, category, **args)
+
+        def _end(self, run_id: UUID, **args: Any):
+            span = self._open.pop(run_id, None)
+            if span is not None:
+                tracer.end_span(span, **args)
+
+        # ---- chain（AgentExecutor本身、输出解析器等）----
+        def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+            name = kwargs.get("name") or (serialized or {}).get("name") or "chain"
+            category = "parse" if "Parser" in name else "chain"
+            self._start(run_id, name, category)
+
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=f"{type(error).__name__}: {error}")
+
+        # ---- LLM调用 ----
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self._start(run_id, "llm", "llm", messages=sum(len(batch) for batch in messages))
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._start(run_id, "llm", "llm", prompts=len(prompts))
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            self._end(run_id, **_token_usage(response))
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=f"{type(error).__name__}: {error}")
+
+        # ---- 工具执行 ----
+        def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+            name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+            self._start(run_id, f"tool:{name}", "tool", input=input_str)
+
+        def on_tool_end(self, output, *, run_id, **kwargs):
+            self._end(run_id, output_chars=len(str(output)))
+
+        def on_tool_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=f"{type(error).__name__}: {error}")
+
+        # ---- Agent决策 ----
+        def on_agent_action(self, action, *, run_id, **kwargs):
+            tracer.instant(f"action:{action.tool}", "agent", tool_input=str(action.tool_input))
+
+        def on_agent_finish(self, finish, *, run_id, **kwargs):
+            tracer.instant("finish", "agent")
+
+    return TracingCallbackHandler()
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+批量翻译 - 流式读取JSONL、有界并发、增量写出、断点续跑
+
+两个critique演示里的 "Translate this sentence from English to French" 正是每晚的批量任务，
+只不过规模是一百万句。逐句阻塞调用太慢，中途崩溃还要从头再来。
+
+BatchTranslator：
+- 逐行读取输入（{"id": ..., "text": ...}），不把整个文件读进内存
+- 固定数量的协程并发调用 AsyncOpenAI，有界队列保证读取不会跑到处理前面太远
+- 每完成一条就追加一行到输出文件（{"line", "id", "text", "translation"}），完成顺序可能与输入不同
+- 检查点文件（<输出>.ckpt）定期原子地写入：已全部完成的输入行号（水位线）及其字节偏移、
+  水位线之后已完成的行号、重试后仍失败的行（死信列表）、输出文件已落盘的长度
+- 失败的行进入死信列表，水位线照常前进，检查点不会随着运行越来越大
+- 重启时先重试死信列表中的行，再从水位线的字节偏移继续读，检查点之后追加到输出的结果也会被读回，
+  已完成的条目不会重做；崩溃时写了一半的最后一行会被截掉
+- 定期打印吞吐量和预计剩余时间；结束时仍有失败的条目则列出行号并以非零状态退出
+
+用法:
+    python batch_translate.py sentences.jsonl translations.jsonl --concurrency 64
+    python batch_translate.py --make-sample 10000 sentences.jsonl     # 生成测试输入
+    python batch_translate.py sentences.jsonl out.jsonl --stub        # 对桩服务器运行
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+SYSTEM_TEMPLATE = "You are a helpful assistant that translates {input_language} to {output_language}."
+
+
+@dataclass
+class BatchItem:
+    """输入中的一行"""
+    line: int  # 从0开始的行号
+    offset: int  # 该行在输入文件中的字节偏移
+    id: Any
+    text: str
+
+
+@dataclass
+class Checkpoint:
+    """断点信息：水位线之前的行都已完成"""
+    watermark: int = 0
+    input_offset: int = 0
+    output_bytes: int = 0
+    done_above: list[int] = field(default_factory=list)  # 水位线之后已完成的行号
+    failed: list[list[int]] = field(default_factory=list)  # 死信列表：重试后仍失败的 [行号, 字节偏移]
+    completed: int = 0
+    invalid: int = 0
+
+    @classmethod
+    def load(cls, path: Path) -> "Checkpoint":
+        if not path.exists():
+            return cls()
+        return cls(**json.loads(path.read_text(encoding="utf-8")))
+
+    def save(self, path: Path):
+        """先写临时文件再重命名，崩溃时检查点要么是旧的要么是新的"""
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+
+@dataclass
+class BatchProgress:
+    """运行统计"""
+    total: Optional[int] = None
+    completed: int = 0  # 包括之前运行完成的
+    resumed: int = 0  # 启动时已经完成的
+    invalid: int = 0  # 无法解析的输入行（写入输出并标记错误）
+    failed: int = 0  # 死信列表中的条目（重试后仍失败，下次运行时重做）
+    started: float = field(default_factory=time.monotonic)
+
+    def report(self) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = (self.completed - self.resumed) / elapsed if elapsed > 0 else 0.0
+        line = f"   {self.completed:,}"
+        if self.total:
+            remaining = max(0, self.total - self.completed - self.failed)
+            eta = remaining / rate if rate > 0 else float("inf")
+            line += f"/{self.total:,} ({self.completed / self.total:.1%})"
+            line += f", ETA {_format_seconds(eta)}"
+        line += f", {rate:.1f} items/s"
+        if self.failed or self.invalid:
+            line += f", {self.failed} failed, {self.invalid} invalid"
+        return line
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def count_lines(path: Path) -> int:
+    """按块统计行数（不解析JSON），用于计算ETA"""
+    count = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                return count
+            count += block.count(b"\n")
+
+
+class BatchTranslator:
+    """JSONL批量翻译，可以中断后从检查点继续"""
+
+    def __init__(
+        self,
+        client: "AsyncOpenAI",
+        input_path: Path,
+        output_path: Path,
+        input_language: str = "English",
+        output_language: str = "French",
+        model: str = "deepseek-chat",
+        concurrency: int = 32,
+        max_attempts: int = 3,
+        checkpoint_interval: float = 5.0,
+        report_interval: float = 10.0,
+    ):
+        """
+        Args:
+            client: AsyncOpenAI客户端
+            input_path: 输入JSONL，每行 {"id": ..., "text": ...}
+            output_path: 输出JSONL（追加写入）；检查点保存在 <output_path>.ckpt
+            input_language / output_language: 翻译的源语言和目标语言
+            model: 模型名称
+            concurrency: 同时进行的请求数
+            max_attempts: 单条失败后的最多尝试次数（指数退避），仍失败的留到下次运行
+            checkpoint_interval: 写检查点的间隔（秒）
+            report_interval: 打印进度的间隔（秒），0表示不打印
+        """
+        self.client = client
+        self.input_path = Path(input_path)
+        self.output_path = Path(output_path)
+        self.checkpoint_path = self.output_path.with_name(self.output_path.name + ".ckpt")
+        self.system_prompt = SYSTEM_TEMPLATE.format(input_language=input_language, output_language=output_language)
+        self.model = model
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.checkpoint_interval = checkpoint_interval
+        self.report_interval = report_interval
+        self.progress = BatchProgress()
+
+        self._pending: dict[int, int] = {}  # 已读取未完成的行号 → 字节偏移
+        self._failed: dict[int, int] = {}  # 死信列表：失败的行号 → 字节偏移（水位线越过它们，单独记录）
+        self._done: set[int] = set()  # 水位线之后已完成的行号
+        self._next_line = 0
+        self._next_offset = 0
+        self._output: Any = None
+
+    # ---- 断点 ----
+    def _recover(self) -> Checkpoint:
+        """读取检查点，并把检查点之后追加到输出的结果读回来"""
+        checkpoint = Checkpoint.load(self.checkpoint_path)
+        self._done = set(checkpoint.done_above)
+        self._failed = {line: offset for line, offset in checkpoint.failed}
+        if not self.output_path.exists():
+            self.output_path.touch()
+
+        with open(self.output_path, "r+b") as f:
+            f.seek(checkpoint.output_bytes)
+            valid_end = checkpoint.output_bytes
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # 崩溃时写了一半的行
+                try:
+                    record = json.loads(raw)
+                except json.JSONDecodeError:
+                    break
+                line = record["line"]
+                if self._failed.pop(line, None) is not None or (
+                        line >= checkpoint.watermark and line not in self._done):
+                    self._done.add(line)
+                    checkpoint.completed += 1
+                    checkpoint.invalid += "error" in record
+                valid_end += len(raw)
+            f.truncate(valid_end)
+        return checkpoint
+
+    def _watermark(self) -> tuple[int, int]:
+        """(水位线行号, 字节偏移)：最早的未完成行（死信列表中的除外），没有时为下一个要读取的行"""
+        unfinished = {line: offset for line, offset in self._pending.items() if line not in self._failed}
+        if not unfinished:
+            return self._next_line, self._next_offset
+        line = min(unfinished)
+        return line, unfinished[line]
+
+    def _save_checkpoint(self):
+        self._output.flush()
+        os.fsync(self._output.fileno())
+        watermark, offset = self._watermark()
+        self._done = {line for line in self._done if line >= watermark}
+        Checkpoint(
+            watermark=watermark, input_offset=offset, output_bytes=self._output.tell(),
+            done_above=sorted(self._done), failed=[[line, offset] for line, offset in sorted(self._failed.items())],
+            completed=self.progress.completed, invalid=self.progress.invalid,
+        ).save(self.checkpoint_path)
+
+    def unfinished_lines(self) -> list[int]:
+        """死信列表中的行号（重试后仍失败，下次运行时重做）"""
+        return sorted(self._failed)
+
+    # ---- 执行 ----
+    async def _read_items(self, queue: "asyncio.Queue[Optional[BatchItem]]", checkpoint: Checkpoint):
+        """先重试死信列表中的行，再从水位线开始逐行读取，跳过已完成的行；队列满时等待"""
+        self._next_line, self._next_offset = checkpoint.watermark, checkpoint.input_offset
+        with open(self.input_path, "rb") as f:
+            for line, offset in sorted(self._failed.items()):
+                f.seek(offset)
+                await self._enqueue(queue, line, offset, f.readline())
+            f.seek(checkpoint.input_offset)
+            for raw in f:
+                line, offset = self._next_line, self._next_offset
+                self._next_line += 1
+                self._next_offset += len(raw)
+                if line not in self._done:
+                    await self._enqueue(queue, line, offset, raw)
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    async def _enqueue(self, queue: "asyncio.Queue[Optional[BatchItem]]", line: int, offset: int, raw: bytes):
+        """解析一行并放入队列；空行和无法解析的行直接算作完成"""
+        if not raw.strip():
+            self._done.add(line)  # 空行不算条目，但水位线要能越过它
+            return
+        try:
+            row = json.loads(raw)
+            item = BatchItem(line, offset, row.get("id", line), str(row["text"]))
+        except (json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+            self._write({"line": line, "error": f"invalid input: {e}"})
+            self._done.add(line)
+            self.progress.invalid += 1
+            self.progress.completed += 1
+            return
+        self._pending[line] = offset
+        await queue.put(item)
+
+    def _write(self, record: dict[str, Any]):
+        self._output.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    async def _translate(self, item: BatchItem) -> str:
+        delay = 1.0
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": self.system_prompt},
+                        {"role": "user", "content": item.text},
+                    ],
+                    temperature=0,
+                )
+                return (response.choices[0].message.content or "").strip()
+            except Exception:
+                if attempt == self.max_attempts:
+                    raise
+                await asyncio.sleep(delay)
+                delay *= 2
+        raise AssertionError("unreachable")
+
+    async def _worker(self, queue: "asyncio.Queue[Optional[BatchItem]]"):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            try:
+                translation = await self._translate(item)
+            except Exception:
+                self._failed[item.line] = self._pending.pop(item.line)
+                self.progress.failed = len(self._failed)
+                continue
+            self._write({"line": item.line, "id": item.id, "text": item.text, "translation": translation})
+            del self._pending[item.line]
+            self._done.add(item.line)
+            self._failed.pop(item.line, None)
+            self.progress.failed = len(self._failed)
+            self.progress.completed += 1
+
+    async def _periodic(self):
+        last_report = time.monotonic()
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            self._save_checkpoint()
+            if self.report_interval and time.monotonic() - last_report >= self.report_interval:
+                last_report = time.monotonic()
+                print(self.progress.report(), flush=True)
+
+    async def run(self, count_total: bool = True) -> BatchProgress:
+        """运行到输入结束（或被取消）；任何情况下都会写最后一次检查点"""
+        checkpoint = self._recover()
+        self.progress = BatchProgress(
+            total=count_lines(self.input_path) if count_total else None,
+            completed=checkpoint.completed, resumed=checkpoint.completed, invalid=checkpoint.invalid,
+            failed=len(self._failed),
+        )
+        if checkpoint.completed or self._failed:
+            print(f"♻️  从检查点继续：已完成 {checkpoint.completed:,} 条，先重试 {len(self._failed):,} 条失败的，"
+                  f"再从第 {checkpoint.watermark:,} 行开始读取")
+
+        queue: "asyncio.Queue[Optional[BatchItem]]" = asyncio.Queue(maxsize=self.concurrency * 2)
+        with open(self.output_path, "ab") as self._output:
+            periodic = asyncio.ensure_future(self._periodic())
+            try:
+                await asyncio.gather(
+                    self._read_items(queue, checkpoint),
+                    *(self._worker(queue) for _ in range(self.concurrency)),
+                )
+            finally:
+                periodic.cancel()
+                self._save_checkpoint()
+        return self.progress
+
+
+def make_sample(path: Path, count: int):
+    """生成测试输入"""
+    subjects = ["I", "We", "My friend", "The team", "Our users"]
+    verbs = ["love", "enjoy", "write", "review", "debug"]
+    objects = ["programming", "Python code", "unit tests", "the documentation", "small functions"]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            text = f"{subjects[i % 5]} {verbs[i // 5 % 5]} {objects[i // 25 % 5]}."
+            f.write(json.dumps({"id": f"s{i}", "text": text}) + "\n")
+
+
+async def _main(args: argparse.Namespace) -> int:
+    """运行批量翻译，返回仍未完成的条目数"""
+    import httpx
+    from openai import AsyncOpenAI
+
+    stub = None
+    if args.stub:
+        from stub_llm_server import StubLLMServer
+
+        stub = StubLLMServer().start()
+        base_url, api_key = stub.base_url, "stub"
+    else:
+        base_url, api_key = args.base_url, os.getenv("DEEPSEEK_API_KEY", "")
+        if not api_key:
+            raise SystemExit("❌ 请设置 DEEPSEEK_API_KEY，或使用 --stub 连接本地桩服务器")
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                         http_client=httpx.AsyncClient(limits=limits, timeout=60.0))
+    translator = BatchTranslator(
+        client, args.input, args.output, args.input_language, args.output_language, args.model,
+        concurrency=args.concurrency, checkpoint_interval=args.checkpoint_interval,
+        report_interval=args.report_interval,
+    )
+    try:
+        progress = await translator.run()
+        unfinished = translator.unfinished_lines()
+        if unfinished:
+            shown = ", ".join(str(line) for line in unfinished[:20]) + (" ..." if len(unfinished) > 20 else "")
+            print(f"⚠️  {len(unfinished):,} 条重试后仍失败（输入行号 {shown}），再次运行同样的命令会重试这些条目")
+        else:
+            print("✅ 完成")
+        print(progress.report())
+        print(f"   结果: {args.output}，检查点: {translator.checkpoint_path}")
+        return len(unfinished)
+    finally:
+        await client.close()
+        if stub is not None:
+            stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量翻译（可断点续跑）")
+    parser.add_argument("input", type=Path, help="输入JSONL，每行 {\"id\": ..., \"text\": ...}")
+    parser.add_argument("output", type=Path, nargs="?", help="输出JSONL")
+    parser.add_argument("--make-sample", type=int, metavar="N", help="生成N行测试输入到 input 后退出")
+    parser.add_argument("--input-language", default="English")
+    parser.add_argument("--output-language", default="French")
+    parser.add_argument("--model", default="deepseek-chat")
+    parser.add_argument("--base-url", default=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"))
+    parser.add_argument("--stub", action="store_true", help="使用本地桩服务器")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发请求数")
+    parser.add_argument("--checkpoint-interval", type=float, default=5.0, help="检查点间隔（秒）")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="进度打印间隔（秒）")
+    args = parser.parse_args()
+
+    if args.make_sample:
+        make_sample(args.input, args.make_sample)
+        print(f"📝 已生成 {args.make_sample:,} 行到 {args.input}")
+        return
+    if args.output is None:
+        parser.error("output is required")
+    try:
+        unfinished = asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        print("\n⏸️  已中断，检查点已保存，再次运行同样的命令即可继续")
+        raise SystemExit(130)
+    if unfinished:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
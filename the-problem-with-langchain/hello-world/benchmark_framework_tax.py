@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+"框架税"基准测试：LangChain vs DeepSeek官方库（OpenAI SDK）
+
+对每个成对场景分别用两种方式运行 N 次，统计：
+- 端到端延迟的 p50/p95/p99
+- 客户端CPU时间（每次调用的平均值）
+- 峰值内存（RSS）
+
+所有请求都发往本地桩服务器（stub_llm_server.py），网络和模型的耗时几乎为零，
+剩下的就是客户端库本身的开销。每个(场景, 方式)在独立子进程中运行，保证峰值内存互不干扰。
+
+用法:
+    python benchmark_framework_tax.py --runs 200 --json bench.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+from queue import Empty
+from typing import Any, Callable, Optional, cast
+
+from stub_llm_server import StubLLMServer
+
+SCENARIOS = ["single_call", "prompt_template", "two_turn_memory", "agent_loop"]
+PATHS = ["openai_sdk", "langchain"]
+
+AGENT_SYSTEM_PROMPT = """You are a helpful assistant with access to a Calculator tool.
+When you need to calculate something, respond ONLY with JSON: {"tool": "Calculator", "input": "expression"}
+Otherwise, provide the final answer directly."""
+
+
+def calculator(expression: str) -> str:
+    """计算数学表达式（与 langchain_agent_performance_demo.py 中相同）"""
+    try:
+        return str(eval(expression))
+    except Exception as e:
+        return f"Error: {e}"
+
+
+# ============================================================================
+# DeepSeek官方库（OpenAI SDK）方式
+# ============================================================================
+def build_openai_sdk(scenario: str, base_url: str) -> Callable[[], Any]:
+    """构造OpenAI SDK方式的场景函数（客户端构造不计入计时）"""
+    from openai import OpenAI
+
+    client = OpenAI(api_key="stub", base_url=base_url)
+
+    def create(messages: list[dict[str, Any]]) -> str:
+        response = client.chat.completions.create(
+            model="deepseek-chat",
+            messages=cast(Any, messages),
+            temperature=0
+        )
+        return response.choices[0].message.content or ""
+
+    if scenario == "single_call":
+        return lambda: create([
+            {"role": "user", "content": "Translate this sentence from English to French. I love programming."}
+        ])
+
+    if scenario == "prompt_template":
+        def run_template():
+            input_language, output_language = "English", "French"
+            return create([
+                {"role": "system", "content": f"You are a helpful assistant that translates {input_language} to {output_language}."},
+                {"role": "user", "content": "I love programming."},
+            ])
+        return run_template
+
+    if scenario == "two_turn_memory":
+        def run_memory():
+            history: list[dict[str, Any]] = [{"role": "system", "content": "You are a friendly assistant."}]
+            for user_input in ("Hi there!", "What's 2+2?"):
+                history.append({"role": "user", "content": user_input})
+                history.append({"role": "assistant", "content": create(history)})
+            return history
+        return run_memory
+
+    if scenario == "agent_loop":
+        def run_agent():
+            messages: list[dict[str, Any]] = [
+                {"role": "system", "content": AGENT_SYSTEM_PROMPT},
+                {"role": "user", "content": "What is 25 multiplied by 4?"},
+            ]
+            first = create(messages)
+            if "{" in first and "tool" in first.lower():
+                tool_call = json.loads(first)
+                messages.append({"role": "assistant", "content": first})
+                messages.append({"role": "user", "content": f"Calculator result: {calculator(tool_call['input'])}"})
+                return create(messages)
+            return first
+        return run_agent
+
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+# ============================================================================
+# LangChain 方式
+# ============================================================================
+def build_langchain(scenario: str, base_url: str) -> Callable[[], Any]:
+    """构造LangChain方式的场景函数（ChatOpenAI构造不计入计时）"""
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+    from langchain_openai import ChatOpenAI
+
+    llm = ChatOpenAI(model="deepseek-chat", temperature=0, api_key=cast(Any, "stub"), base_url=base_url)
+
+    if scenario == "single_call":
+        return lambda: llm.invoke([
+            HumanMessage(content="Translate this sentence from English to French. I love programming.")
+        ]).content
+
+    if scenario == "prompt_template":
+        from langchain_core.prompts.chat import (
+            ChatPromptTemplate,
+            HumanMessagePromptTemplate,
+            SystemMessagePromptTemplate,
+        )
+
+        def run_template():
+            system_message_prompt = SystemMessagePromptTemplate.from_template(
+                "You are a helpful assistant that translates {input_language} to {output_language}."
+            )
+            human_message_prompt = HumanMessagePromptTemplate.from_template("{text}")
+            chat_prompt = ChatPromptTemplate.from_messages([system_message_prompt, human_message_prompt])
+            return llm.invoke(chat_prompt.format_prompt(
+                input_language="English", output_language="French", text="I love programming."
+            ).to_messages()).content
+        return run_template
+
+    if scenario == "two_turn_memory":
+        from langchain_core.chat_history import InMemoryChatMessageHistory
+        from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+        from langchain_core.runnables.history import RunnableWithMessageHistory
+
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "You are a friendly assistant."),
+            MessagesPlaceholder(variable_name="history"),
+            ("human", "{input}"),
+        ])
+
+        store: dict[str, InMemoryChatMessageHistory] = {}
+
+        def get_session_history(session_id: str) -> InMemoryChatMessageHistory:
+            if session_id not in store:
+                store[session_id] = InMemoryChatMessageHistory()
+            return store[session_id]
+
+        # 与官方库方式一样，链只构造一次；每次运行只重置会话历史
+        chain = RunnableWithMessageHistory(
+            prompt | llm,
+            get_session_history,
+            input_messages_key="input",
+            history_messages_key="history",
+        )
+        config = cast(Any, {"configurable": {"session_id": "bench"}})
+
+        def run_memory():
+            store.clear()
+            for user_input in ("Hi there!", "What's 2+2?"):
+                chain.invoke({"input": user_input}, config=config)
+            return store["bench"].messages
+        return run_memory
+
+    if scenario == "agent_loop":
+        def run_agent():
+            messages: list[Any] = [
+                SystemMessage(content=AGENT_SYSTEM_PROMPT),
+                HumanMessage(content="What is 25 multiplied by 4?"),
+            ]
+            first = str(llm.invoke(messages).content)
+            if "{" in first and "tool" in first.lower():
+                tool_call = json.loads(first)
+                messages.append(AIMessage(content=first))
+                messages.append(HumanMessage(content=f"Calculator result: {calculator(tool_call['input'])}"))
+                return llm.invoke(messages).content
+            return first
+        return run_agent
+
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+BUILDERS = {"openai_sdk": build_openai_sdk, "langchain": build_langchain}
+
+
+# ============================================================================
+# 统计
+# ============================================================================
+def percentile(values: list[float], pct: float) -> float:
+    """线性插值百分位数"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值RSS（MB）；macOS上ru_maxrss单位是字节，Linux上是KB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(scenario: str, path: str, base_url: str, runs: int, warmup: int) -> dict[str, Any]:
+    """在当前（子）进程中运行一个场景，返回统计结果"""
+    try:
+        run = BUILDERS[path](scenario, base_url)
+    except ImportError as e:
+        return {"scenario": scenario, "path": path, "skipped": f"missing dependency: {e.name}"}
+
+    for _ in range(warmup):
+        run()
+
+    latencies_ms: list[float] = []
+    cpu_start = time.process_time()
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+    cpu_ms = (time.process_time() - cpu_start) * 1000 / runs
+
+    return {
+        "scenario": scenario,
+        "path": path,
+        "runs": runs,
+        "p50_ms": percentile(latencies_ms, 50),
+        "p95_ms": percentile(latencies_ms, 95),
+        "p99_ms": percentile(latencies_ms, 99),
+        "mean_ms": sum(latencies_ms) / runs,
+        "cpu_ms_per_run": cpu_ms,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _worker(queue, scenario: str, path: str, base_url: str, runs: int, warmup: int):
+    try:
+        queue.put(run_case(scenario, path, base_url, runs, warmup))
+    except Exception as e:
+        queue.put({"scenario": scenario, "path": path, "error": f"{type(e).__name__}: {e}"})
+
+
+def run_isolated(scenario: str, path: str, base_url: str, runs: int, warmup: int,
+                 timeout: float = 600.0) -> dict[str, Any]:
+    """在全新的子进程中运行一个场景，保证峰值内存只属于这一种方式；子进程崩溃或超时时返回错误结果"""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_worker, args=(queue, scenario, path, base_url, runs, warmup))
+    process.start()
+    deadline = time.monotonic() + timeout
+    result: Optional[dict[str, Any]] = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1.0)
+        except Empty:
+            if process.exitcode is not None:
+                # 子进程已经退出；结果可能刚写入管道，再等一小会儿
+                try:
+                    result = queue.get(timeout=1.0)
+                except Empty:
+                    result = {"scenario": scenario, "path": path,
+                              "error": f"worker exited with code {process.exitcode}"}
+            elif time.monotonic() > deadline:
+                process.terminate()
+                result = {"scenario": scenario, "path": path, "error": f"timed out after {timeout:.0f}s"}
+    process.join()
+    return result
+
+
+def print_table(results: list[dict[str, Any]]):
+    """打印结果表格，并计算每个场景LangChain相对官方库的"框架税" """
+    header = f"{'场景':<18}{'方式':<12}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'CPU(ms)':>10}{'RSS(MB)':>10}"
+    print(header)
+    print("-" * 80)
+    by_key = {(r["scenario"], r["path"]): r for r in results}
+    for r in results:
+        if "p50_ms" not in r:
+            print(f"{r['scenario']:<18}{r['path']:<12}  ⚠️  {r.get('skipped') or r.get('error')}")
+            continue
+        print(f"{r['scenario']:<18}{r['path']:<12}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+              f"{r['p99_ms']:>10.2f}{r['cpu_ms_per_run']:>10.2f}{r['peak_rss_mb']:>10.1f}")
+
+    print("\n📊 框架税（LangChain - 官方库，p50）:")
+    for scenario in SCENARIOS:
+        sdk, lc = by_key.get((scenario, "openai_sdk")), by_key.get((scenario, "langchain"))
+        if sdk and lc and "p50_ms" in sdk and "p50_ms" in lc:
+            tax = lc["p50_ms"] - sdk["p50_ms"]
+            print(f"   {scenario:<18}{tax:+.2f} ms  ({lc['p50_ms'] / sdk['p50_ms']:.2f}x), "
+                  f"RSS {lc['peak_rss_mb'] - sdk['peak_rss_mb']:+.1f} MB")
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="LangChain vs OpenAI SDK 框架税基准测试")
+    parser.add_argument("--runs", type=int, default=100, help="每个场景的计时次数")
+    parser.add_argument("--warmup", type=int, default=5, help="预热次数（不计时）")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=PATHS)
+    parser.add_argument("--base-url", help="使用已运行的OpenAI兼容服务，默认启动内置桩服务器")
+    parser.add_argument("--json", dest="json_path", help="把结果写入JSON文件")
+    parser.add_argument("--timeout", type=float, default=600.0, help="每个(场景, 方式)子进程的最长运行秒数")
+    args = parser.parse_args(argv)
+
+    print("=" * 80)
+    print("框架税基准测试: LangChain vs DeepSeek官方库（OpenAI SDK）")
+    print("=" * 80)
+
+    server = None if args.base_url else StubLLMServer().start()
+    base_url = args.base_url or server.base_url
+    print(f"🧪 目标服务: {base_url}，每个场景 {args.runs} 次（预热 {args.warmup} 次）\n")
+
+    results = []
+    try:
+        for scenario in args.scenarios:
+            for path in args.paths:
+                print(f"⏱️  运行 {scenario} / {path} ...")
+                results.append(run_isolated(scenario, path, base_url, args.runs, args.warmup, args.timeout))
+    finally:
+        if server is not None:
+            server.stop()
+
+    print()
+    print_table(results)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"base_url": base_url, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已写入 {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,556 @@
+#!/usr/bin/env python3
+"""
+异步HTTP对话网关 - 会话API + Server-Sent Events 流式输出
+
+SimpleConversation 是阻塞的类，要提供给前端只能每个请求占一个线程。
+ChatGateway 用 asyncio（只依赖标准库 + AsyncOpenAI）在单个进程内服务大量会话：
+
+    POST   /sessions                  {"system_prompt": "..."}  → 201 {"session_id": "..."}
+    POST   /sessions/<id>/messages    {"content": "..."}        → text/event-stream
+                                      （token 事件逐段输出，最后一个 done 事件；"stream": false 时返回JSON）
+    GET    /sessions/<id>             → {"session_id", "messages"}
+    DELETE /sessions/<id>             → 204
+    GET    /health                    → {"sessions", "active_turns", "draining"}
+
+- 每个会话的历史仍由 SimpleConversation 管理（begin_turn/end_turn，在线程池中执行，检索器查询SQLite不会卡住事件循环），同一会话的轮次按顺序执行
+- HTTP/1.1 keep-alive：SSE 用分块传输编码，流结束后连接可以继续发下一个请求
+- 背压：每次写入后等待发送缓冲区降到水位线以下，慢客户端会让网关暂停读取上游流，
+  超过 write_timeout 仍写不出去就断开该客户端并撤销这一轮
+- 优雅关闭：停止接受新连接和新的轮次（返回503），关闭空闲连接，等待进行中的流写完
+
+用法:
+    python chat_gateway.py --port 8080                # 使用 DEEPSEEK_API_KEY
+    python chat_gateway.py --stub --load 1000         # 对桩服务器开1000个并发流做压测
+
+    curl -N -X POST localhost:8080/sessions/<id>/messages -d '{"content": "Hi there!"}'
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Optional, cast
+
+from simple_conversation import SimpleConversation, Turn
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+_REASONS = {
+    200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 431: "Request Header Fields Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class HttpError(Exception):
+    """以对应状态码返回给客户端的错误"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    headers: dict[str, str]
+    body: bytes
+    version: str = "HTTP/1.1"
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    def json(self) -> dict[str, Any]:
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise HttpError(400, f"invalid JSON body: {e}") from e
+        if not isinstance(data, dict):
+            raise HttpError(400, "JSON body must be an object")
+        return data
+
+
+@dataclass
+class Session:
+    """一个对话会话"""
+    id: str
+    conversation: SimpleConversation
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_active: float = field(default_factory=time.monotonic)
+
+
+class ChatGateway:
+    """基于 asyncio 的会话网关"""
+
+    def __init__(
+        self,
+        async_client: "AsyncOpenAI",
+        conversation_factory: Callable[[str], SimpleConversation],
+        temperature: float = 0.7,
+        max_sessions: int = 100_000,
+        session_ttl: float = 3600.0,
+        max_concurrent_turns: int = 1000,
+        write_timeout: float = 30.0,
+        keepalive_timeout: float = 15.0,
+        max_body_bytes: int = 1 << 20,
+        write_buffer_bytes: int = 64 * 1024,
+    ):
+        """
+        Args:
+            async_client: 发起流式补全的 AsyncOpenAI 客户端
+            conversation_factory: 按 system prompt 创建 SimpleConversation 的函数（只用它管理历史）
+            temperature: 温度参数
+            max_sessions: 最多同时保存的会话数
+            session_ttl: 会话空闲多久后被清理（秒）
+            max_concurrent_turns: 同时进行的上游调用上限，超出的轮次排队
+            write_timeout: 向慢客户端写入时最多等待多久（秒）
+            keepalive_timeout: keep-alive 连接空闲多久后关闭（秒）
+            max_body_bytes: 请求体大小上限
+            write_buffer_bytes: 每个连接的发送缓冲区水位线，超过后暂停读取上游
+        """
+        self.async_client = async_client
+        self.conversation_factory = conversation_factory
+        self.temperature = temperature
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.write_timeout = write_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.max_body_bytes = max_body_bytes
+        self.write_buffer_bytes = write_buffer_bytes
+
+        self.sessions: dict[str, Session] = {}
+        self.active_turns = 0
+        self.completed_turns = 0
+        self.aborted_turns = 0  # 客户端断开或上游出错而撤销的轮次
+        self._upstream = asyncio.Semaphore(max_concurrent_turns)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: dict[asyncio.Task, bool] = {}  # 连接任务 → 是否正在处理请求
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._draining = False
+        self._janitor: Optional[asyncio.Task] = None
+
+    # ---- 生命周期 ----
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> "ChatGateway":
+        # backlog 调大，压测时上千个连接同时到达
+        self._server = await asyncio.start_server(self._handle_connection, host, port, backlog=4096)
+        self._janitor = asyncio.ensure_future(self._expire_sessions())
+        return self
+
+    @property
+    def address(self) -> tuple[str, int]:
+        assert self._server is not None, "gateway not started"
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return host, port
+
+    async def shutdown(self, drain_timeout: float = 30.0):
+        """停止接受新请求，等待进行中的流写完（最多 drain_timeout 秒），然后关闭所有连接"""
+        self._draining = True
+        if self._server is not None:
+            self._server.close()
+        if self._janitor is not None:
+            self._janitor.cancel()
+
+        # 空闲的 keep-alive 连接可以直接关闭；正在处理的请求结束后会因为 draining 自行关闭
+        for task, busy in list(self._connections.items()):
+            if not busy:
+                task.cancel()
+        try:
+            await asyncio.wait_for(self._idle.wait(), drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in list(self._connections):
+            task.cancel()
+        if self._connections:
+            await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+
+        loop = asyncio.get_running_loop()
+        for session in list(self.sessions.values()):
+            await loop.run_in_executor(None, session.conversation.close)
+        self.sessions.clear()
+
+    async def _expire_sessions(self):
+        """定期清理空闲过久的会话"""
+        while True:
+            await asyncio.sleep(min(60.0, self.session_ttl))
+            deadline = time.monotonic() - self.session_ttl
+            for session in list(self.sessions.values()):
+                if session.last_active < deadline and not session.lock.locked():
+                    self.sessions.pop(session.id, None)
+                    await asyncio.get_running_loop().run_in_executor(None, session.conversation.close)
+
+    # ---- HTTP ----
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = cast(asyncio.Task, asyncio.current_task())
+        self._connections[task] = False
+        writer.transport.set_write_buffer_limits(high=self.write_buffer_bytes)
+        try:
+            while not self._draining:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as e:
+                    await self._send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                self._connections[task] = True
+                try:
+                    keep_alive = await self._dispatch(request, writer)
+                finally:
+                    self._connections[task] = False
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.TimeoutError):
+            pass  # 客户端断开或写入超时
+        except asyncio.CancelledError:
+            pass  # 关闭网关
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        """读取一个请求；连接关闭或 keep-alive 超时时返回None"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.keepalive_timeout)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(431, "request headers too large")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        raw_length = headers.get("content-length") or "0"
+        if not (raw_length.isascii() and raw_length.isdigit()):
+            raise HttpError(400, f"invalid Content-Length: {raw_length!r}")
+        length = int(raw_length)
+        if length > self.max_body_bytes:
+            raise HttpError(413, f"body larger than {self.max_body_bytes} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return Request(method.upper(), target.split("?", 1)[0], headers, body, version)
+
+    async def _write(self, writer: asyncio.StreamWriter, data: bytes):
+        """写入并在发送缓冲区超过水位线时等待客户端读走（背压）"""
+        writer.write(data)
+        await asyncio.wait_for(writer.drain(), self.write_timeout)
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Any = None,
+                         keep_alive: bool = True, headers: Optional[dict[str, str]] = None):
+        body = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Length: {len(body)}",
+                f"Connection: {'keep-alive' if keep_alive and not self._draining else 'close'}"]
+        if payload is not None:
+            head.append("Content-Type: application/json; charset=utf-8")
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        await self._write(writer, ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+
+    async def _dispatch(self, request: Request, writer: asyncio.StreamWriter) -> bool:
+        """处理一个请求，返回连接是否保持"""
+        keep_alive = request.keep_alive
+        parts = [part for part in request.path.split("/") if part]
+        try:
+            if parts == ["health"] and request.method == "GET":
+                await self._send_json(writer, 200, {
+                    "sessions": len(self.sessions), "active_turns": self.active_turns,
+                    "completed_turns": self.completed_turns, "aborted_turns": self.aborted_turns,
+                    "draining": self._draining,
+                }, keep_alive)
+            elif parts == ["sessions"] and request.method == "POST":
+                await self._create_session(request, writer, keep_alive)
+            elif len(parts) == 2 and parts[0] == "sessions":
+                session = self._get_session(parts[1])
+                if request.method == "GET":
+                    await self._send_json(writer, 200, {
+                        "session_id": session.id, "messages": session.conversation.get_history(),
+                    }, keep_alive)
+                elif request.method == "DELETE":
+                    self.sessions.pop(session.id, None)
+                    await asyncio.get_running_loop().run_in_executor(None, session.conversation.close)
+                    await self._send_json(writer, 204, keep_alive=keep_alive)
+                else:
+                    raise HttpError(405, f"{request.method} not allowed on {request.path}")
+            elif len(parts) == 3 and parts[0] == "sessions" and parts[2] == "messages":
+                if request.method != "POST":
+                    raise HttpError(405, f"{request.method} not allowed on {request.path}")
+                session = self._get_session(parts[1])
+                data = request.json()
+                content = data.get("content")
+                if not isinstance(content, str) or not content:
+                    raise HttpError(400, "'content' must be a non-empty string")
+                if self._draining:
+                    await self._send_json(writer, 503, {"error": "shutting down"}, False, {"Retry-After": "5"})
+                    return False
+                if data.get("stream", True):
+                    await self._stream_turn(session, content, writer, keep_alive)
+                else:
+                    await self._complete_turn(session, content, writer, keep_alive)
+            else:
+                raise HttpError(404, f"no route for {request.method} {request.path}")
+        except HttpError as e:
+            await self._send_json(writer, e.status, {"error": e.message}, keep_alive)
+        return keep_alive and not self._draining
+
+    # ---- 会话 ----
+    async def _create_session(self, request: Request, writer: asyncio.StreamWriter, keep_alive: bool):
+        if self._draining:
+            await self._send_json(writer, 503, {"error": "shutting down"}, False, {"Retry-After": "5"})
+            return
+        if len(self.sessions) >= self.max_sessions:
+            raise HttpError(503, "too many sessions")
+        system_prompt = request.json().get("system_prompt", "")
+        if not isinstance(system_prompt, str):
+            raise HttpError(400, "'system_prompt' must be a string")
+        session = Session(uuid.uuid4().hex, self.conversation_factory(system_prompt))
+        self.sessions[session.id] = session
+        await self._send_json(writer, 201, {"session_id": session.id}, keep_alive)
+
+    def _get_session(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HttpError(404, f"unknown session {session_id}")
+        session.last_active = time.monotonic()
+        return session
+
+    def _turn_started(self):
+        self.active_turns += 1
+        self._idle.clear()
+
+    def _turn_finished(self, completed: bool):
+        self.active_turns -= 1
+        if completed:
+            self.completed_turns += 1
+        else:
+            self.aborted_turns += 1
+        if self.active_turns == 0:
+            self._idle.set()
+
+    async def _run_blocking(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        在线程池中运行会话的阻塞操作（检索器、长期记忆会查询SQLite，不能卡住事件循环）
+
+        被取消时仍等它执行完再抛出，避免会话锁释放后和下一轮交错修改历史。
+        """
+        future = asyncio.get_running_loop().run_in_executor(None, func, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait([future])
+            raise
+
+    async def _begin_turn(self, session: Session, content: str) -> Turn:
+        """在线程池中执行 begin_turn；被取消时撤销它已经记录的用户消息"""
+        future = asyncio.get_running_loop().run_in_executor(
+            None, session.conversation.begin_turn, content, {"temperature": self.temperature},
+        )
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait([future])
+            if not future.cancelled() and future.exception() is None:
+                session.conversation.cancel_turn(future.result())
+            raise
+
+    async def _complete_turn(self, session: Session, content: str, writer: asyncio.StreamWriter, keep_alive: bool):
+        """非流式：等待完整回复后返回JSON"""
+        self._turn_started()
+        completed = False
+        try:
+            async with session.lock:
+                turn = await self._begin_turn(session, content)
+                try:
+                    async with self._upstream:
+                        response = await self.async_client.chat.completions.create(
+                            model=turn.model, messages=cast(Any, turn.messages), temperature=self.temperature,
+                        )
+                    reply = response.choices[0].message.content or ""
+                    await self._run_blocking(session.conversation.end_turn, turn, reply, response.usage)
+                    completed = True
+                except Exception as e:
+                    session.conversation.cancel_turn(turn)
+                    raise HttpError(503, f"upstream error: {type(e).__name__}: {e}") from e
+        finally:
+            self._turn_finished(completed)
+        await self._send_json(writer, 200, {"content": reply}, keep_alive)
+
+    async def _stream_turn(self, session: Session, content: str, writer: asyncio.StreamWriter, keep_alive: bool):
+        """流式：以SSE逐段转发上游的 token，回复完整后才写入历史"""
+        head = ["HTTP/1.1 200 OK", "Content-Type: text/event-stream; charset=utf-8", "Cache-Control: no-cache",
+                "Transfer-Encoding: chunked", f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                "X-Accel-Buffering: no"]
+
+        async def event(name: str, payload: dict[str, Any]):
+            data = f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+            await self._write(writer, b"%x\r\n%s\r\n" % (len(data), data))
+
+        self._turn_started()
+        completed = False
+        try:
+            async with session.lock:
+                await self._write(writer, ("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                turn = await self._begin_turn(session, content)
+                parts: list[str] = []
+                usage = None
+                try:
+                    async with self._upstream:
+                        stream = await self.async_client.chat.completions.create(
+                            model=turn.model, messages=cast(Any, turn.messages), temperature=self.temperature,
+                            stream=True, stream_options={"include_usage": True},
+                        )
+                        try:
+                            async for chunk in stream:
+                                if chunk.usage is not None:
+                                    usage = chunk.usage
+                                delta = chunk.choices[0].delta.content if chunk.choices else None
+                                if delta:
+                                    parts.append(delta)
+                                    # 客户端读得慢时这里会等待，上游流也随之暂停
+                                    await event("token", {"delta": delta})
+                        finally:
+                            await stream.close()
+                except (ConnectionError, asyncio.TimeoutError, asyncio.CancelledError):
+                    # 客户端断开/写入超时/网关关闭：撤销这一轮，连接由上层关闭
+                    session.conversation.cancel_turn(turn)
+                    raise
+                except Exception as e:
+                    session.conversation.cancel_turn(turn)
+                    await event("error", {"error": f"upstream error: {type(e).__name__}: {e}"})
+                else:
+                    await self._run_blocking(session.conversation.end_turn, turn, "".join(parts), usage)
+                    completed = True
+                    await event("done", {
+                        "content": "".join(parts), "model": turn.model,
+                        "usage": usage.model_dump() if usage is not None else None,
+                    })
+                await self._write(writer, b"0\r\n\r\n")
+        finally:
+            self._turn_finished(completed)
+
+
+async def _load_test(host: str, port: int, streams: int) -> tuple[int, int, float]:
+    """开 streams 个并发连接，每个创建会话、发送一轮并读完SSE流，返回 (成功数, token事件数, 耗时)"""
+
+    async def request(reader, writer, method: str, path: str, body: dict[str, Any]) -> tuple[int, bytes]:
+        data = json.dumps(body).encode("utf-8")
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+        head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+        status = int(head.split(" ", 2)[1])
+        headers = {line.split(":", 1)[0].lower(): line.split(":", 1)[1].strip()
+                   for line in head.split("\r\n")[1:] if ":" in line}
+        if headers.get("transfer-encoding") == "chunked":
+            payload = b""
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).strip(), 16)
+                chunk = await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                payload += chunk[:-2]
+            return status, payload
+        return status, await reader.readexactly(int(headers.get("content-length") or 0))
+
+    async def one_client(i: int) -> int:
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            status, body = await request(reader, writer, "POST", "/sessions", {"system_prompt": "Be brief."})
+            session_id = json.loads(body)["session_id"]
+            # 同一个 keep-alive 连接上发送消息
+            status, body = await request(reader, writer, "POST", f"/sessions/{session_id}/messages",
+                                         {"content": f"Hi there! #{i}"})
+            text = body.decode("utf-8")
+            return text.count("event: token") if status == 200 and "event: done" in text else -1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one_client(i) for i in range(streams)), return_exceptions=True)
+    tokens = [r for r in results if isinstance(r, int) and r >= 0]
+    return len(tokens), sum(tokens), time.perf_counter() - start
+
+
+async def _main(args: argparse.Namespace):
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+    stub = None
+    if args.stub:
+        from stub_llm_server import StubLLMServer
+
+        stub = StubLLMServer().start()
+        base_url, api_key = stub.base_url, "stub"
+    else:
+        base_url, api_key = args.base_url, os.getenv("DEEPSEEK_API_KEY", "")
+        if not api_key:
+            raise SystemExit("❌ 请设置 DEEPSEEK_API_KEY，或使用 --stub 连接本地桩服务器")
+
+    limits = httpx.Limits(max_connections=args.max_concurrent, max_keepalive_connections=args.max_concurrent)
+    async_client = AsyncOpenAI(api_key=api_key, base_url=base_url,
+                               http_client=httpx.AsyncClient(limits=limits, timeout=60.0))
+    sync_client = OpenAI(api_key=api_key, base_url=base_url)  # 只用于后台摘要
+
+    gateway = ChatGateway(
+        async_client, lambda system_prompt: SimpleConversation(sync_client, system_prompt=system_prompt),
+        max_concurrent_turns=args.max_concurrent,
+    )
+    await gateway.start(args.host, args.port)
+    host, port = gateway.address
+    print(f"🚪 Chat gateway listening on http://{host}:{port}（上游 {base_url}）")
+
+    try:
+        if args.load:
+            ok, tokens, elapsed = await _load_test(host, port, args.load)
+            print(f"📈 {args.load} 个并发SSE流：{ok} 个完成，{tokens} 个token事件，耗时 {elapsed:.2f}s")
+        else:
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, stop.set)
+            print("   按 Ctrl+C 优雅关闭（等待进行中的流结束）")
+            await stop.wait()
+    finally:
+        await gateway.shutdown(args.drain_timeout)
+        await async_client.close()
+        if stub is not None:
+            stub.stop()
+        print(f"👋 已关闭：完成 {gateway.completed_turns} 轮，撤销 {gateway.aborted_turns} 轮")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="异步HTTP对话网关（SSE）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--base-url", default=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"), help="上游OpenAI兼容地址")
+    parser.add_argument("--stub", action="store_true", help="使用本地桩服务器作为上游")
+    parser.add_argument("--max-concurrent", type=int, default=1000, help="同时进行的上游调用上限")
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="关闭时等待进行中流的秒数")
+    parser.add_argument("--load", type=int, default=0, metavar="N", help="启动后开N个并发流压测，然后退出")
+    args = parser.parse_args()
+    if args.load and args.port == 8080:
+        args.port = 0  # 压测时自动选择空闲端口
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
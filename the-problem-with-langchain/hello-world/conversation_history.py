@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+可分叉的对话历史 - 结构共享（copy-on-write），fork() 是O(1)
+
+对话经常需要分叉：用两个system prompt做A/B测试，或者让用户"从这里重试"。
+之前 SimpleConversation.get_history() 每次都 .copy() 整个列表，
+InMemoryChatMessageHistory 也没有分叉的能力，每个分支都复制一份完整历史。
+
+MessageLog 把历史存成一条不可变的单向链表（每个节点指向上一条消息）：
+- append 新建一个节点指向当前末尾，O(1)，从不修改已有节点
+- fork 只复制末尾指针，O(1)；分支之间共享共同前缀，
+  内存只随分叉之后新增的消息增长，而不是 分支数 × 历史长度
+- truncate(n) 把末尾指针移回第n条消息，用于"从这里重试"
+- trim(keep) 只保留最近 keep 条：先移动可见起点，被隐藏的节点超过 keep 个时
+  才把窗口复制成一条新链，让旧前缀可以被回收（均摊O(1)）
+
+用法:
+    log = MessageLog()
+    log.append({"role": "user", "content": "Hi"})
+    retry = log.fork()               # O(1)，共享已有的消息
+    retry.truncate(0)
+
+    # LangChain：替换 InMemoryChatMessageHistory
+    store["a"] = forkable_chat_history()
+    store["b"] = store["a"].fork()
+"""
+
+import functools
+from typing import Any, Iterable, Iterator, Optional
+
+
+class _Node:
+    """链表节点：一条消息 + 上一个节点；创建后不再修改"""
+
+    __slots__ = ("message", "parent", "depth")
+
+    def __init__(self, message: Any, parent: Optional["_Node"]):
+        self.message = message
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 1
+
+
+class MessageLog:
+    """结构共享的消息历史；每个实例是指向某个链表节点的可变"游标\""""
+
+    def __init__(self, messages: Iterable[Any] = ()):
+        self._tail: Optional[_Node] = None
+        self._floor = 0  # 深度不大于 floor 的节点已被 trim 隐藏
+        for message in messages:
+            self.append(message)
+
+    def __len__(self) -> int:
+        return self._tail.depth - self._floor if self._tail is not None else 0
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.to_list())
+
+    def __repr__(self) -> str:
+        return f"MessageLog({len(self)} messages)"
+
+    def append(self, message: Any):
+        """追加一条消息（不影响其他分支）"""
+        self._tail = _Node(message, self._tail)
+
+    def extend(self, messages: Iterable[Any]):
+        for message in messages:
+            self.append(message)
+
+    def fork(self) -> "MessageLog":
+        """O(1) 分叉：新分支与当前分支共享全部已有消息"""
+        branch = MessageLog()
+        branch._tail = self._tail
+        branch._floor = self._floor
+        return branch
+
+    def _nodes(self, count: Optional[int] = None) -> list[_Node]:
+        """从末尾往前取最多 count 个可见节点（按时间顺序返回）"""
+        nodes = []
+        node = self._tail
+        while node is not None and node.depth > self._floor and (count is None or len(nodes) < count):
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
+
+    def to_list(self) -> list[Any]:
+        """按时间顺序返回可见消息（新列表，O(n)）"""
+        return [node.message for node in self._nodes()]
+
+    def last(self, count: int) -> list[Any]:
+        """最近 count 条消息，只遍历这 count 个节点"""
+        return [node.message for node in self._nodes(count)] if count > 0 else []
+
+    def truncate(self, length: int):
+        """只保留前 length 条可见消息（"从这里重试"），其他分支不受影响"""
+        node = self._tail
+        for _ in range(max(0, len(self) - max(0, length))):
+            assert node is not None
+            node = node.parent
+        self._tail = node
+
+    def clear(self):
+        self._tail = None
+        self._floor = 0
+
+    def trim(self, keep: int) -> list[Any]:
+        """
+        只保留最近 keep 条消息，返回被移出窗口的消息（按时间顺序）
+
+        被隐藏的节点累计超过 keep 个时，把窗口复制成一条新链，
+        旧前缀在没有其他分支引用时即可被回收，单个分支的内存不超过 2*keep 个节点。
+        """
+        excess = len(self) - keep
+        if excess <= 0:
+            return []
+        visible = self._nodes()
+        evicted = [node.message for node in visible[:excess]]
+        self._floor += excess
+        if self._floor > keep:
+            self._tail = None
+            self._floor = 0
+            self.extend(node.message for node in visible[excess:])
+        return evicted
+
+    @staticmethod
+    def node_count(*logs: "MessageLog") -> int:
+        """多个分支实际占用的节点数（共享的节点只算一次），用于观察内存"""
+        seen: set[int] = set()
+        for log in logs:
+            node = log._tail
+            while node is not None and id(node) not in seen:
+                seen.add(id(node))
+                node = node.parent
+        return len(seen)
+
+
+@functools.lru_cache(maxsize=None)
+def _forkable_history_class():
+    """延迟导入LangChain：不用LangChain时本模块不依赖它"""
+    from langchain_core.chat_history import BaseChatMessageHistory
+    from langchain_core.messages import BaseMessage
+
+    class ForkableChatMessageHistory(BaseChatMessageHistory):
+        """以 MessageLog 存储的 BaseChatMessageHistory，可直接放进 get_session_history 的 store"""
+
+        def __init__(self, log: Optional[MessageLog] = None):
+            self.log = log if log is not None else MessageLog()
+
+        @property
+        def messages(self) -> list[BaseMessage]:  # type: ignore[override]
+            return self.log.to_list()
+
+        def add_message(self, message: BaseMessage) -> None:
+            self.log.append(message)
+
+        def add_messages(self, messages: Any) -> None:
+            self.log.extend(messages)
+
+        def clear(self) -> None:
+            self.log.clear()
+
+        def fork(self) -> "ForkableChatMessageHistory":
+            """O(1) 分叉出一个新会话，共享已有的消息"""
+            return ForkableChatMessageHistory(self.log.fork())
+
+    return ForkableChatMessageHistory
+
+
+def forkable_chat_history(log: Optional[MessageLog] = None) -> Any:
+    """创建可分叉的LangChain对话历史（InMemoryChatMessageHistory 的替代）"""
+    return _forkable_history_class()(log)
+
+
+def main():
+    """100个分支共享一段长历史，对比复制列表和结构共享的内存"""
+    import sys
+    import time
+
+    history_length, branches, divergence = 2000, 100, 4
+    base = MessageLog({"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"}
+                      for i in range(history_length))
+
+    start = time.perf_counter()
+    forks = [base.fork() for _ in range(branches)]
+    fork_time = time.perf_counter() - start
+    for i, branch in enumerate(forks):
+        for j in range(divergence):
+            branch.append({"role": "user", "content": f"branch {i} message {j}"})
+
+    copies = [base.to_list() for _ in range(branches)]
+    list_bytes = sum(sys.getsizeof(copy) for copy in copies)
+    node_bytes = MessageLog.node_count(base, *forks) * sys.getsizeof(_Node("", None))
+    print(f"🌿 {branches} 个分支 × {history_length} 条历史，每个分支新增 {divergence} 条")
+    print(f"   fork: 共 {fork_time * 1e6:.0f}µs")
+    print(f"   复制列表: {list_bytes / 1024:.0f} KB（仅列表本身，每个分支 {history_length} 个引用）")
+    print(f"   结构共享: {MessageLog.node_count(base, *forks)} 个节点，{node_bytes / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
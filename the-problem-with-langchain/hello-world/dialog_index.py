@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+对话记录检索 - 为 dialogs/ 下的会话记录建立可持久化的全文索引
+
+dialogs/ 里的每个markdown文件是一次会话，"## Me:" 之后是用户的提问，
+"## Cursor with claude sonnet 4.5:"、"## Assistant:" 等标题之后是助手的回答。
+部署环境中这样的记录会积累成千上万份，把整份记录塞进prompt既慢又贵。
+
+DialogIndex 的做法：
+- 增量索引：只重新索引 mtime/大小变化且内容哈希确实改变的文件，删除已不存在的文件
+- 按说话人切分成 Me / assistant 轮次，每轮是一条索引记录
+- SQLite FTS5 持久化索引：英文按单词、中文按相邻两字切分，支持关键词和 "短语" 查询，按BM25排序
+- build_context() 把命中的回答连同对应的提问整理成一段简短的上下文，
+  可作为 SimpleConversation 的 retriever，回答"之前是怎么修好X的"这类问题
+
+用法:
+    index = DialogIndex()
+    index.update()
+    for hit in index.search('"handle_parsing_errors" agent'):
+        print(hit.path, hit.speaker, hit.snippet)
+
+    conversation = SimpleConversation(client, retriever=index.build_context)
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_DIALOGS_DIR = Path(__file__).resolve().parents[2] / "dialogs"
+# 索引是可以随时重建的缓存，放在用户缓存目录而不是源码目录
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "the-problem-with-langchain"
+DEFAULT_DB_PATH = CACHE_DIR / "dialog_index.sqlite"
+
+# 说话人标题："## Me:"、"## Me (removed the 2 lines):"、"## Cursor with claude sonnet 4.5:" 等
+_SPEAKER_RE = re.compile(r"^##[ \t]+(?P<speaker>[^\n#*]{1,60}?)[ \t]*:[ \t]*$", re.MULTILINE)
+_WORD_RE = re.compile(r"[a-z0-9_]+|[㐀-鿿豈-﫿]+")
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿]")
+_QUERY_RE = re.compile(r'"([^"]+)"|(\S+)')
+
+# 自然语言提问（"how did we fix X before"）中的虚词不参与检索；短语中的词不过滤
+_STOPWORDS = frozenset(
+    "a an and are as at be before by can did do does for from had has have how i in is it me my of on or "
+    "the to was we what when where which who why will with you".split()
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    turns INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS turns USING fts5(
+    tokens,
+    path UNINDEXED,
+    turn_index UNINDEXED,
+    speaker UNINDEXED,
+    role UNINDEXED,
+    text UNINDEXED,
+    tokenize = 'unicode61'
+);
+"""
+
+
+@dataclass
+class Turn:
+    """会话记录中的一轮发言"""
+    index: int
+    speaker: str  # 标题中的说话人，如 "Me"、"Cursor with claude sonnet 4.5"
+    role: str  # "user" 或 "assistant"
+    text: str
+
+
+@dataclass
+class DialogHit:
+    """一条检索结果"""
+    path: str  # 相对于 dialogs 目录的文件名
+    turn_index: int
+    speaker: str
+    role: str
+    score: float  # BM25得分，越大越相关
+    snippet: str
+    text: str
+
+
+@dataclass
+class IndexUpdate:
+    """一次增量索引的结果"""
+    scanned: int = 0
+    indexed: int = 0  # 新增或内容改变、重新索引的文件
+    unchanged: int = 0
+    removed: int = 0
+    turns: int = 0  # 本次写入的轮次数
+    seconds: float = 0.0
+
+
+def split_turns(markdown: str) -> list[Turn]:
+    """按说话人标题把一份会话记录切分成轮次；第一个标题之前的内容忽略"""
+    matches = list(_SPEAKER_RE.finditer(markdown))
+    turns = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(markdown)
+        text = markdown[match.end():end].strip()
+        if not text:
+            continue
+        speaker = match.group("speaker").strip()
+        role = "user" if re.match(r"me\b", speaker, re.IGNORECASE) else "assistant"
+        turns.append(Turn(index=len(turns), speaker=speaker, role=role, text=text))
+    return turns
+
+
+def tokenize(text: str) -> list[str]:
+    """英文/数字按单词切分并转小写，连续的中文按相邻两字切分（单个汉字保留为一个词）"""
+    tokens = []
+    for word in _WORD_RE.findall(text.lower()):
+        if _CJK_RE.match(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def _fts_phrase(tokens: list[str]) -> str:
+    """把词序列转换成FTS5短语（词必须连续出现）"""
+    return '"' + " ".join(tokens) + '"'
+
+
+def parse_query(query: str) -> tuple[list[list[str]], list[str]]:
+    """
+    解析查询：引号中的内容是短语，其余部分的每个词（中文为每两个字）都是独立的关键词
+
+    Returns:
+        (每个查询项的词序列, 用于生成摘要的原始查询项)
+    """
+    terms, raw = [], []
+    for phrase, word in _QUERY_RE.findall(query):
+        if phrase:
+            tokens = tokenize(phrase)
+            if tokens:
+                terms.append(tokens)
+                raw.append(phrase)
+            continue
+        tokens = [t for t in tokenize(word) if t not in _STOPWORDS]
+        terms.extend([token] for token in tokens)
+        raw.extend(tokens)
+    return terms, raw
+
+
+def _make_snippet(text: str, raw_terms: list[str], width: int = 160) -> str:
+    """截取第一个命中词附近的一段文字"""
+    lowered = text.lower()
+    positions = [p for p in (lowered.find(term.lower()) for term in raw_terms) if p >= 0]
+    start = max(min(positions) - width // 4, 0) if positions else 0
+    snippet = " ".join(text[start:start + width].split())
+    return ("…" if start > 0 else "") + snippet + ("…" if start + width < len(text) else "")
+
+
+class DialogIndex:
+    """dialogs/ 会话记录的增量全文索引"""
+
+    def __init__(self, dialogs_dir: Path = DEFAULT_DIALOGS_DIR, db_path: Path = DEFAULT_DB_PATH):
+        """
+        Args:
+            dialogs_dir: 会话记录所在目录（*.md）
+            db_path: 索引文件路径（SQLite）
+        """
+        self.dialogs_dir = Path(dialogs_dir)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # 检索可能来自 SimpleConversation 的后台线程，连接允许跨线程使用（只读查询）
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.executescript(_SCHEMA)
+
+    def update(self) -> IndexUpdate:
+        """增量索引：只处理新增、修改和删除的文件"""
+        started = time.perf_counter()
+        result = IndexUpdate()
+        known = {row[0]: row[1:] for row in self.conn.execute("SELECT path, mtime_ns, size, sha256 FROM files")}
+
+        with self.conn:
+            seen = set()
+            for file in sorted(self.dialogs_dir.glob("*.md")):
+                result.scanned += 1
+                path = file.name
+                seen.add(path)
+                stat = file.stat()
+                previous = known.get(path)
+                if previous is not None and previous[0] == stat.st_mtime_ns and previous[1] == stat.st_size:
+                    result.unchanged += 1
+                    continue
+
+                data = file.read_bytes()
+                digest = hashlib.sha256(data).hexdigest()
+                if previous is not None and previous[2] == digest:
+                    # 只是被touch过，内容没变：更新mtime即可
+                    self.conn.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?",
+                                      (stat.st_mtime_ns, stat.st_size, path))
+                    result.unchanged += 1
+                    continue
+
+                turns = split_turns(data.decode("utf-8", errors="replace"))
+                self.conn.execute("DELETE FROM turns WHERE path = ?", (path,))
+                self.conn.executemany(
+                    "INSERT INTO turns (tokens, path, turn_index, speaker, role, text) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(" ".join(tokenize(turn.text)), path, turn.index, turn.speaker, turn.role, turn.text)
+                     for turn in turns],
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO files (path, mtime_ns, size, sha256, turns) VALUES (?, ?, ?, ?, ?)",
+                    (path, stat.st_mtime_ns, stat.st_size, digest, len(turns)),
+                )
+                result.indexed += 1
+                result.turns += len(turns)
+
+            for path in set(known) - seen:
+                self.conn.execute("DELETE FROM turns WHERE path = ?", (path,))
+                self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                result.removed += 1
+
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def rebuild(self) -> IndexUpdate:
+        """清空索引后重新索引全部文件"""
+        with self.conn:
+            self.conn.execute("DELETE FROM turns")
+            self.conn.execute("DELETE FROM files")
+        return self.update()
+
+    def search(self, query: str, limit: int = 5, role: Optional[str] = None) -> list[DialogHit]:
+        """
+        按BM25排序检索轮次
+
+        所有查询项都命中的结果优先；一条都没有时退回到命中任意一项。
+
+        Args:
+            query: 关键词，用引号括起来的部分按短语匹配，如 '"max_iterations" agent'
+            limit: 最多返回几条
+            role: 只检索 "user" 或 "assistant" 的发言，None表示不限
+        """
+        terms, raw_terms = parse_query(query)
+        if not terms:
+            return []
+
+        phrases = [_fts_phrase(tokens) for tokens in terms]
+        sql = ("SELECT path, turn_index, speaker, role, text, bm25(turns) FROM turns "
+               "WHERE turns MATCH ?" + (" AND role = ?" if role else "") + " ORDER BY bm25(turns) LIMIT ?")
+        for operator in (" AND ", " OR "):
+            params: list = [operator.join(phrases)] + ([role] if role else []) + [limit]
+            rows = self.conn.execute(sql, params).fetchall()
+            if rows or len(phrases) == 1:
+                break
+
+        return [
+            DialogHit(path=path, turn_index=turn_index, speaker=speaker, role=turn_role, score=-rank,
+                      snippet=_make_snippet(text, raw_terms), text=text)
+            for path, turn_index, speaker, turn_role, text, rank in rows
+        ]
+
+    def question_for(self, hit: DialogHit) -> Optional[str]:
+        """找到某条助手回答之前最近的一条用户提问"""
+        row = self.conn.execute(
+            "SELECT text FROM turns WHERE path = ? AND role = 'user' AND turn_index < ? "
+            "ORDER BY turn_index DESC LIMIT 1",
+            (hit.path, hit.turn_index),
+        ).fetchone()
+        return row[0] if row else None
+
+    def build_context(self, query: str, limit: int = 3, max_chars: int = 2000) -> str:
+        """
+        为prompt准备检索上下文：命中的回答片段 + 对应的提问，总长度不超过 max_chars
+
+        没有命中时返回空字符串（SimpleConversation 不会注入任何内容）。
+        """
+        hits = self.search(query, limit=limit, role="assistant") or self.search(query, limit=limit)
+        if not hits:
+            return ""
+
+        per_hit = max_chars // len(hits)
+        blocks = []
+        for hit in hits:
+            question = self.question_for(hit) if hit.role == "assistant" else None
+            header = f"[{hit.path} #{hit.turn_index}]"
+            if question:
+                header += f" Q: {' '.join(question.split())[:per_hit // 4]}"
+            body = _make_snippet(hit.text, parse_query(query)[1], width=per_hit - len(header))
+            blocks.append(f"{header}\n{body}")
+        return "Relevant excerpts from earlier sessions:\n\n" + "\n\n".join(blocks)
+
+    def stats(self) -> dict[str, int]:
+        """索引中的文件数和轮次数"""
+        files, turns = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(turns), 0) FROM files").fetchone()
+        return {"files": files, "turns": turns}
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检索 dialogs/ 会话记录")
+    parser.add_argument("query", nargs="?", help='查询，如 \'"handle_parsing_errors" agent\'')
+    parser.add_argument("--dialogs", type=Path, default=DEFAULT_DIALOGS_DIR, help="会话记录目录")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help="索引文件路径")
+    parser.add_argument("--limit", type=int, default=5, help="返回条数")
+    parser.add_argument("--role", choices=["user", "assistant"], help="只检索某一方的发言")
+    parser.add_argument("--rebuild", action="store_true", help="重新索引全部文件")
+    parser.add_argument("--ask", action="store_true", help="把检索结果作为上下文，用DeepSeek回答问题")
+    args = parser.parse_args()
+
+    index = DialogIndex(args.dialogs, args.db)
+    update = index.rebuild() if args.rebuild else index.update()
+    stats = index.stats()
+    print(f"📚 索引 {stats['files']} 个文件 / {stats['turns']} 轮：本次重新索引 {update.indexed} 个，"
+          f"未变化 {update.unchanged} 个，删除 {update.removed} 个（{update.seconds * 1000:.1f}ms）")
+    if not args.query:
+        return
+
+    start = time.perf_counter()
+    hits = index.search(args.query, limit=args.limit, role=args.role)
+    print(f"🔍 {len(hits)} 条结果（{(time.perf_counter() - start) * 1000:.2f}ms）\n")
+    for hit in hits:
+        print(f"  {hit.score:6.2f}  {hit.path} #{hit.turn_index} [{hit.speaker}]")
+        print(f"          {hit.snippet}\n")
+
+    if args.ask:
+        from openai import OpenAI
+        from simple_conversation import SimpleConversation
+
+        client = OpenAI(api_key=os.environ.get("DEEPSEEK_API_KEY"), base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"))
+        conversation = SimpleConversation(
+            client,
+            system_prompt="Answer using the excerpts from earlier sessions when they are relevant. "
+                          "Cite the file name of the excerpt you used.",
+            retriever=index.build_context,
+        )
+        print(f"🤖 {conversation.chat(args.query)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+文档问答 - 分块、持久化索引、按token预算挑选上下文
+
+learn-AI-app-dev-from-scratch/ 下的参考文档（why-not-langchain-by-guangyi-li.md、
+langchain-on-thoughtworks-tech-radar.md）很长，整篇粘进prompt既慢又贵，
+而且文档越多，每个问题的prompt就越大。
+
+这里的流程：
+1. 流式分块：逐行读取markdown，按标题切分章节，章节内按段落、过长的段落再按句子切分；
+   代码块保持完整。每个块记录所属的标题路径
+2. 持久化索引：块写入 SQLite FTS5（与 dialog_index 相同的分词方式），文件内容不变时不重新索引
+3. 上下文打包：先取BM25得分最高的若干候选块，再用0/1背包在token预算内选出总得分最高的组合，
+   按原文顺序拼接
+4. 打包好的上下文作为 SimpleConversation 的 retriever 注入本轮请求
+
+每个问题的上下文token数不超过预算，与语料库的大小无关。
+
+用法:
+    index = DocIndex()
+    index.update()
+    conversation = SimpleConversation(client, retriever=lambda q: index.build_context(q, budget_tokens=600))
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from dialog_index import CACHE_DIR, parse_query, tokenize
+
+DEFAULT_DOCS_DIR = Path(__file__).resolve().parents[2] / "learn-AI-app-dev-from-scratch"
+DEFAULT_DB_PATH = CACHE_DIR / "doc_index.sqlite"
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+# 句子边界：中文句末标点之后，或者后面跟着空白的英文句点（URL、版本号、文件名中的 "." 不算）
+_SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[。！？!?；;])|(?<=\.)(?=\s)")
+_CJK_RE = re.compile(r"[㐀-鿿豈-﫿　-〿＀-￯]")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    chunks INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+    tokens,
+    path UNINDEXED,
+    position UNINDEXED,
+    heading UNINDEXED,
+    text UNINDEXED,
+    n_tokens UNINDEXED,
+    tokenize = 'unicode61'
+);
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文约一个字一个token，其余约4个字符一个token"""
+    cjk = len(_CJK_RE.findall(text))
+    return max(1, cjk + (len(text) - cjk) // 4)
+
+
+@dataclass
+class Chunk:
+    """文档中的一个块"""
+    path: str  # 相对于文档目录的文件名
+    position: int  # 在文件中的序号，用于按原文顺序拼接
+    heading: str  # 标题路径，如 "Apr 2024, Hold"
+    text: str
+    n_tokens: int
+    score: float = 0.0  # 检索得分（仅检索结果有值）
+
+
+@dataclass
+class PackResult:
+    """一次上下文打包的结果"""
+    candidates: int = 0
+    chunks: list[Chunk] = field(default_factory=list)
+    tokens: int = 0  # 打包后上下文的token数（含每块的标题行）
+    score: float = 0.0
+
+
+def _split_sentences(text: str, max_tokens: int) -> list[str]:
+    """
+    把过长的段落按句子切分，再把相邻的句子合并到不超过 max_tokens
+
+    切分不丢弃任何字符："".join(返回值) 与原文完全相同，空白留在片段的首尾，由调用方去掉。
+    """
+    pieces, current = [], ""
+    for sentence in _SENTENCE_BOUNDARY_RE.split(text):
+        if current.strip() and estimate_tokens(current + sentence) > max_tokens:
+            pieces.append(current)
+            current = ""
+        current += sentence
+    if current:
+        pieces.append(current)
+    assert "".join(pieces) == text, "sentence splitting must not drop text"
+    return pieces
+
+
+def iter_chunks(lines: Iterable[str], path: str, max_tokens: int = 200) -> Iterator[Chunk]:
+    """
+    流式分块：逐行读取，不需要把整篇文档读进内存
+
+    - 遇到标题时结束当前块，标题路径随层级更新
+    - 段落之间在块满时切分；超过 max_tokens 的段落按句子切分
+    - 代码块不切分（单独超长时自成一块）
+    """
+    headings: list[tuple[int, str]] = []
+    blocks: list[str] = []  # 当前块中的段落
+    block_tokens = 0
+    paragraph: list[str] = []
+    in_fence = False
+    position = 0
+
+    def heading_path() -> str:
+        return " > ".join(title for _, title in headings)
+
+    def flush() -> Iterator[Chunk]:
+        nonlocal blocks, block_tokens, position
+        if blocks:
+            text = "\n\n".join(blocks)
+            yield Chunk(path=path, position=position, heading=heading_path(), text=text,
+                        n_tokens=estimate_tokens(text))
+            position += 1
+        blocks, block_tokens = [], 0
+
+    def add_paragraph() -> Iterator[Chunk]:
+        nonlocal paragraph, block_tokens
+        text = "\n".join(paragraph).strip()
+        paragraph = []
+        if not text:
+            return
+        is_code = bool(_FENCE_RE.match(text))
+        pieces = [text] if is_code or estimate_tokens(text) <= max_tokens else _split_sentences(text, max_tokens)
+        for piece in pieces:
+            piece = piece.strip()
+            if not piece:
+                continue
+            tokens = estimate_tokens(piece)
+            if blocks and block_tokens + tokens > max_tokens:
+                yield from flush()
+            blocks.append(piece)
+            block_tokens += tokens
+
+    for raw_line in lines:
+        line = raw_line.rstrip("\n")
+        if _FENCE_RE.match(line):
+            if not in_fence:
+                # 代码块前的文字是一个单独的段落
+                yield from add_paragraph()
+            paragraph.append(line)
+            in_fence = not in_fence
+            if not in_fence:
+                yield from add_paragraph()
+            continue
+        if in_fence:
+            paragraph.append(line)
+            continue
+
+        heading = _HEADING_RE.match(line)
+        if heading:
+            yield from add_paragraph()
+            yield from flush()
+            level = len(heading.group(1))
+            headings = [(lvl, title) for lvl, title in headings if lvl < level] + [(level, heading.group(2))]
+        elif not line.strip():
+            yield from add_paragraph()
+        else:
+            paragraph.append(line)
+
+    yield from add_paragraph()
+    yield from flush()
+
+
+def pack_chunks(candidates: list[Chunk], budget_tokens: int, granularity: int = 8) -> PackResult:
+    """
+    0/1背包：在 budget_tokens 内选出得分总和最高的块
+
+    每块的重量是它的token数加上标题行的开销，按 granularity 个token取整以控制动态规划的规模。
+    """
+    result = PackResult(candidates=len(candidates))
+    capacity = budget_tokens // granularity
+    if capacity <= 0 or not candidates:
+        return result
+
+    weights = [-(-(chunk.n_tokens + _header_tokens(chunk)) // granularity) for chunk in candidates]
+    best = [0.0] * (capacity + 1)
+    taken = [[False] * (capacity + 1) for _ in candidates]
+    for i, (chunk, weight) in enumerate(zip(candidates, weights)):
+        for room in range(capacity, weight - 1, -1):
+            value = best[room - weight] + chunk.score
+            if value > best[room]:
+                best[room] = value
+                taken[i][room] = True
+
+    room = capacity
+    for i in range(len(candidates) - 1, -1, -1):
+        if taken[i][room]:
+            result.chunks.append(candidates[i])
+            room -= weights[i]
+
+    result.chunks.sort(key=lambda chunk: (chunk.path, chunk.position))
+    result.tokens = sum(chunk.n_tokens + _header_tokens(chunk) for chunk in result.chunks)
+    result.score = sum(chunk.score for chunk in result.chunks)
+    return result
+
+
+def _chunk_header(chunk: Chunk) -> str:
+    return f"[{chunk.path}" + (f" § {chunk.heading}" if chunk.heading else "") + "]"
+
+
+def _header_tokens(chunk: Chunk) -> int:
+    return estimate_tokens(_chunk_header(chunk)) + 1
+
+
+class DocIndex:
+    """markdown文档的分块全文索引"""
+
+    def __init__(
+        self,
+        docs_dir: Path = DEFAULT_DOCS_DIR,
+        db_path: Path = DEFAULT_DB_PATH,
+        max_chunk_tokens: int = 200,
+    ):
+        """
+        Args:
+            docs_dir: 文档目录（*.md）
+            db_path: 索引文件路径（SQLite）
+            max_chunk_tokens: 每块的token上限（超长的代码块除外）
+        """
+        self.docs_dir = Path(docs_dir)
+        self.db_path = Path(db_path)
+        self.max_chunk_tokens = max_chunk_tokens
+        self.last_pack: Optional[PackResult] = None
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.executescript(_SCHEMA)
+
+    def update(self) -> dict[str, int]:
+        """增量索引：只重新分块内容改变的文件，删除已不存在的文件"""
+        counts = {"indexed": 0, "unchanged": 0, "removed": 0, "chunks": 0}
+        known = {row[0]: row[1:] for row in self.conn.execute("SELECT path, mtime_ns, size, sha256 FROM files")}
+
+        with self.conn:
+            seen = set()
+            for file in sorted(self.docs_dir.glob("*.md")):
+                path = file.name
+                seen.add(path)
+                stat = file.stat()
+                previous = known.get(path)
+                if previous is not None and previous[:2] == (stat.st_mtime_ns, stat.st_size):
+                    counts["unchanged"] += 1
+                    continue
+
+                digest = hashlib.sha256(file.read_bytes()).hexdigest()
+                if previous is not None and previous[2] == digest:
+                    self.conn.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE path = ?",
+                                      (stat.st_mtime_ns, stat.st_size, path))
+                    counts["unchanged"] += 1
+                    continue
+
+                self.conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+                n_chunks = 0
+                with open(file, encoding="utf-8", errors="replace") as f:
+                    for chunk in iter_chunks(f, path, self.max_chunk_tokens):
+                        self.conn.execute(
+                            "INSERT INTO chunks (tokens, path, position, heading, text, n_tokens) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (" ".join(tokenize(f"{chunk.heading}\n{chunk.text}")), path, chunk.position,
+                             chunk.heading, chunk.text, chunk.n_tokens),
+                        )
+                        n_chunks += 1
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO files (path, mtime_ns, size, sha256, chunks) VALUES (?, ?, ?, ?, ?)",
+                    (path, stat.st_mtime_ns, stat.st_size, digest, n_chunks),
+                )
+                counts["indexed"] += 1
+                counts["chunks"] += n_chunks
+
+            for path in set(known) - seen:
+                self.conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+                self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                counts["removed"] += 1
+        return counts
+
+    def search(self, query: str, limit: int = 20) -> list[Chunk]:
+        """按BM25检索候选块（任意查询项命中即可，按得分排序）"""
+        terms, _ = parse_query(query)
+        if not terms:
+            return []
+        match = " OR ".join('"' + " ".join(tokens) + '"' for tokens in terms)
+        rows = self.conn.execute(
+            "SELECT path, position, heading, text, n_tokens, bm25(chunks) FROM chunks "
+            "WHERE chunks MATCH ? ORDER BY bm25(chunks) LIMIT ?",
+            (match, limit),
+        ).fetchall()
+        return [Chunk(path=path, position=position, heading=heading, text=text, n_tokens=n_tokens, score=-rank)
+                for path, position, heading, text, n_tokens, rank in rows]
+
+    def build_context(self, query: str, budget_tokens: int = 600, candidates: int = 20) -> str:
+        """
+        检索并在token预算内打包上下文；没有命中时返回空字符串
+
+        打包结果保存在 last_pack 中，便于查看选了哪些块、用了多少token。
+        """
+        self.last_pack = pack_chunks(self.search(query, limit=candidates), budget_tokens)
+        if not self.last_pack.chunks:
+            return ""
+        return "Reference excerpts:\n\n" + "\n\n".join(
+            f"{_chunk_header(chunk)}\n{chunk.text}" for chunk in self.last_pack.chunks
+        )
+
+    def stats(self) -> dict[str, int]:
+        """索引中的文件数和块数"""
+        files, chunks = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(chunks), 0) FROM files").fetchone()
+        return {"files": files, "chunks": chunks}
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基于参考文档回答问题")
+    parser.add_argument("question", help="问题，如 'LangChain为什么被技术雷达移除？'")
+    parser.add_argument("--docs", type=Path, default=DEFAULT_DOCS_DIR, help="文档目录")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help="索引文件路径")
+    parser.add_argument("--budget", type=int, default=600, help="上下文token预算")
+    parser.add_argument("--dry-run", action="store_true", help="只打印打包好的上下文，不调用API")
+    args = parser.parse_args()
+
+    index = DocIndex(args.docs, args.db)
+    counts = index.update()
+    stats = index.stats()
+    print(f"📚 索引 {stats['files']} 个文档 / {stats['chunks']} 块（本次重新索引 {counts['indexed']} 个文档）")
+
+    start = time.perf_counter()
+    context = index.build_context(args.question, budget_tokens=args.budget)
+    pack = index.last_pack
+    assert pack is not None
+    print(f"📦 {pack.candidates} 个候选块中选了 {len(pack.chunks)} 块，{pack.tokens}/{args.budget} tokens"
+          f"（{(time.perf_counter() - start) * 1000:.2f}ms）")
+    for chunk in pack.chunks:
+        print(f"   {chunk.score:6.2f}  {_chunk_header(chunk)}  {chunk.n_tokens} tokens")
+
+    if args.dry_run:
+        print(f"\n{context}")
+        return
+
+    from openai import OpenAI
+    from simple_conversation import SimpleConversation
+
+    client = OpenAI(api_key=os.environ.get("DEEPSEEK_API_KEY"), base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"))
+    conversation = SimpleConversation(
+        client,
+        system_prompt="Answer the question using the reference excerpts. "
+                      "If they do not contain the answer, say so.",
+        retriever=lambda _question: context,
+    )
+    print(f"\n🤖 {conversation.chat(args.question)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+多端点池 - 按实时健康度加权的负载均衡 + 每个端点的熔断器
+
+所有脚本都写死了 base_url="https://api.deepseek.com" 和一个API密钥，
+而我们有多个密钥，还有一个自建的OpenAI兼容镜像。
+
+EndpointPool 以 httpx transport 的形式接入（同步和异步各一个），OpenAI SDK 和 ChatOpenAI 两条路径共用：
+- 客户端的 base_url 指向占位地址，每个请求发出前由 transport 选择一个端点，
+  改写URL、Authorization（以及可选的模型名）
+- 选择权重 = 配置权重 / 延迟（EWMA） × 成功率² / (1 + 进行中的请求数)，慢的或出错多的端点自动少分流量
+- 熔断器：连续失败 failure_threshold 次后打开，open_seconds 内不再分配请求；
+  之后进入半开状态，只放一个探测请求，成功则恢复，失败则重新打开
+- 连接错误、5xx、429 在其他端点上重试（最多 max_attempts 次），一个坏端点不会拖累整体的p99
+
+用法:
+    pool = EndpointPool([
+        Endpoint("key-a", "https://api.deepseek.com", os.environ["DEEPSEEK_API_KEY"]),
+        Endpoint("key-b", "https://api.deepseek.com", os.environ["DEEPSEEK_API_KEY_2"]),
+        Endpoint("mirror", "http://10.0.0.5:8000/v1", "local", model="deepseek-chat-local"),
+    ])
+    client = pool.openai_client()          # OpenAI SDK
+    aclient = pool.async_openai_client()   # AsyncOpenAI
+    llm = pool.chat_openai(model="deepseek-chat", temperature=0)   # LangChain（invoke 和 ainvoke 都经过端点池）
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import httpx
+
+# 客户端使用的占位 base_url，真正的地址由 transport 按端点改写
+POOL_BASE_URL = "http://endpoint-pool.invalid"
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+@dataclass
+class Endpoint:
+    """一个OpenAI兼容端点（一个密钥或一个镜像）"""
+    name: str
+    base_url: str
+    api_key: str
+    weight: float = 1.0  # 配置权重，如按密钥的配额比例设置
+    model: Optional[str] = None  # 该端点使用不同的模型名时改写请求体中的 model
+
+    # 运行时的健康状态（由 EndpointPool 维护）
+    latency_ewma: float = 0.5  # 秒；到响应头的时间
+    error_ewma: float = 0.0  # 最近请求的失败比例
+    consecutive_failures: int = 0
+    state: str = CLOSED
+    opened_at: float = 0.0
+    probing: bool = False  # 半开状态下是否已有探测请求在进行
+    generation: int = 0  # 熔断器状态每变化一次加1；请求结果只影响它发出时所在的那一代
+    in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+    trips: int = 0  # 熔断器打开的次数
+    last_error: str = field(default="", repr=False)
+
+
+class EndpointPool:
+    """端点池：选择端点、记录结果、维护熔断器"""
+
+    def __init__(
+        self,
+        endpoints: list[Endpoint],
+        failure_threshold: int = 3,
+        open_seconds: float = 10.0,
+        ewma_alpha: float = 0.2,
+        max_attempts: int = 2,
+    ):
+        """
+        Args:
+            endpoints: 端点列表
+            failure_threshold: 连续失败多少次后打开熔断器
+            open_seconds: 熔断器打开多久后进入半开状态
+            ewma_alpha: 延迟和错误率的EWMA平滑系数（越大越看重最近的请求）
+            max_attempts: 单个请求最多尝试几个不同的端点
+        """
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.ewma_alpha = ewma_alpha
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+    # ---- 选择与记录 ----
+    def _score(self, endpoint: Endpoint) -> float:
+        success = 1.0 - min(endpoint.error_ewma, 0.95)
+        return endpoint.weight * success * success / ((endpoint.latency_ewma + 0.01) * (1 + endpoint.in_flight))
+
+    def _set_state(self, endpoint: Endpoint, state: str):
+        """切换熔断器状态；之前发出的请求的结果从此不再改变状态"""
+        if state == OPEN:
+            endpoint.trips += 1
+            endpoint.opened_at = time.monotonic()
+        endpoint.state = state
+        endpoint.probing = False
+        endpoint.generation += 1
+
+    def choose(self, exclude: tuple[Endpoint, ...] = ()) -> Optional[tuple[Endpoint, int]]:
+        """
+        按健康度加权随机选择一个可用端点，返回 (端点, 熔断器代数)；没有可用端点时返回None
+
+        代数要原样传给 record_success / record_failure。
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = []
+            for endpoint in self.endpoints:
+                if endpoint in exclude:
+                    continue
+                if endpoint.state == OPEN and now - endpoint.opened_at >= self.open_seconds:
+                    self._set_state(endpoint, HALF_OPEN)
+                if endpoint.state == CLOSED or (endpoint.state == HALF_OPEN and not endpoint.probing):
+                    candidates.append(endpoint)
+            if not candidates:
+                return None
+
+            # 半开的端点优先用来探测，否则它永远等不到恢复的机会
+            probes = [endpoint for endpoint in candidates if endpoint.state == HALF_OPEN]
+            if probes:
+                chosen = probes[0]
+                chosen.probing = True
+            else:
+                chosen = random.choices(candidates, weights=[self._score(e) for e in candidates])[0]
+            chosen.in_flight += 1
+            chosen.requests += 1
+            return chosen, chosen.generation
+
+    # 延迟和错误率的EWMA总是更新；熔断器状态只由当前这一代的请求改变：
+    # 熔断前发出的慢请求成功了不能关闭已打开的熔断器，失败了也不能放出第二个探测请求。
+    # 半开状态下当前代只有探测请求这一个。
+    def record_success(self, endpoint: Endpoint, latency: float, generation: int):
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.latency_ewma += self.ewma_alpha * (latency - endpoint.latency_ewma)
+            endpoint.error_ewma *= 1 - self.ewma_alpha
+            if generation != endpoint.generation:
+                return
+            endpoint.consecutive_failures = 0
+            if endpoint.state == HALF_OPEN:
+                self._set_state(endpoint, CLOSED)
+
+    def release(self, endpoint: Endpoint, generation: int):
+        """请求被调用方取消、没有结果：只归还进行中的计数；取消的若是探测请求，允许再放一个"""
+        with self._lock:
+            endpoint.in_flight -= 1
+            if generation == endpoint.generation and endpoint.state == HALF_OPEN:
+                endpoint.probing = False
+
+    def record_failure(self, endpoint: Endpoint, latency: float, error: str, generation: int):
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.failures += 1
+            endpoint.last_error = error
+            endpoint.latency_ewma += self.ewma_alpha * (latency - endpoint.latency_ewma)
+            endpoint.error_ewma += self.ewma_alpha * (1.0 - endpoint.error_ewma)
+            if generation != endpoint.generation:
+                return
+            endpoint.consecutive_failures += 1
+            if endpoint.state == HALF_OPEN or endpoint.consecutive_failures >= self.failure_threshold:
+                self._set_state(endpoint, OPEN)
+
+    # ---- 客户端 ----
+    def transport(self) -> "PoolTransport":
+        return PoolTransport(self)
+
+    def async_transport(self) -> "AsyncPoolTransport":
+        return AsyncPoolTransport(self)
+
+    def openai_client(self, **kwargs: Any):
+        """创建经过端点池的OpenAI客户端（SDK自身不再重试，由端点池换端点重试）"""
+        from openai import OpenAI
+
+        kwargs.setdefault("max_retries", 0)
+        return OpenAI(api_key="endpoint-pool", base_url=POOL_BASE_URL,
+                      http_client=httpx.Client(transport=self.transport(), timeout=kwargs.pop("timeout", 60.0)),
+                      **kwargs)
+
+    def async_openai_client(self, **kwargs: Any):
+        """创建经过端点池的AsyncOpenAI客户端"""
+        from openai import AsyncOpenAI
+
+        kwargs.setdefault("max_retries", 0)
+        return AsyncOpenAI(api_key="endpoint-pool", base_url=POOL_BASE_URL,
+                           http_client=httpx.AsyncClient(transport=self.async_transport(),
+                                                         timeout=kwargs.pop("timeout", 60.0)),
+                           **kwargs)
+
+    def chat_openai(self, **kwargs: Any):
+        """创建经过端点池的ChatOpenAI；同步和异步客户端都要替换，否则 ainvoke/astream 会发往占位地址"""
+        from langchain_openai import ChatOpenAI
+
+        kwargs.setdefault("max_retries", 0)
+        timeout = kwargs.pop("timeout", 60.0)
+        return ChatOpenAI(openai_api_key="endpoint-pool", openai_api_base=POOL_BASE_URL,
+                          http_client=httpx.Client(transport=self.transport(), timeout=timeout),
+                          http_async_client=httpx.AsyncClient(transport=self.async_transport(), timeout=timeout),
+                          **kwargs)
+
+    def report(self) -> str:
+        lines = []
+        for e in self.endpoints:
+            lines.append(f"   {e.name:<10} {e.state:<9} {e.requests:>4} req, {e.failures:>3} failed, "
+                         f"latency {e.latency_ewma * 1000:6.1f}ms, error rate {e.error_ewma:.0%}, "
+                         f"tripped {e.trips}x" + (f"  ({e.last_error})" if e.state != CLOSED else ""))
+        return "\n".join(lines)
+
+
+def _retryable(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def _rewrite(request: httpx.Request, endpoint: Endpoint, body: bytes) -> httpx.Request:
+    """把发往占位地址的请求改写为发往 endpoint 的请求"""
+    base = httpx.URL(endpoint.base_url)
+    url = base.copy_with(path=base.path.rstrip("/") + request.url.path, query=request.url.query or None)
+    headers = httpx.Headers(request.headers)
+    headers["authorization"] = f"Bearer {endpoint.api_key}"
+    headers["host"] = base.netloc.decode("ascii")
+    if endpoint.model and body:
+        payload = json.loads(body)
+        payload["model"] = endpoint.model
+        body = json.dumps(payload).encode("utf-8")
+    headers["content-length"] = str(len(body))
+    return httpx.Request(request.method, url, headers=headers, content=body, extensions=request.extensions)
+
+
+class PoolTransport(httpx.BaseTransport):
+    """把发往占位地址的请求改写到端点池选出的端点，失败时换一个端点重试"""
+
+    def __init__(self, pool: EndpointPool):
+        self.pool = pool
+        self._inner = httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        tried: tuple[Endpoint, ...] = ()
+        last_error: Optional[Exception] = None
+        response: Optional[httpx.Response] = None
+
+        for _ in range(self.pool.max_attempts):
+            chosen = self.pool.choose(exclude=tried)
+            if chosen is None:
+                break
+            endpoint, generation = chosen
+            tried += (endpoint,)
+            started = time.monotonic()
+            try:
+                response = self._inner.handle_request(_rewrite(request, endpoint, body))
+            except httpx.TransportError as e:
+                self.pool.record_failure(endpoint, time.monotonic() - started, f"{type(e).__name__}: {e}", generation)
+                last_error = e
+                continue
+
+            latency = time.monotonic() - started
+            if _retryable(response.status_code):
+                self.pool.record_failure(endpoint, latency, f"HTTP {response.status_code}", generation)
+                if len(tried) < self.pool.max_attempts:
+                    response.close()
+                    continue
+                return response
+            self.pool.record_success(endpoint, latency, generation)
+            return response
+
+        if response is not None:
+            return response
+        if last_error is not None:
+            raise last_error
+        raise httpx.ConnectError("no healthy endpoint available (all circuit breakers open)", request=request)
+
+    def close(self):
+        self._inner.close()
+
+
+class AsyncPoolTransport(httpx.AsyncBaseTransport):
+    """PoolTransport 的异步版本（AsyncOpenAI、ChatOpenAI 的 ainvoke/astream 使用），选择和重试逻辑相同"""
+
+    def __init__(self, pool: EndpointPool):
+        self.pool = pool
+        self._inner = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        tried: tuple[Endpoint, ...] = ()
+        last_error: Optional[Exception] = None
+        response: Optional[httpx.Response] = None
+
+        for _ in range(self.pool.max_attempts):
+            chosen = self.pool.choose(exclude=tried)
+            if chosen is None:
+                break
+            endpoint, generation = chosen
+            tried += (endpoint,)
+            started = time.monotonic()
+            try:
+                response = await self._inner.handle_async_request(_rewrite(request, endpoint, body))
+            except httpx.TransportError as e:
+                self.pool.record_failure(endpoint, time.monotonic() - started, f"{type(e).__name__}: {e}", generation)
+                last_error = e
+                continue
+            except asyncio.CancelledError:
+                self.pool.release(endpoint, generation)
+                raise
+
+            latency = time.monotonic() - started
+            if _retryable(response.status_code):
+                self.pool.record_failure(endpoint, latency, f"HTTP {response.status_code}", generation)
+                if len(tried) < self.pool.max_attempts:
+                    await response.aclose()
+                    continue
+                return response
+            self.pool.record_success(endpoint, latency, generation)
+            return response
+
+        if response is not None:
+            return response
+        if last_error is not None:
+            raise last_error
+        raise httpx.ConnectError("no healthy endpoint available (all circuit breakers open)", request=request)
+
+    async def aclose(self):
+        await self._inner.aclose()
+
+
+def main():
+    """三个端点：一个正常、一个较慢、一个不可用，观察流量分配和熔断"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from stub_llm_server import StubLLMServer, default_responder
+
+    parser = argparse.ArgumentParser(description="多端点池演示")
+    parser.add_argument("--requests", type=int, default=60, help="总请求数")
+    parser.add_argument("--workers", type=int, default=6, help="并发数")
+    args = parser.parse_args()
+
+    def slow_responder(body: dict[str, Any]) -> dict[str, Any]:
+        time.sleep(0.15)
+        return default_responder(body)
+
+    with StubLLMServer() as fast, StubLLMServer(responder=slow_responder) as slow:
+        pool = EndpointPool([
+            Endpoint("fast", fast.base_url, "key-a"),
+            Endpoint("slow", slow.base_url, "key-b"),
+            Endpoint("down", "http://127.0.0.1:9", "key-c"),  # 没有服务监听的端口
+        ], open_seconds=1.0)
+        client = pool.openai_client()
+
+        def one_request(i: int) -> float:
+            start = time.perf_counter()
+            client.chat.completions.create(
+                model="deepseek-chat", messages=[{"role": "user", "content": f"Request {i}"}], max_tokens=32,
+            )
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            latencies = sorted(executor.map(one_request, range(args.requests)))
+
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        print(f"🌐 {args.requests} 个请求全部成功，p50 {p50:.1f}ms，p99 {p99:.1f}ms")
+
+        # 异步路径：ChatOpenAI 的 ainvoke / astream 走 AsyncPoolTransport
+        llm = pool.chat_openai(model="deepseek-chat", max_tokens=32)
+
+        async def async_requests() -> tuple[int, int]:
+            replies = await asyncio.gather(*(llm.ainvoke(f"Async request {i}") for i in range(args.workers)))
+            chunks = [chunk async for chunk in llm.astream("Async stream")]
+            return len(replies), len(chunks)
+
+        replies, chunks = asyncio.run(async_requests())
+        print(f"⚡ 异步: {replies} 个 ainvoke 成功，astream 收到 {chunks} 个分块")
+    print(pool.report())
+
+
+if __name__ == "__main__":
+    main()
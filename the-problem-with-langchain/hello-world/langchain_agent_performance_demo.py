@@ -29,7 +29,7 @@ if not os.environ.get("DEEPSEEK_API_KEY"):
 
 # 设置为DeepSeek API
 os.environ["OPENAI_API_KEY"] = os.environ["DEEPSEEK_API_KEY"]
-os.environ["OPENAI_API_BASE"] = "https://api.deepseek.com"
+os.environ["OPENAI_API_BASE"] = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 
 if not os.environ.get("SERPAPI_API_KEY"):
     print("⚠️  警告：未设置SERPAPI_API_KEY环境变量")
@@ -78,16 +78,21 @@ try:
     from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
     from langchain_core.messages import HumanMessage, AIMessage
     import json
+    from agent_tracing import Tracer, trace_path
+    
+    # 记录每一步（LLM调用、解析、工具执行）的耗时，导出为Chrome trace
+    tracer = Tracer("manual-react-loop")
     
     print("\n执行结果:")
     print("⏱️  开始计时...")
     start = time.time()
+    run_span = tracer.start_span("agent.run", category="agent")
     
     llm = ChatOpenAI(
         temperature=0,
         model="deepseek-chat",
         openai_api_key=os.environ.get("DEEPSEEK_API_KEY"),
-        openai_api_base="https://api.deepseek.com"
+        openai_api_base=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
     )
     
     # 定义一个简单的计算工具
@@ -111,23 +116,31 @@ Otherwise, provide the final answer directly."""
     
     print("\n🤖 第1次API调用 - 让AI决定是否使用工具:")
     print("-" * 80)
-    response1 = llm.invoke(messages)
+    with tracer.span("llm.invoke#1", category="llm") as span:
+        response1 = llm.invoke(messages)
+        span.args.update(response1.usage_metadata or {})
     print(f"AI响应: {response1.content[:100]}...")
     api_calls = 1
     
     # 检查是否需要使用工具
     try:
-        if "{" in response1.content and "tool" in response1.content.lower():
+        with tracer.span("parse", category="parse") as span:
+            wants_tool = "{" in response1.content and "tool" in response1.content.lower()
+            span.args["wants_tool"] = wants_tool
+        if wants_tool:
             # AI想使用工具
             messages.append(AIMessage(content=response1.content))
             
             # 执行计算
-            result = calculator("25*4")
+            with tracer.span("tool:Calculator", category="tool", input="25*4"):
+                result = calculator("25*4")
             messages.append(HumanMessage(content=f"Calculator result: {result}"))
             
             print(f"\n🤖 第2次API调用 - 提供工具结果，获取最终答案:")
             print("-" * 80)
-            response2 = llm.invoke(messages)
+            with tracer.span("llm.invoke#2", category="llm") as span:
+                response2 = llm.invoke(messages)
+                span.args.update(response2.usage_metadata or {})
             print(f"AI响应: {response2.content[:100]}...")
             api_calls += 1
             final_answer = response2.content
@@ -139,10 +152,16 @@ Otherwise, provide the final answer directly."""
     print("-" * 80)
     
     elapsed = time.time() - start
+    tracer.end_span(run_span, api_calls=api_calls)
     print(f"\n✅ 最终答案: {final_answer}")
     print(f"⏱️  总耗时: {elapsed:.2f}秒")
     print(f"📊 总API调用次数: {api_calls}次")
     
+    tracer.print_summary()
+    trace_file = trace_path("agent_trace.json")
+    tracer.save(trace_file)
+    print(f"📁 时间线已保存到 {trace_file}（用 chrome://tracing 或 ui.perfetto.dev 打开）")
+    
     print("\n💡 分析:")
     print(f"   1. 这个简单的数学问题需要{api_calls}次API调用")
     print("   2. 每次调用都会产生延迟和费用")
@@ -150,7 +169,23 @@ Otherwise, provide the final answer directly."""
     print("   4. 但在旧版 LangChain 中，agent.run() 会隐藏这些调用")
     print("   5. LangChain 1.x 废弃了旧的 Agent API，现在需要手动实现")
     print("   6. 这使得调用更透明，但也失去了原本的简化优势")
-    
+
+    # 同样的问题模板反复出现时，第一次调用（决定用哪个工具、输入是什么）可以缓存
+    from plan_cache import PlanCachedAgent
+
+    print("\n🗂️  计划缓存：同一问题模板重复出现时跳过规划调用")
+    print("-" * 80)
+    agent = PlanCachedAgent(llm, {"Calculator": calculator}, system_prompt)
+    cached_calls = 0
+    questions = ["What is 25 multiplied by 4?", "What is 12 multiplied by 3?",
+                 "What is 7 multiplied by 9?", "What is 123 multiplied by 456?"]
+    for question in questions:
+        result = agent.run(question)
+        cached_calls += result.api_calls
+        print(f"   {result.status:>4}  {result.api_calls}次API调用  {question} → {result.answer[:60]}")
+    print(f"   共 {cached_calls} 次API调用（不缓存需要 {2 * len(questions)} 次）")
+    print(f"   📊 {agent.cache.stats.report()}")
+
 except Exception as e:
     print(f"❌ 演示执行失败: {e}")
     print("\n💡 说明:")
@@ -17,7 +17,7 @@ if not os.environ.get("DEEPSEEK_API_KEY"):
 
 # 设置为DeepSeek API
 os.environ["OPENAI_API_KEY"] = os.environ["DEEPSEEK_API_KEY"]
-os.environ["OPENAI_API_BASE"] = "https://api.deepseek.com"
+os.environ["OPENAI_API_BASE"] = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 
 print("=" * 80)
 print("LangChain Hello World 缺点对比演示")
@@ -79,7 +79,7 @@ try:
     
     client = OpenAI(
         api_key=os.environ.get("DEEPSEEK_API_KEY"),
-        base_url="https://api.deepseek.com"
+        base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
     )
     
     print("\n执行结果:")
@@ -331,7 +331,7 @@ try:
     
     client = OpenAI(
         api_key=os.environ.get("DEEPSEEK_API_KEY"),
-        base_url="https://api.deepseek.com"
+        base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
     )
     
     print("\n执行结果:")
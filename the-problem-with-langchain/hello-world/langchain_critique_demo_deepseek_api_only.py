@@ -31,7 +31,7 @@ print()
 # 初始化DeepSeek客户端
 client = OpenAI(
     api_key=os.environ.get("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
+    base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 )
 
 # ============================================================================
@@ -281,79 +281,8 @@ print("🚀 进阶示例: 实现实用的对话历史管理")
 print("-" * 80)
 print()
 
-class SimpleConversation:
-    """简单的对话管理类 - 展示如何优雅地封装对话逻辑"""
-    
-    def __init__(self, client: OpenAI, system_prompt: str = "", max_history: int = 20):
-        """
-        初始化对话
-        
-        Args:
-            client: OpenAI客户端实例
-            system_prompt: 系统提示词
-            max_history: 最大保留的历史消息数（不包括system消息）
-        """
-        self.client = client
-        self.max_history = max_history
-        self.messages: list[dict[str, Any]] = []
-        
-        if system_prompt:
-            self.messages.append({"role": "system", "content": system_prompt})
-    
-    def chat(self, user_input: str, temperature: float = 0.7) -> str:
-        """
-        发送消息并获取回复
-        
-        Args:
-            user_input: 用户输入
-            temperature: 温度参数
-            
-        Returns:
-            AI的回复内容
-        """
-        # 添加用户消息
-        self.messages.append({"role": "user", "content": user_input})
-        
-        # 调用API
-        response = self.client.chat.completions.create(
-            model="deepseek-chat",
-            messages=cast(Any, self.messages),
-            temperature=temperature
-        )
-        
-        # 获取AI回复
-        assistant_response = response.choices[0].message.content or ""
-        self.messages.append({"role": "assistant", "content": assistant_response})
-        
-        # 限制历史长度（保留system消息）
-        self._trim_history()
-        
-        return assistant_response
-    
-    def _trim_history(self):
-        """保持历史消息在限制范围内"""
-        # 找到system消息
-        system_messages = [msg for msg in self.messages if msg["role"] == "system"]
-        other_messages = [msg for msg in self.messages if msg["role"] != "system"]
-        
-        # 如果超过最大历史数，保留最近的消息
-        if len(other_messages) > self.max_history:
-            other_messages = other_messages[-self.max_history:]
-        
-        # 重新组合
-        self.messages = system_messages + other_messages
-    
-    def get_history(self) -> list[dict[str, Any]]:
-        """获取对话历史"""
-        return self.messages.copy()
-    
-    def clear_history(self, keep_system: bool = True):
-        """清除对话历史"""
-        if keep_system:
-            system_messages = [msg for msg in self.messages if msg["role"] == "system"]
-            self.messages = system_messages
-        else:
-            self.messages = []
+from model_router import ModelRouter
+from simple_conversation import SimpleConversation
 
 print("代码示例:")
 print("""
@@ -425,10 +354,79 @@ print(f"\n📝 最终对话历史: {len(conv.get_history())} 条消息")
 print("\n💡 进阶方案的优势:")
 print("   ✓ 封装了常用的对话管理逻辑")
 print("   ✓ 自动管理历史长度，避免token溢出")
-print("   ✓ 代码简洁（不到50行），易于理解和修改")
+print("   ✓ 核心的 chat() 只有十几行，其余是可选功能（摘要、检索、路由、分叉），都是普通Python，易于理解和修改")
 print("   ✓ 完全透明，没有隐藏的魔法")
 print("   ✓ 可以轻松扩展（如添加流式输出、保存到数据库等）")
 
+# ============================================================================
+# 进阶示例: 后台摘要压缩旧对话
+# ============================================================================
+print("\n" + "=" * 80)
+print("🚀 进阶示例: 后台摘要压缩旧对话（compaction=True）")
+print("-" * 80)
+print("问题: 超过 max_history 后最早的消息被直接丢弃，AI会忘记早期的事实")
+print("解决: 被淘汰的消息在后台线程中总结成滚动摘要，下一轮开始时原子生效")
+print()
+
+compact_conv = SimpleConversation(
+    client,
+    system_prompt="You are a helpful and concise assistant.",
+    max_history=2,
+    compaction=True
+)
+
+compact_inputs = [
+    "My name is Ada and my favourite number is 42.",
+    "What is 5 + 3?",
+    "What is my name and my favourite number?"
+]
+
+for user_input in compact_inputs:
+    print(f"\n👤 User: {user_input}")
+    start = time.time()
+    response = compact_conv.chat(user_input, temperature=0)
+    elapsed = time.time() - start
+    print(f"🤖 AI: {response}")
+    print(f"⏱️  耗时: {elapsed:.2f}秒（摘要在后台进行，不计入本轮耗时）")
+    # 演示中等待后台摘要完成，确保下一轮能看到它
+    compact_conv.wait_for_compaction()
+
+print(f"\n📝 当前摘要: {compact_conv.summary}")
+print(f"📝 保留的历史: {len(compact_conv.get_history())} 条消息，摘要已生效 {compact_conv.compaction_count} 次")
+compact_conv.close()
+
+# ============================================================================
+# 进阶示例: 按复杂度路由模型
+# ============================================================================
+print("\n" + "=" * 80)
+print("🚀 进阶示例: 按复杂度路由模型（router=ModelRouter()）")
+print("-" * 80)
+print("问题: 所有请求都固定用 deepseek-chat，简单算式和多步推理用同一个模型")
+print("解决: 本地按长度、数学/代码、推理提示词打分，只有复杂的请求才走推理模型")
+print()
+
+router = ModelRouter()
+routed_conv = SimpleConversation(
+    client,
+    system_prompt="You are a helpful and concise math tutor.",
+    router=router
+)
+
+routed_inputs = [
+    "What is 5 + 3?",
+    "Prove that the sum of two odd numbers is always even, step by step."
+]
+
+for user_input in routed_inputs:
+    print(f"\n👤 User: {user_input}")
+    # 推理模型不支持 temperature：不发送该参数，复杂的问题才能走推理模型
+    response = routed_conv.chat(user_input, temperature=None)
+    print(f"🧭 路由: {routed_conv.last_route.model}")
+    print(f"🤖 AI: {response}")
+
+print("\n📊 各路由统计:")
+print(router.report())
+
 # ============================================================================
 # 总结对比
 # ============================================================================
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+按复杂度路由模型 - 简单的请求走快模型，需要多步推理的才走推理模型
+
+所有调用都固定用 model="deepseek-chat"：数学辅导演示里的 "What is 5 + 3?" 和需要多步推理的问题
+用的是同一个模型。ModelRouter 在本地对每个请求快速打分（不调用任何模型）：
+- 长度：最后一条用户消息和整个上下文的token数
+- 数学：证明、求解、方程等词，或者大量数字（"5 + 3" 这种简单算式不算）
+- 代码：代码块、函数定义、报错堆栈
+- 推理提示词："step by step"、"why"、"compare"、"trade-off" 等
+- 工具计划深度：Agent循环中已经进行了几轮工具调用
+
+得分超过阈值时使用推理模型，否则使用快模型；每条路由分别统计请求数、延迟、token数和估算费用。
+deepseek-reasoner 不支持工具调用，也不支持 temperature 等采样参数：带这些参数的请求即使得分高也走快模型。
+
+用法:
+    router = ModelRouter()
+    conversation = SimpleConversation(client, router=router)
+    agent = SpeculativeAgent(client, tools, schemas, router=router)
+    print(router.report())
+"""
+
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+_MATH_WORDS_RE = re.compile(
+    r"\b(prove|proof|derive|derivative|integral|equation|solve|theorem|probability|optimi[sz]e|matrix|"
+    r"lemma|induction|inequality|limit)\b",
+    re.IGNORECASE,
+)
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_CODE_RE = re.compile(r"```|\bdef \w+\(|\bclass \w+|\bimport \w+|Traceback \(most recent call last\)|[{};]\s*$",
+                      re.MULTILINE)
+_REASONING_RE = re.compile(
+    r"step[- ]by[- ]step|\bwhy\b|\bexplain\b|\bcompare\b|trade-?offs?|\banaly[sz]e\b|\bplan\b|\bdesign\b|"
+    r"\bpros and cons\b|为什么|分析|比较|推导|证明",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class ModelRoute:
+    """一条路由：模型名和价格"""
+    name: str
+    model: str
+    input_cost_per_m: float = 0.0  # 每百万输入token的价格
+    output_cost_per_m: float = 0.0  # 每百万输出token的价格
+    supports_tools: bool = True
+    unsupported_params: tuple[str, ...] = ()  # 模型会报错或忽略的请求参数
+
+    def accepts(self, params: Optional[dict[str, Any]]) -> bool:
+        """这条路由的模型能否处理带有这些参数（tools、temperature等）的请求"""
+        if not params:
+            return True
+        if params.get("tools") and not self.supports_tools:
+            return False
+        return all(params.get(name) is None for name in self.unsupported_params)
+
+
+@dataclass
+class RouteStats:
+    """一条路由的统计"""
+    requests: int = 0
+    latencies: list[float] = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+
+    def latency_percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+@dataclass
+class Complexity:
+    """一次打分的结果"""
+    score: float
+    reasons: list[str]
+
+
+def score_complexity(messages: list[dict[str, Any]], tool_depth: int = 0) -> Complexity:
+    """
+    本地估计一次请求的复杂度
+
+    Args:
+        messages: 要发送的消息列表（只看最后一条用户消息的内容，以及整体长度）
+        tool_depth: Agent循环中已经进行的工具调用轮数
+    """
+    last_user = next((str(m.get("content") or "") for m in reversed(messages) if m.get("role") == "user"), "")
+    context_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 4
+    score, reasons = 0.0, []
+
+    user_tokens = len(last_user) // 4
+    if user_tokens > 150:
+        score += min(user_tokens / 400, 1.0)
+        reasons.append(f"long question ({user_tokens} tokens)")
+    if context_tokens > 3000:
+        score += 0.3
+        reasons.append(f"long context ({context_tokens} tokens)")
+    if _MATH_WORDS_RE.search(last_user):
+        score += 1.0
+        reasons.append("math reasoning")
+    elif len(_NUMBER_RE.findall(last_user)) > 4:
+        score += 0.5
+        reasons.append("many numbers")
+    if _CODE_RE.search(last_user):
+        score += 0.8
+        reasons.append("code")
+    cues = len(_REASONING_RE.findall(last_user))
+    if cues:
+        score += min(0.5 * cues, 1.0)
+        reasons.append(f"{cues} reasoning cue(s)")
+    if tool_depth > 1:
+        score += 0.4 * (tool_depth - 1)
+        reasons.append(f"tool plan depth {tool_depth}")
+    return Complexity(score, reasons)
+
+
+class ModelRouter:
+    """根据复杂度得分在快模型和推理模型之间选择，并按路由统计"""
+
+    def __init__(
+        self,
+        fast: Optional[ModelRoute] = None,
+        reasoning: Optional[ModelRoute] = None,
+        threshold: float = 1.0,
+    ):
+        """
+        Args:
+            fast: 快模型路由（默认 deepseek-chat）
+            reasoning: 推理模型路由（默认 deepseek-reasoner）
+            threshold: 得分达到该值时使用推理模型
+        """
+        self.fast = fast or ModelRoute("fast", "deepseek-chat", 0.27, 1.10)
+        self.reasoning = reasoning or ModelRoute(
+            "reasoning", "deepseek-reasoner", 0.55, 2.19, supports_tools=False,
+            unsupported_params=("temperature", "top_p", "presence_penalty", "frequency_penalty",
+                                "logprobs", "top_logprobs"),
+        )
+        self.threshold = threshold
+        self.stats: dict[str, RouteStats] = {self.fast.name: RouteStats(), self.reasoning.name: RouteStats()}
+        self.downgraded = 0  # 得分够但因参数不支持而改走快模型的请求数
+        self._lock = threading.Lock()
+
+    def route(
+        self,
+        messages: list[dict[str, Any]],
+        tool_depth: int = 0,
+        params: Optional[dict[str, Any]] = None,
+    ) -> ModelRoute:
+        """
+        为这次请求选择路由
+
+        Args:
+            messages: 要发送的消息列表
+            tool_depth: Agent循环中已经进行的工具调用轮数
+            params: 除 model/messages 外的请求参数（tools、temperature等），推理模型处理不了时走快模型
+        """
+        complexity = score_complexity(messages, tool_depth)
+        if complexity.score < self.threshold:
+            return self.fast
+        if not self.reasoning.accepts(params):
+            with self._lock:
+                self.downgraded += 1
+            return self.fast
+        return self.reasoning
+
+    def record(self, route: ModelRoute, latency: float, usage: Any = None):
+        """记录一次调用的延迟和token用量（usage 为响应中的 usage 对象）"""
+        prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+        completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+        with self._lock:
+            stats = self.stats.setdefault(route.name, RouteStats())
+            stats.requests += 1
+            stats.latencies.append(latency)
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+            stats.cost += (prompt_tokens * route.input_cost_per_m + completion_tokens * route.output_cost_per_m) / 1e6
+
+    def report(self) -> str:
+        lines = []
+        for route in (self.fast, self.reasoning):
+            stats = self.stats[route.name]
+            lines.append(
+                f"   {route.name:<10} {route.model:<18} {stats.requests:>3} req, "
+                f"p50 {stats.latency_percentile(0.5):.2f}s, p95 {stats.latency_percentile(0.95):.2f}s, "
+                f"{stats.prompt_tokens}+{stats.completion_tokens} tokens, ${stats.cost:.5f}"
+            )
+        if self.downgraded:
+            lines.append(f"   {self.downgraded} complex request(s) kept on {self.fast.model} "
+                         f"(tools or parameters {self.reasoning.model} does not support)")
+        return "\n".join(lines)
+
+
+def main():
+    """打印几个示例问题的复杂度得分和路由结果（不调用API）"""
+    router = ModelRouter()
+    questions = [
+        "What is 5 + 3?",
+        "What about if I multiply that by 2?",
+        "Prove that the sum of two odd numbers is always even, step by step.",
+        "Why does my code fail?\n```python\ndef f(x):\n    return x / 0\n```",
+        "Compare LangChain and the raw OpenAI SDK and explain the trade-offs.",
+    ]
+    for question in questions:
+        complexity = score_complexity([{"role": "user", "content": question}])
+        route = router.route([{"role": "user", "content": question}])
+        first_line = question.splitlines()[0]
+        print(f"  {complexity.score:4.1f} → {route.model:<18} {first_line[:60]}"
+              + (f"  ({', '.join(complexity.reasons)})" if complexity.reasons else ""))
+
+
+if __name__ == "__main__":
+    main()
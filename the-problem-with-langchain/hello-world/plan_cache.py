@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Agent计划缓存 - 重复出现的问题模板直接复用第一步的工具决策
+
+langchain_agent_performance_demo.py 里 "What is 25 multiplied by 4?" 要两次LLM调用，
+第一次只是决定"用 Calculator，输入 25*4"。线上的问题大多是少数模板反复出现，
+这一步的决策对同一个模板几乎总是一样的。
+
+PlanCache 把问题规范化成模板（数字和引号内的内容替换成槽位），缓存第一步的工具决策：
+- 工具输入按槽位存储，"What is 7 multiplied by 9?" 命中后渲染成 7*9
+- 命中时跳过规划调用，直接执行工具，只为最终回答调用一次LLM；
+  学到的回答模板稳定时（工具结果原样出现在回答里），连最终回答也在本地渲染
+- 置信度保护：
+  * 同一模板在 min_agreements 组不同的槽位值上得到相同决策后才开始命中
+    （同一个问题重复问几次不能证明输入是从槽位来的）
+  * 每 verify_every 次命中走一次完整流程做校验，决策变了就重新学习
+  * 槽位值有重复（"5 times 5"，无法确定工具输入里哪个数对应哪个槽位）时不学习
+  * 工具输入里有不对应任何槽位的数字（"25%" 变成 0.25）时不学习
+  * 工具结果恰好等于某个槽位值（10 × 1 = 10）时不学习回答模板，回答里的 10 分不清是哪一个
+  * 命中后工具执行出错时作废该条目，回到完整流程
+- 统计命中率、节省的LLM调用次数
+
+用法:
+    agent = PlanCachedAgent(llm, {"Calculator": calculator}, system_prompt)
+    result = agent.run("What is 25 multiplied by 4?")   # result.answer, result.api_calls, result.status
+    print(agent.cache.stats.report())
+"""
+
+import ast
+import hashlib
+import json
+import operator
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Union
+
+_SLOT_RE = re.compile(r'"([^"\n]+)"|\'([^\'\n]+)\'|(?<![\w.])(-?\d+(?:\.\d+)?)(?!\w|\.\d)')
+_TOOL_DECISION_RE = re.compile(r"\{.*\}", re.DOTALL)
+_NUMBER_RE = re.compile(r"\d")
+
+# 模板片段：字符串是原样输出的文本，整数是槽位序号；RESULT 表示工具结果
+Parts = tuple[Union[str, int], ...]
+RESULT = -1
+
+
+def normalize_question(question: str) -> tuple[str, tuple[str, ...]]:
+    """
+    把问题规范化成 (模板, 槽位值)
+
+    数字和引号内的内容变成槽位，其余部分转小写、合并空白、去掉结尾的标点：
+    "What is 25 multiplied by 4?" → ("what is {0} multiplied by {1}", ("25", "4"))
+    """
+    slots: list[str] = []
+
+    def replace(match: re.Match) -> str:
+        slots.append(next(group for group in match.groups() if group is not None))
+        return "{%d}" % (len(slots) - 1)
+
+    template = _SLOT_RE.sub(replace, question)
+    template = " ".join(template.lower().split()).rstrip("?？!！.。 ")
+    return template, tuple(slots)
+
+
+def _split(text: str, values: dict[str, int]) -> Parts:
+    """把 text 中出现的槽位值替换为槽位序号，得到模板片段"""
+    if not values:
+        return (text,)
+    alternatives = "|".join(re.escape(value) for value in sorted(values, key=len, reverse=True))
+    pattern = re.compile(rf"(?<![\w.])(?:{alternatives})(?![\w]|\.\d)")
+    parts: list[Union[str, int]] = []
+    position = 0
+    for match in pattern.finditer(text):
+        if match.start() > position:
+            parts.append(text[position:match.start()])
+        parts.append(values[match.group()])
+        position = match.end()
+    if position < len(text):
+        parts.append(text[position:])
+    return tuple(parts)
+
+
+def _render(parts: Parts, slots: tuple[str, ...], result: str = "") -> str:
+    return "".join(part if isinstance(part, str) else result if part == RESULT else slots[part] for part in parts)
+
+
+@dataclass
+class ToolPlan:
+    """一次命中给出的第一步决策"""
+    tool: str
+    tool_input: str
+    answer_template: Optional[Parts] = None  # 非None时可以在本地渲染最终回答
+
+    def render_answer(self, slots: tuple[str, ...], result: str) -> Optional[str]:
+        return _render(self.answer_template, slots, result) if self.answer_template is not None else None
+
+
+@dataclass
+class _Entry:
+    tool: str
+    input_parts: Parts
+    answer_parts: Optional[Parts]
+    seen_slots: set[tuple[str, ...]]  # 得到这个决策的完整运行用过的槽位值
+    hits: int = 0
+
+    @property
+    def agreements(self) -> int:
+        """在多少组不同的槽位值上得到了相同的决策"""
+        return len(self.seen_slots)
+
+
+@dataclass
+class PlanCacheStats:
+    """计划缓存的统计"""
+    lookups: int = 0
+    hits: int = 0
+    misses: int = 0  # 没有条目
+    warming: int = 0  # 有条目但置信度还不够
+    verifications: int = 0  # 命中后按 verify_every 走完整流程校验
+    mismatches: int = 0  # 完整运行的决策与缓存不一致
+    invalidations: int = 0  # 命中后工具出错而作废
+    unlearnable: int = 0  # 槽位有歧义、工具输入有不对应槽位的数字、没有调用工具等，不能学习
+    llm_calls_saved: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def report(self) -> str:
+        return (f"{self.lookups} lookups, {self.hits} hits ({self.hit_rate:.0%}), {self.misses} misses, "
+                f"{self.warming} warming, {self.verifications} verified, {self.mismatches} mismatches, "
+                f"{self.invalidations} invalidated, {self.llm_calls_saved} LLM calls saved")
+
+
+class PlanCache:
+    """按问题模板缓存Agent第一步的工具决策（线程安全，LRU淘汰）"""
+
+    def __init__(self, min_agreements: int = 2, verify_every: int = 50, max_entries: int = 10_000):
+        """
+        Args:
+            min_agreements: 在多少组不同的槽位值上得到相同决策之后才开始命中
+            verify_every: 每多少次命中走一次完整流程校验（0 表示不校验）
+            max_entries: 最多缓存的模板数
+        """
+        self.min_agreements = min_agreements
+        self.verify_every = verify_every
+        self.max_entries = max_entries
+        self.stats = PlanCacheStats()
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, question: str, scope: str = "") -> Optional[ToolPlan]:
+        """
+        查找可以直接执行的决策；返回None时调用方应走完整流程，然后调用 record()
+
+        scope 区分不同的Agent（system prompt、工具集不同，决策不能共用）。
+        """
+        template, slots = normalize_question(question)
+        with self._lock:
+            self.stats.lookups += 1
+            entry = self._entries.get((scope, template))
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end((scope, template))
+            if entry.agreements < self.min_agreements:
+                self.stats.warming += 1
+                return None
+            entry.hits += 1
+            if self.verify_every and entry.hits % self.verify_every == 0:
+                self.stats.verifications += 1
+                return None
+            self.stats.hits += 1
+            return ToolPlan(entry.tool, _render(entry.input_parts, slots), entry.answer_parts)
+
+    def record(self, question: str, tool: Optional[str], tool_input: str = "",
+               tool_result: str = "", answer: str = "", scope: str = "") -> bool:
+        """
+        记录一次完整运行的第一步决策（tool 为None表示模型没有调用工具）
+
+        Returns:
+            是否学习了这次决策
+        """
+        template, slots = normalize_question(question)
+        key = (scope, template)
+        with self._lock:
+            if tool is None:
+                # 模型这次没有调用工具，已有的决策不再可信
+                self.stats.unlearnable += 1
+                if self._entries.pop(key, None) is not None:
+                    self.stats.mismatches += 1
+                return False
+            if len(set(slots)) != len(slots):
+                self.stats.unlearnable += 1  # 无法确定工具输入里的值对应哪个槽位，保留已有条目
+                return False
+            values = {value: i for i, value in enumerate(slots)}
+            input_parts = _split(tool_input, values)
+            if any(isinstance(part, str) and _NUMBER_RE.search(part) for part in input_parts):
+                # 模型换算过的数字（25% → 0.25）换了槽位值就不对了，保留已有条目
+                self.stats.unlearnable += 1
+                return False
+            answer_parts = None
+            # 结果等于某个槽位值时，回答里的这个数分不清是结果还是槽位，这次不参与回答模板
+            ambiguous_result = tool_result.strip() in values
+            if tool_result and tool_result in answer and not ambiguous_result:
+                head, _, tail = answer.partition(tool_result)
+                answer_parts = _split(head, values) + (RESULT,) + _split(tail, values)
+
+            entry = self._entries.get(key)
+            if entry is not None and entry.tool == tool and entry.input_parts == input_parts:
+                entry.seen_slots.add(slots)
+                if not ambiguous_result and entry.answer_parts != answer_parts:
+                    entry.answer_parts = None  # 回答措辞不稳定，只在本地渲染稳定的回答
+            else:
+                if entry is not None:
+                    self.stats.mismatches += 1
+                self._entries[key] = _Entry(tool, input_parts, answer_parts, {slots})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def invalidate(self, question: str, scope: str = ""):
+        """作废某个模板的条目（例如命中后工具执行出错）"""
+        template, _ = normalize_question(question)
+        with self._lock:
+            if self._entries.pop((scope, template), None) is not None:
+                self.stats.invalidations += 1
+
+    def saved(self, calls: int):
+        with self._lock:
+            self.stats.llm_calls_saved += calls
+
+
+@dataclass
+class AgentResult:
+    answer: str
+    api_calls: int
+    status: str  # "hit"（命中缓存）、"full"（完整流程）
+    tool: Optional[str] = None
+    tool_input: str = ""
+    tool_result: str = ""
+    trace: list[str] = field(default_factory=list)
+
+
+class PlanCachedAgent:
+    """
+    带计划缓存的两步工具Agent（与 langchain_agent_performance_demo.py 中手写的ReAct循环相同的协议）：
+    模型用 {"tool": "...", "input": "..."} 请求工具，拿到 "<tool> result: ..." 后给出最终回答。
+    """
+
+    def __init__(self, llm: Any, tools: dict[str, Callable[[str], str]], system_prompt: str,
+                 cache: Optional[PlanCache] = None, render_answers: bool = True):
+        """
+        Args:
+            llm: LangChain聊天模型（任何提供 invoke(messages) 并返回带 .content 的对象）
+            tools: 工具名 → 函数
+            system_prompt: 描述工具协议的提示词
+            cache: 计划缓存，多个Agent可以共用一个（按 system prompt 和工具集区分）
+            render_answers: 回答模板稳定时在本地渲染最终回答，不再调用LLM
+        """
+        self.llm = llm
+        self.tools = tools
+        self.system_prompt = system_prompt
+        self.cache = cache if cache is not None else PlanCache()
+        self.render_answers = render_answers
+        fingerprint = json.dumps([system_prompt, sorted(tools)], ensure_ascii=False)
+        self.scope = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def parse_decision(content: str) -> Optional[tuple[str, str]]:
+        """从模型输出中解析工具决策；不是工具调用时返回None"""
+        match = _TOOL_DECISION_RE.search(content)
+        if match is None:
+            return None
+        try:
+            decision = json.loads(match.group())
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(decision, dict) or "tool" not in decision:
+            return None
+        return str(decision["tool"]), str(decision.get("input", ""))
+
+    def _messages(self, question: str, decision: Optional[tuple[str, str]] = None, result: str = ""):
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        messages: list[Any] = [HumanMessage(content=self.system_prompt), HumanMessage(content=question)]
+        if decision is not None:
+            tool, tool_input = decision
+            messages.append(AIMessage(content=json.dumps({"tool": tool, "input": tool_input})))
+            messages.append(HumanMessage(content=f"{tool} result: {result}"))
+        return messages
+
+    def _call_tool(self, tool: str, tool_input: str) -> tuple[str, bool]:
+        """执行工具，返回 (结果, 是否成功)；工具抛出异常或返回 "Error: ..." 都算失败"""
+        try:
+            result = str(self.tools[tool](tool_input))
+        except Exception as e:
+            return f"Error: {e}", False
+        return result, not result.startswith("Error")
+
+    def run(self, question: str) -> AgentResult:
+        plan = self.cache.lookup(question, self.scope)
+        if plan is not None:
+            result, ok = self._call_tool(plan.tool, plan.tool_input) if plan.tool in self.tools else ("", False)
+            if not ok:
+                self.cache.invalidate(question, self.scope)
+                return self._run_full(question)
+            _, slots = normalize_question(question)
+            answer = plan.render_answer(slots, result) if self.render_answers else None
+            trace = [f"cache hit → {plan.tool}({plan.tool_input})"]
+            if answer is None:
+                answer = str(self.llm.invoke(self._messages(question, (plan.tool, plan.tool_input), result)).content)
+                self.cache.saved(1)
+                return AgentResult(answer, 1, "hit", plan.tool, plan.tool_input, result, trace + ["llm: answer"])
+            self.cache.saved(2)
+            return AgentResult(answer, 0, "hit", plan.tool, plan.tool_input, result, trace + ["rendered locally"])
+        return self._run_full(question)
+
+    def _run_full(self, question: str) -> AgentResult:
+        content = str(self.llm.invoke(self._messages(question)).content)
+        decision = self.parse_decision(content)
+        if decision is None or decision[0] not in self.tools:
+            self.cache.record(question, None, scope=self.scope)
+            return AgentResult(content, 1, "full", trace=["llm: plan (no tool)"])
+
+        tool, tool_input = decision
+        result, ok = self._call_tool(tool, tool_input)
+        answer = str(self.llm.invoke(self._messages(question, decision, result)).content)
+        if ok:  # 出错的决策不学习
+            self.cache.record(question, tool, tool_input, result, answer, scope=self.scope)
+        return AgentResult(answer, 2, "full", tool, tool_input, result,
+                           [f"llm: plan → {tool}({tool_input})", "llm: answer"])
+
+
+_ARITHMETIC = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv,
+    ast.UAdd: operator.pos, ast.USub: operator.neg,
+}
+
+
+def _evaluate(node: ast.AST) -> Union[int, float]:
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC:
+        return _ARITHMETIC[type(node.op)](_evaluate(node.left), _evaluate(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _ARITHMETIC:
+        return _ARITHMETIC[type(node.op)](_evaluate(node.operand))
+    raise ValueError(f"unsupported syntax: {type(node).__name__}")
+
+
+def calculator(expression: str) -> str:
+    """
+    只支持四则运算的计算器
+
+    按语法树求值而不是 eval：工具输入来自模型，"9**9**9**9" 这样的幂运算会让 eval 卡住。
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+        return str(_evaluate(tree.body))
+    except (SyntaxError, ValueError) as e:
+        raise ValueError(f"unsupported expression: {expression!r}") from e
+
+
+CALCULATOR_PROMPT = """You are a helpful assistant with access to a Calculator tool.
+When you need to calculate something, respond ONLY with JSON: {"tool": "Calculator", "input": "expression"}
+Otherwise, provide the final answer directly."""
+
+
+def main():
+    """同一个问题模板反复出现：对比完整流程和缓存命中的LLM调用次数"""
+    import os
+    import time
+
+    from langchain_openai import ChatOpenAI
+
+    server = None
+    if os.environ.get("DEEPSEEK_API_KEY"):
+        api_key, base_url = os.environ["DEEPSEEK_API_KEY"], os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+    else:
+        from stub_llm_server import StubLLMServer
+        server = StubLLMServer().start()
+        api_key, base_url = "stub", server.base_url
+        print(f"🧪 未设置DEEPSEEK_API_KEY，使用本地桩服务器 {server.base_url}")
+
+    llm = ChatOpenAI(temperature=0, model="deepseek-chat", openai_api_key=api_key, openai_api_base=base_url)
+    agent = PlanCachedAgent(llm, {"Calculator": calculator}, CALCULATOR_PROMPT)
+    questions = ["What is 25 multiplied by 4?", "What is 12 multiplied by 3?", "what is 7 multiplied by 9",
+                 "What is 5 multiplied by 5?", "What is 40 multiplied by 2.5?", "What is 123 multiplied by 456?",
+                 "What is 18 plus 24?", "What is 30 plus 12?", "What is 99 plus 1?"]
+    try:
+        api_calls = 0
+        start = time.time()
+        for question in questions:
+            result = agent.run(question)
+            api_calls += result.api_calls
+            print(f"{result.status:>4}  {result.api_calls} 次调用  {question:<32} → {result.answer[:60]}")
+        print(f"⏱️  总耗时: {time.time() - start:.2f}秒，LLM调用 {api_calls} 次（不缓存需要 {2 * len(questions)} 次）")
+        print(f"📊 {agent.cache.stats.report()}")
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+客户端限流 - 每分钟请求数和每分钟token数的令牌桶
+
+同时开很多会话时，DeepSeek 会返回429，SDK再盲目重试，负载和延迟都被放大。
+RateLimiter 在每次 chat.completions.create / ChatOpenAI 调用之前排队：
+- 两个令牌桶：请求数（RPM）和token数（TPM），默认只用配额的95%，平稳地跑满而不是超额后重试
+- token数先按prompt长度和 max_tokens 预估，拿到响应后用 usage 校正（多退少补）
+- 公平排队：按到达顺序（FIFO）放行，不会有请求被饿死；额度不够时等待而不是报错
+- 收到429时按 Retry-After 暂停整个桶
+- 可选的跨进程模式：桶状态保存在一个文件中，用文件锁（fcntl.flock）在多个进程之间共享
+
+用法:
+    limiter = RateLimiter(requests_per_min=60, tokens_per_min=100_000)
+    client = RateLimitedClient(OpenAI(...), limiter)              # OpenAI SDK
+    llm = ChatOpenAI(..., callbacks=[limiter.callback_handler()])  # LangChain
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+
+def estimate_prompt_tokens(messages: list[Any]) -> int:
+    """粗略估算prompt的token数（约4个字符一个token，每条消息额外4个）"""
+    total = 0
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else getattr(message, "content", message)
+        total += len(str(content or "")) // 4 + 4
+    return total
+
+
+@dataclass
+class LimiterStats:
+    """限流统计"""
+    requests: int = 0
+    waited: int = 0  # 需要排队等待的请求数
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    estimated_tokens: int = 0
+    actual_tokens: int = 0
+    throttled: int = 0  # 收到的429次数
+
+
+class Reservation:
+    """一次已放行的请求，拿到实际用量后调用 reconcile() 校正token桶"""
+
+    def __init__(self, limiter: "RateLimiter", estimated_tokens: int):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+        self.reconciled = False
+
+    def reconcile(self, actual_tokens: Optional[int]):
+        """用实际token数校正预估值；重复调用或实际值未知时不做任何事"""
+        if self.reconciled or actual_tokens is None:
+            return
+        self.reconciled = True
+        self.limiter._adjust_tokens(actual_tokens - self.estimated_tokens)
+        with self.limiter._stats_lock:
+            self.limiter.stats.actual_tokens += actual_tokens
+
+
+class RateLimiter:
+    """RPM + TPM 双令牌桶，FIFO排队"""
+
+    def __init__(
+        self,
+        requests_per_min: float,
+        tokens_per_min: Optional[float] = None,
+        utilization: float = 0.95,
+        burst_seconds: float = 6.0,
+        state_file: Optional[Path] = None,
+    ):
+        """
+        Args:
+            requests_per_min: 每分钟请求数配额
+            tokens_per_min: 每分钟token数配额，None表示不限
+            utilization: 使用配额的比例（留出余量，避免触发429）
+            burst_seconds: 桶容量相当于多少秒的额度（允许的突发大小）
+            state_file: 跨进程共享时的状态文件；None表示只在本进程内限流
+        """
+        self.request_rate = requests_per_min * utilization / 60.0
+        self.token_rate = tokens_per_min * utilization / 60.0 if tokens_per_min else None
+        self.request_capacity = max(1.0, self.request_rate * burst_seconds)
+        self.token_capacity = self.token_rate * burst_seconds if self.token_rate else None
+        self.state_file = Path(state_file) if state_file else None
+        self.stats = LimiterStats()
+
+        self._state = {"requests": self.request_capacity, "tokens": self.token_capacity or 0.0,
+                       "updated": time.time(), "paused_until": 0.0}
+        self._state_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # FIFO排队：每个请求领一个号，只有排在最前面的请求可以取令牌
+        self._queue = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+
+    # ---- 桶状态（本进程或共享文件）----
+    @contextmanager
+    def _locked_state(self) -> Iterator[dict[str, float]]:
+        with self._state_lock:
+            if self.state_file is None:
+                yield self._state
+                return
+
+            import fcntl  # 只在类Unix系统上可用，跨进程模式才需要
+
+            with open(self.state_file, "a+", encoding="utf-8") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    raw = f.read()
+                    state = json.loads(raw) if raw.strip() else dict(self._state)
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state: dict[str, float], now: float):
+        elapsed = max(0.0, now - state["updated"])
+        state["updated"] = now
+        state["requests"] = min(self.request_capacity, state["requests"] + elapsed * self.request_rate)
+        if self.token_rate:
+            state["tokens"] = min(self.token_capacity, state["tokens"] + elapsed * self.token_rate)
+
+    def _try_take(self, tokens: int) -> float:
+        """额度足够时扣减并返回0，否则返回还需等待的秒数"""
+        with self._locked_state() as state:
+            now = time.time()
+            self._refill(state, now)
+            wait = max(0.0, state["paused_until"] - now)
+            wait = max(wait, (1.0 - state["requests"]) / self.request_rate)
+            # 单个请求超过桶容量时，只要求桶满即可放行（否则永远等不到）
+            needed = min(tokens, self.token_capacity) if self.token_rate else 0
+            if self.token_rate:
+                wait = max(wait, (needed - state["tokens"]) / self.token_rate)
+            if wait > 0:
+                return wait
+            state["requests"] -= 1.0
+            if self.token_rate:
+                state["tokens"] -= tokens
+            return 0.0
+
+    def _adjust_tokens(self, delta: int):
+        """实际用量与预估的差值：正数补扣，负数退回"""
+        if not self.token_rate or delta == 0:
+            return
+        with self._locked_state() as state:
+            self._refill(state, time.time())
+            state["tokens"] = min(self.token_capacity, state["tokens"] - delta)
+
+    # ---- 对外接口 ----
+    def acquire(self, estimated_tokens: int = 0) -> Reservation:
+        """按到达顺序排队，直到请求和token额度都够用；返回用于校正用量的 Reservation"""
+        started = time.perf_counter()
+        with self._queue:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while ticket != self._serving:
+                self._queue.wait()
+
+        try:
+            while True:
+                wait = self._try_take(estimated_tokens)
+                if wait <= 0:
+                    break
+                time.sleep(min(wait, 1.0))
+        finally:
+            with self._queue:
+                self._serving += 1
+                self._queue.notify_all()
+
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self.stats.requests += 1
+            self.stats.estimated_tokens += estimated_tokens
+            if waited > 0.001:
+                self.stats.waited += 1
+                self.stats.wait_seconds += waited
+                self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+        return Reservation(self, estimated_tokens)
+
+    def throttled(self, retry_after: Optional[float] = None):
+        """服务端返回429：在 retry_after 秒内（默认1秒）暂停放行"""
+        with self._locked_state() as state:
+            state["paused_until"] = max(state["paused_until"], time.time() + (retry_after or 1.0))
+            state["requests"] = min(state["requests"], 0.0)
+        with self._stats_lock:
+            self.stats.throttled += 1
+
+    def report(self) -> str:
+        s = self.stats
+        accuracy = f", actual/estimated tokens {s.actual_tokens}/{s.estimated_tokens}" if s.estimated_tokens else ""
+        return (f"{s.requests} requests, {s.waited} queued ({s.wait_seconds:.2f}s total, "
+                f"max {s.max_wait_seconds:.2f}s), {s.throttled} throttled{accuracy}")
+
+    def callback_handler(self, default_completion_tokens: int = 256):
+        """创建LangChain回调处理器：LLM调用开始前排队，结束后用token用量校正"""
+        return _make_callback_handler(self, default_completion_tokens)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """从429异常的响应头中读取 Retry-After（秒）"""
+    response = getattr(error, "response", None)
+    value = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class _LimitedStream:
+    """包装流式响应：从最后一个带 usage 的分块校正token用量"""
+
+    def __init__(self, stream: Any, reservation: Reservation):
+        self._stream = stream
+        self._reservation = reservation
+
+    def __iter__(self):
+        for chunk in self._stream:
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                self._reservation.reconcile(usage.total_tokens)
+            yield chunk
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+class _LimitedCompletions:
+    def __init__(self, completions: Any, limiter: RateLimiter, default_completion_tokens: int):
+        self._completions = completions
+        self._limiter = limiter
+        self._default_completion_tokens = default_completion_tokens
+
+    def create(self, **kwargs: Any) -> Any:
+        completion_tokens = (kwargs.get("max_tokens") or kwargs.get("max_completion_tokens")
+                             or self._default_completion_tokens)
+        reservation = self._limiter.acquire(estimate_prompt_tokens(kwargs.get("messages") or []) + completion_tokens)
+        try:
+            response = self._completions.create(**kwargs)
+        except Exception as e:
+            # 请求失败（429、5xx、超时、连接错误）没有消耗token，退还预估值，否则一串错误会耗尽TPM桶
+            reservation.reconcile(0)
+            if getattr(e, "status_code", None) == 429:
+                self._limiter.throttled(_retry_after(e))
+            raise
+        if kwargs.get("stream"):
+            return _LimitedStream(response, reservation)
+        usage = getattr(response, "usage", None)
+        reservation.reconcile(usage.total_tokens if usage is not None else None)
+        return response
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._completions, name)
+
+
+class _LimitedChat:
+    def __init__(self, chat: Any, limiter: RateLimiter, default_completion_tokens: int):
+        self.completions = _LimitedCompletions(chat.completions, limiter, default_completion_tokens)
+        self._chat = chat
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._chat, name)
+
+
+class RateLimitedClient:
+    """
+    包装OpenAI客户端，让 chat.completions.create 经过限流
+
+    其余属性直接转发给原客户端，可以直接传给 SimpleConversation 等使用客户端的代码。
+    建议原客户端设置较小的 max_retries，429由限流器统一处理。
+    """
+
+    def __init__(self, client: Any, limiter: RateLimiter, default_completion_tokens: int = 256):
+        """
+        Args:
+            client: OpenAI客户端实例
+            limiter: 共享的限流器
+            default_completion_tokens: 请求没有设置 max_tokens 时，预估的回复token数
+        """
+        self._client = client
+        self.limiter = limiter
+        self.chat = _LimitedChat(client.chat, limiter, default_completion_tokens)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+def _usage_total(response: Any) -> Optional[int]:
+    """从LLMResult中取出总token数"""
+    usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+    if usage.get("total_tokens"):
+        return int(usage["total_tokens"])
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return int(metadata.get("total_tokens", 0))
+    return None
+
+
+def _make_callback_handler(limiter: RateLimiter, default_completion_tokens: int):
+    # 延迟导入，没有安装LangChain时本模块的其余部分仍然可用
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class RateLimitCallbackHandler(BaseCallbackHandler):
+        """在LLM调用开始时排队（同步回调在发出请求前执行），结束时校正用量"""
+
+        # 必须在调用线程中执行，排队才能真正挡住请求
+        run_inline = True
+
+        def __init__(self):
+            self._reservations: dict[Any, Reservation] = {}
+
+        def _acquire(self, run_id: Any, prompt_tokens: int, kwargs: dict[str, Any]):
+            params = kwargs.get("invocation_params") or {}
+            completion_tokens = (params.get("max_tokens") or params.get("max_completion_tokens")
+                                 or default_completion_tokens)
+            self._reservations[run_id] = limiter.acquire(prompt_tokens + completion_tokens)
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self._acquire(run_id, sum(estimate_prompt_tokens(batch) for batch in messages), kwargs)
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._acquire(run_id, sum(len(prompt) // 4 for prompt in prompts), kwargs)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            reservation = self._reservations.pop(run_id, None)
+            if reservation is not None:
+                reservation.reconcile(_usage_total(response))
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            reservation = self._reservations.pop(run_id, None)
+            if reservation is not None:
+                reservation.reconcile(0)  # 失败的调用不占用TPM
+            if getattr(error, "status_code", None) == 429:
+                limiter.throttled(_retry_after(error))
+
+    return RateLimitCallbackHandler()
+
+
+def main():
+    """对本地桩服务器并发发请求，观察限流后的实际速率"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from openai import OpenAI
+
+    from stub_llm_server import StubLLMServer
+
+    parser = argparse.ArgumentParser(description="令牌桶限流演示")
+    parser.add_argument("--rpm", type=float, default=300, help="每分钟请求数配额")
+    parser.add_argument("--tpm", type=float, default=20_000, help="每分钟token数配额")
+    parser.add_argument("--requests", type=int, default=40, help="总请求数")
+    parser.add_argument("--workers", type=int, default=8, help="并发会话数")
+    parser.add_argument("--state-file", type=Path, help="跨进程共享的状态文件")
+    args = parser.parse_args()
+
+    limiter = RateLimiter(args.rpm, args.tpm, state_file=args.state_file)
+    with StubLLMServer() as server:
+        client = RateLimitedClient(OpenAI(api_key="stub", base_url=server.base_url, max_retries=0), limiter)
+
+        def one_request(i: int) -> None:
+            client.chat.completions.create(
+                model="deepseek-chat",
+                messages=[{"role": "user", "content": f"Request {i}: say something short."}],
+                max_tokens=64,
+            )
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(one_request, range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    # 桶初始是满的，开头最多有 request_capacity 个请求立即放行；多个进程共享状态文件时速率是所有进程之和
+    print(f"🚦 pid {os.getpid()}: {args.requests} 个请求用时 {elapsed:.2f}s（{args.requests / elapsed * 60:.0f}/min，"
+          f"含开头最多 {limiter.request_capacity:.0f} 个突发请求；配额 {args.rpm:.0f}/min）")
+    print(f"📊 {limiter.report()}")
+
+
+if __name__ == "__main__":
+    main()
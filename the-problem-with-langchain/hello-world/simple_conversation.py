@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+SimpleConversation - 基于DeepSeek官方库（OpenAI SDK）的简单对话管理类
+
+从 langchain_critique_demo_deepseek_api_only.py 中抽取出来，便于其他脚本复用。
+
+支持两种历史管理策略：
+- 默认：超过 max_history 时直接丢弃最旧的消息
+- 压缩（compaction=True）：被丢弃的消息交给后台线程总结成一条滚动摘要，
+  摘要在之后的某一轮对话开始时原子地替换进 prompt，不占用用户请求的关键路径
+
+长期记忆（long_term_memory=True）：被淘汰的每一轮都放进会话内的检索索引（TurnMemory），
+每轮按用户输入取回最相关的几轮旧对话，在token预算内与最近的历史一起注入，用户不用再重复说过的事情。
+
+可选的 retriever（如 DialogIndex.build_context）按用户输入检索上下文，
+只注入本轮请求的prompt，不写入历史。
+
+可选的 router（ModelRouter）按每轮请求的复杂度在快模型和推理模型之间选择。
+
+begin_turn()/end_turn() 把一轮对话拆成"构造请求"和"记录回复"两步，
+调用方可以自己发起（异步、流式的）API调用，如 chat_gateway.py。
+
+历史存放在结构共享的 MessageLog 中，fork() 以O(1)分叉出一个新对话
+（A/B测试不同的system prompt、"从这里重试"），分支之间共享共同前缀。
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Optional, cast
+
+from conversation_history import MessageLog
+from long_term_memory import TurnMemory
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+    from model_router import ModelRoute, ModelRouter
+
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of an ongoing conversation. "
+    "Merge the existing summary with the new messages below into an updated summary. "
+    "Keep every fact, name, number and decision the user may refer to later. "
+    "Be concise and reply with the summary only."
+)
+
+
+@dataclass
+class Turn:
+    """进行中的一轮对话（begin_turn 返回，交给 end_turn 或 cancel_turn）"""
+    messages: list[dict[str, Any]]  # 要发送给API的消息
+    model: str
+    route: Optional["ModelRoute"] = None
+    history_length: int = 0  # 加入用户消息之前的历史长度
+    started: float = field(default_factory=time.perf_counter)
+
+
+class SimpleConversation:
+    """简单的对话管理类 - 展示如何优雅地封装对话逻辑"""
+
+    def __init__(
+        self,
+        client: "OpenAI",
+        system_prompt: str = "",
+        max_history: int = 20,
+        compaction: bool = False,
+        summary_max_tokens: int = 300,
+        retriever: Optional[Callable[[str], str]] = None,
+        model: str = "deepseek-chat",
+        router: Optional["ModelRouter"] = None,
+        long_term_memory: bool = False,
+        memory_turns: int = 3,
+        memory_budget_tokens: int = 500,
+    ):
+        """
+        初始化对话
+
+        Args:
+            client: OpenAI客户端实例
+            system_prompt: 系统提示词
+            max_history: 最大保留的历史消息数（不包括system消息）
+            compaction: 是否把超出 max_history 的旧消息在后台总结成摘要，而不是直接丢弃
+            summary_max_tokens: 摘要调用的 max_tokens 上限
+            retriever: 输入用户消息、返回检索上下文的函数；返回空字符串表示本轮不注入
+            model: 模型名称（设置了 router 时只用于后台摘要）
+            router: 按复杂度为每轮请求选择模型的路由器
+            long_term_memory: 是否索引被淘汰的轮次，每轮按相关度取回注入prompt
+            memory_turns: 每轮最多取回几轮旧对话
+            memory_budget_tokens: 取回的旧对话占用的token上限
+        """
+        self.client = client
+        self.max_history = max_history
+        self.system_messages: list[dict[str, Any]] = []
+        self.log = MessageLog()  # 除system消息外的历史
+        self.retriever = retriever
+        self.model = model
+        self.router = router
+        self.last_route: Optional["ModelRoute"] = None  # 最近一轮实际使用的路由
+
+        # 长期记忆
+        self.memory = TurnMemory() if long_term_memory else None
+        self.memory_turns = memory_turns
+        self.memory_budget_tokens = memory_budget_tokens
+
+        if system_prompt:
+            self.system_messages.append({"role": "system", "content": system_prompt})
+
+        # 压缩模式的状态
+        self.compaction = compaction
+        self.summary_max_tokens = summary_max_tokens
+        self.summary = ""  # 已生效的摘要（会出现在prompt中）
+        self.compaction_count = 0  # 已生效的摘要次数
+        self._evicted: list[dict[str, Any]] = []  # 等待总结的旧消息
+        self._ready_summary: Optional[str] = None  # 后台已算好、尚未生效的摘要
+        self._summary_future: Optional[Future] = None
+        self._generation = 0  # clear_history 后丢弃过期的后台结果
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def messages(self) -> list[dict[str, Any]]:
+        """system消息 + 历史（新列表）"""
+        return self.system_messages + self.log.to_list()
+
+    def chat(self, user_input: str, temperature: Optional[float] = 0.7) -> str:
+        """
+        发送消息并获取回复
+
+        Args:
+            user_input: 用户输入
+            temperature: 温度参数（None 表示不发送；推理模型不支持该参数，设置后 router 只会选快模型）
+
+        Returns:
+            AI的回复内容
+        """
+        params = {"temperature": temperature} if temperature is not None else {}
+        turn = self.begin_turn(user_input, params)
+        response = self.client.chat.completions.create(
+            model=turn.model,
+            messages=cast(Any, turn.messages),
+            **params,
+        )
+
+        # 获取AI回复
+        assistant_response = response.choices[0].message.content or ""
+        self.end_turn(turn, assistant_response, response.usage)
+        return assistant_response
+
+    def begin_turn(self, user_input: str, params: Optional[dict[str, Any]] = None) -> Turn:
+        """
+        记录用户消息，返回本轮要发送的消息和模型（调用方自己发起API调用）
+
+        params 是调用方将要附带的其他请求参数（temperature、tools等），router 据此排除处理不了它们的模型。
+        """
+        # 应用后台已完成的摘要（原子替换）
+        self._apply_ready_summary()
+
+        # 添加用户消息
+        history_length = len(self.log)
+        self.log.append({"role": "user", "content": user_input})
+
+        # 检索上下文和相关的旧对话（只用于本轮请求）
+        context = self.retriever(user_input) if self.retriever is not None else ""
+        recalled = ""
+        if self.memory is not None:
+            recalled = self.memory.build_context(user_input, self.memory_turns, self.memory_budget_tokens)
+
+        # 选择模型
+        messages = self._build_messages(context, recalled)
+        route = self.router.route(messages, params=params) if self.router is not None else None
+        model = route.model if route is not None else self.model
+        return Turn(messages, model, route, history_length)
+
+    def end_turn(self, turn: Turn, reply: str, usage: Any = None):
+        """记录AI回复，裁剪历史并安排后台摘要"""
+        if turn.route is not None and self.router is not None:
+            self.router.record(turn.route, time.perf_counter() - turn.started, usage)
+        self.last_route = turn.route
+
+        self.log.append({"role": "assistant", "content": reply})
+
+        # 限制历史长度（保留system消息）
+        self._trim_history()
+
+        # 回复已经拿到，摘要放到后台去做
+        self._schedule_compaction()
+
+    def cancel_turn(self, turn: Turn):
+        """API调用失败或被中断时撤销本轮的用户消息"""
+        self.log.truncate(turn.history_length)
+
+    def _build_messages(self, context: str = "", recalled: str = "") -> list[dict[str, Any]]:
+        """构造发送给API的消息列表：system消息 + 摘要 + 取回的旧对话 + 检索上下文 + 最近的历史"""
+        system_messages = list(self.system_messages)
+        if self.summary:
+            system_messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{self.summary}",
+            })
+        if recalled:
+            system_messages.append({"role": "system", "content": recalled})
+        if context:
+            system_messages.append({"role": "system", "content": context})
+        return system_messages + self.log.to_list()
+
+    def _trim_history(self):
+        """保持历史消息在限制范围内（system消息单独存放，不受影响）"""
+        evicted = self.log.trim(self.max_history)
+        if evicted and self.memory is not None:
+            self.memory.add_messages(evicted)
+        if evicted and self.compaction:
+            with self._lock:
+                self._evicted.extend(evicted)
+
+    def _schedule_compaction(self):
+        """如果有待总结的消息且后台空闲，就提交一次总结任务"""
+        if not self.compaction:
+            return
+
+        with self._lock:
+            if not self._evicted:
+                return
+            if self._summary_future is not None and not self._summary_future.done():
+                # 上一次总结还在进行，这批消息留到下一轮再提交
+                return
+            batch = self._evicted
+            self._evicted = []
+            base_summary = self._ready_summary if self._ready_summary is not None else self.summary
+            generation = self._generation
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compaction")
+        self._summary_future = self._executor.submit(self._summarize, base_summary, batch, generation)
+
+    def _summarize(self, base_summary: str, batch: list[dict[str, Any]], generation: int) -> None:
+        """在后台线程中调用模型，把旧摘要和新淘汰的消息合并成新摘要"""
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in batch)
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=cast(Any, [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {
+                        "role": "user",
+                        "content": f"Existing summary:\n{base_summary or '(none)'}\n\nNew messages:\n{transcript}",
+                    },
+                ]),
+                temperature=0,
+                max_tokens=self.summary_max_tokens,
+            )
+            new_summary = (response.choices[0].message.content or "").strip()
+        except Exception:
+            # 总结失败时把消息放回队列，下一轮重试，避免丢失上下文
+            with self._lock:
+                if generation == self._generation:
+                    self._evicted = batch + self._evicted
+            return
+
+        with self._lock:
+            if generation == self._generation:
+                self._ready_summary = new_summary
+
+    def _apply_ready_summary(self):
+        """把后台算好的摘要原子地替换为当前摘要"""
+        with self._lock:
+            if self._ready_summary is None:
+                return
+            self.summary = self._ready_summary
+            self._ready_summary = None
+            self.compaction_count += 1
+
+    def wait_for_compaction(self, timeout: Optional[float] = None):
+        """等待正在进行的后台总结完成（主要用于演示和退出前）"""
+        future = self._summary_future
+        if future is not None:
+            future.result(timeout=timeout)
+        self._apply_ready_summary()
+
+    def close(self):
+        """关闭后台总结线程"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def get_history(self) -> list[dict[str, Any]]:
+        """获取对话历史"""
+        return self.messages
+
+    def fork(self, system_prompt: Optional[str] = None, at: Optional[int] = None) -> "SimpleConversation":
+        """
+        分叉出一个新对话，O(1)，与当前对话共享已有的历史
+
+        后台总结正在进行时先等它完成，两边都带上这份摘要（否则分支会一直保留那批没压缩的旧消息）。
+
+        Args:
+            system_prompt: 新分支使用的系统提示词（None 表示沿用当前的）
+            at: 只保留前 at 条历史消息（不含system消息），用于"从这里重试"
+
+        Returns:
+            新的 SimpleConversation；之后两边各自追加消息，互不影响
+        """
+        future = self._summary_future
+        if future is not None:
+            future.result()
+        branch = SimpleConversation(
+            self.client,
+            max_history=self.max_history,
+            compaction=self.compaction,
+            summary_max_tokens=self.summary_max_tokens,
+            retriever=self.retriever,
+            model=self.model,
+            router=self.router,
+            memory_turns=self.memory_turns,
+            memory_budget_tokens=self.memory_budget_tokens,
+        )
+        branch.memory = self.memory.fork() if self.memory is not None else None
+        if system_prompt is None:
+            branch.system_messages = list(self.system_messages)
+        elif system_prompt:
+            branch.system_messages = [{"role": "system", "content": system_prompt}]
+        branch.log = self.log.fork()
+        if at is not None:
+            branch.log.truncate(at)
+        with self._lock:
+            branch.summary = self.summary
+            branch.compaction_count = self.compaction_count
+            branch._ready_summary = self._ready_summary
+            branch._evicted = list(self._evicted)
+        return branch
+
+    def clear_history(self, keep_system: bool = True):
+        """清除对话历史"""
+        self.log.clear()
+        if self.memory is not None:
+            self.memory.clear()
+        if not keep_system:
+            self.system_messages = []
+
+        with self._lock:
+            self._generation += 1
+            self.summary = ""
+            self._evicted = []
+            self._ready_summary = None
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""
+请求合并（singleflight）- 同时进行的相同请求只发一次上游调用
+
+流量高峰时很多会话发出完全相同的第一轮（对厨师机器人说 "Hi there!"、同一句翻译），
+每一个都会变成一次独立的上游调用。
+
+SingleFlight 按请求的键合并正在进行的调用：
+- 第一个调用者（leader）真正执行，之后到达的相同请求（follower）等待同一个结果；
+  调用结束后键即被移除，这里只合并同时进行的请求，不做缓存
+- 线程和 asyncio 任务可以混用：结果通过 concurrent.futures.Future 传递，
+  同步调用方阻塞等待，异步调用方用 asyncio.wrap_future 等待；
+  异步的上游调用在独立的任务里执行，任何一个等待者（包括leader）被取消都不会取消共享的调用
+- 流式响应：后台泵（线程或任务）把上游的chunk写入共享缓冲区，每个等待者从头读取，
+  中途加入的follower也能拿到完整的流；某个消费者提前退出不会影响其他人；
+  异步泵所在的事件循环关闭后，其他线程/事件循环里的读取方收到错误而不是永远等待
+- completion_key 只为确定性的请求（temperature=0，n=1）生成键，
+  规范化消息内容后序列化为JSON；非确定性请求照常各自调用
+
+用法:
+    flight = SingleFlight()
+    client = CoalescingClient(OpenAI(...), flight)       # 或 AsyncOpenAI
+    client.chat.completions.create(model=..., messages=..., temperature=0)
+
+    @flight.wrap                                          # 工具调用
+    def search_recipes(category: str) -> str: ...
+
+注意：所有等待者拿到的是同一个响应对象，不要修改它。
+"""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# 读取方每隔多久检查一次异步泵所在的事件循环是否已经关闭（秒）
+_PUMP_CHECK_INTERVAL = 1.0
+
+
+def _normalize(value: Any) -> Any:
+    """规范化请求参数：字符串去掉首尾空白并合并连续空白，pydantic对象转为dict"""
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if hasattr(value, "model_dump"):
+        return _normalize(value.model_dump())
+    return value
+
+
+def completion_key(params: dict[str, Any], deterministic_only: bool = True) -> Optional[str]:
+    """
+    chat.completions.create 参数的合并键
+
+    Args:
+        params: create 的关键字参数
+        deterministic_only: 只为 temperature=0 且 n=1 的请求生成键
+
+    Returns:
+        键（参数的规范化JSON的哈希），不应合并时返回None
+    """
+    if deterministic_only and (params.get("temperature", 1.0) != 0 or params.get("n", 1) != 1):
+        return None
+    ignored = {"extra_headers", "timeout", "user"}
+    payload = {key: _normalize(value) for key, value in params.items() if key not in ignored}
+    try:
+        data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class FlightStats:
+    """合并统计"""
+    calls: int = 0  # 上游调用次数
+    shared: int = 0  # 合并到已有调用上的请求数
+
+    @property
+    def saved(self) -> float:
+        """被合并掉的请求比例"""
+        total = self.calls + self.shared
+        return self.shared / total if total else 0.0
+
+    def report(self) -> str:
+        return f"{self.calls + self.shared} requests, {self.calls} upstream calls, {self.saved:.0%} coalesced"
+
+
+class _StreamBuffer:
+    """一次流式调用的共享缓冲区：一个写入方，任意多个同步/异步读取方"""
+
+    def __init__(self):
+        self.chunks: list[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.pump_loop: Optional[asyncio.AbstractEventLoop] = None  # 异步泵所在的事件循环
+        self._cond = threading.Condition()
+        self._async_waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def orphaned(self) -> bool:
+        """泵的事件循环已关闭，不会再有写入"""
+        return not self.done and self.pump_loop is not None and self.pump_loop.is_closed()
+
+    def _check_pump(self):
+        """（持有锁时调用）泵的事件循环已关闭时，让所有读取方失败"""
+        if self.orphaned():
+            self.done = True
+            self.error = RuntimeError("the event loop running this shared stream was closed")
+            self._wake()
+
+    def _wake(self):
+        for loop, event in self._async_waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(event.set)
+        self._async_waiters = []
+        self._cond.notify_all()
+
+    def append(self, chunk: Any):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._wake()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._wake()
+
+    def __iter__(self) -> Iterator[Any]:
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.done:
+                    self._cond.wait(_PUMP_CHECK_INTERVAL)
+                    self._check_pump()
+                if index >= len(self.chunks):
+                    if self.error is not None:
+                        raise self.error
+                    return
+                chunk = self.chunks[index]
+            index += 1
+            yield chunk
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        index = 0
+        while True:
+            with self._cond:
+                self._check_pump()
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                    event = None
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    event = asyncio.Event()
+                    self._async_waiters.append((asyncio.get_running_loop(), event))
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), _PUMP_CHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            index += 1
+            yield chunk
+
+
+class SharedStream:
+    """共享流的一个读取方，用法与SDK的 Stream / AsyncStream 相同（可迭代、可 with、可 close）"""
+
+    def __init__(self, buffer: _StreamBuffer):
+        self._buffer = buffer
+        self._closed = False
+
+    def __iter__(self) -> Iterator[Any]:
+        for chunk in self._buffer:
+            if self._closed:
+                return
+            yield chunk
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        async for chunk in self._buffer:
+            if self._closed:
+                return
+            yield chunk
+
+    def close(self):
+        """只停止这个读取方，上游流由后台泵读完"""
+        self._closed = True
+
+    def __enter__(self) -> "SharedStream":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def __aenter__(self) -> "SharedStream":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class SingleFlight:
+    """按键合并同时进行的调用（线程和asyncio通用）"""
+
+    def __init__(self):
+        self.stats = FlightStats()
+        self._lock = threading.Lock()
+        self._calls: dict[Any, Future] = {}
+        self._streams: dict[Any, _StreamBuffer] = {}
+        self._tasks: set[asyncio.Future] = set()  # 异步的上游调用和流式泵
+
+    def _join(self, table: dict[Any, Any], key: Any, factory: Callable[[], Any]) -> tuple[Any, bool]:
+        """返回 (共享对象, 是否是leader)"""
+        with self._lock:
+            existing = table.get(key)
+            # 泵已经随事件循环消失的流不能再加入，由新的leader重新发起
+            if existing is not None and not (isinstance(existing, _StreamBuffer) and existing.orphaned()):
+                self.stats.shared += 1
+                return existing, False
+            created = table[key] = factory()
+            self.stats.calls += 1
+            return created, True
+
+    def _forget(self, table: dict[Any, Any], key: Any, value: Any):
+        with self._lock:
+            if table.get(key) is value:
+                del table[key]
+
+    def _keep(self, task: asyncio.Future):
+        """保留任务的引用，避免任务在完成前被回收"""
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def do(self, key: Any, fn: Callable[[], T]) -> T:
+        """同步调用：键为None时不合并"""
+        if key is None:
+            return fn()
+        future, leader = self._join(self._calls, key, Future)
+        if leader:
+            future.set_running_or_notify_cancel()  # 运行中的Future不能再被取消
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._forget(self._calls, key, future)
+        return future.result()
+
+    async def do_async(self, key: Any, fn: Callable[[], Awaitable[T]]) -> T:
+        """异步调用：与同步调用共享同一张表，可以合并到另一个线程或事件循环里的调用上"""
+        if key is None:
+            return await fn()
+        future, leader = self._join(self._calls, key, Future)
+        if leader:
+            # 上游调用放进独立的任务：leader被取消时调用照常完成，follower仍然拿到结果
+            future.set_running_or_notify_cancel()
+            task = asyncio.ensure_future(fn())
+            self._keep(task)
+
+            def settle(task: asyncio.Future):
+                try:
+                    if task.cancelled():
+                        # 任务只会随事件循环关闭而取消；不能把 CancelledError 交给别的等待者，
+                        # 他们会以为是自己被取消了
+                        future.set_exception(RuntimeError("the event loop running this shared call was closed"))
+                    elif task.exception() is not None:
+                        future.set_exception(task.exception())
+                    else:
+                        future.set_result(task.result())
+                finally:
+                    self._forget(self._calls, key, future)
+
+            task.add_done_callback(settle)
+        # 每个等待者只取消自己的等待，不取消共享的Future
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def stream(self, key: Any, fn: Callable[[], Iterator[Any]]) -> SharedStream:
+        """同步流：leader 在后台线程里读上游，所有调用方从共享缓冲区读取"""
+        buffer, leader = self._join(self._streams, key, _StreamBuffer) if key is not None else (_StreamBuffer(), True)
+        if leader:
+            try:
+                upstream = fn()  # 在调用线程中发起请求，连接错误直接抛给leader
+            except BaseException as e:
+                buffer.finish(e)
+                self._forget(self._streams, key, buffer)
+                raise
+
+            def pump():
+                try:
+                    for chunk in upstream:
+                        buffer.append(chunk)
+                except BaseException as e:
+                    buffer.finish(e)
+                else:
+                    buffer.finish()
+                finally:
+                    self._forget(self._streams, key, buffer)
+
+            threading.Thread(target=pump, name="singleflight-stream", daemon=True).start()
+        return SharedStream(buffer)
+
+    async def stream_async(self, key: Any, fn: Callable[[], Awaitable[AsyncIterator[Any]]]) -> SharedStream:
+        """异步流：leader 在当前事件循环里用一个任务读上游"""
+        buffer, leader = self._join(self._streams, key, _StreamBuffer) if key is not None else (_StreamBuffer(), True)
+        if leader:
+            try:
+                upstream = await fn()
+            except BaseException as e:
+                buffer.finish(e)
+                self._forget(self._streams, key, buffer)
+                raise
+
+            async def pump():
+                try:
+                    async for chunk in upstream:
+                        buffer.append(chunk)
+                except asyncio.CancelledError:
+                    # 泵只会随事件循环关闭而取消；读取方收到普通错误，而不是看起来像自己被取消
+                    buffer.finish(RuntimeError("the event loop running this shared stream was closed"))
+                    raise
+                except BaseException as e:
+                    buffer.finish(e)
+                else:
+                    buffer.finish()
+                finally:
+                    self._forget(self._streams, key, buffer)
+
+            buffer.pump_loop = asyncio.get_running_loop()
+            self._keep(asyncio.ensure_future(pump()))
+        return SharedStream(buffer)
+
+    def wrap(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """装饰工具函数（同步或async）：相同参数的并发调用只执行一次"""
+        name = f"{fn.__module__}.{fn.__qualname__}"
+
+        def key_for(args: tuple, kwargs: dict[str, Any]) -> Optional[str]:
+            try:
+                return name + json.dumps([args, kwargs], sort_keys=True, default=str)
+            except (TypeError, ValueError):
+                return None
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                return await self.do_async(key_for(args, kwargs), lambda: fn(*args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return self.do(key_for(args, kwargs), lambda: fn(*args, **kwargs))
+        return wrapper
+
+
+class _CoalescingCompletions:
+    def __init__(self, completions: Any, flight: SingleFlight, deterministic_only: bool):
+        self._completions = completions
+        self._flight = flight
+        self._deterministic_only = deterministic_only
+        # SDK给 create 套了一层同步装饰器，要解开才能判断是否是协程函数
+        self._is_async = inspect.iscoroutinefunction(inspect.unwrap(completions.create))
+
+    def create(self, **kwargs: Any) -> Any:
+        key = completion_key(kwargs, self._deterministic_only)
+        if self._is_async:
+            if kwargs.get("stream"):
+                return self._flight.stream_async(key, lambda: self._completions.create(**kwargs))
+            return self._flight.do_async(key, lambda: self._completions.create(**kwargs))
+        if kwargs.get("stream"):
+            return self._flight.stream(key, lambda: self._completions.create(**kwargs))
+        return self._flight.do(key, lambda: self._completions.create(**kwargs))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._completions, name)
+
+
+class _CoalescingChat:
+    def __init__(self, chat: Any, flight: SingleFlight, deterministic_only: bool):
+        self.completions = _CoalescingCompletions(chat.completions, flight, deterministic_only)
+        self._chat = chat
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._chat, name)
+
+
+class CoalescingClient:
+    """
+    包装 OpenAI / AsyncOpenAI 客户端，让相同的 chat.completions.create 请求合并
+
+    其余属性直接转发给原客户端，可以直接传给 SimpleConversation 等使用客户端的代码。
+    """
+
+    def __init__(self, client: Any, flight: Optional[SingleFlight] = None, deterministic_only: bool = True):
+        """
+        Args:
+            client: OpenAI 或 AsyncOpenAI 客户端实例
+            flight: 共享的 SingleFlight（多个客户端共用时可以互相合并）
+            deterministic_only: 只合并 temperature=0 的请求；关闭后相同的采样请求也会共享一个回复
+        """
+        self._client = client
+        self.flight = flight or SingleFlight()
+        self.chat = _CoalescingChat(client.chat, self.flight, deterministic_only)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+def main():
+    """50个线程和50个协程同时发出相同的第一轮，观察上游调用次数"""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    from openai import AsyncOpenAI, OpenAI
+
+    from stub_llm_server import StubLLMServer, default_responder
+
+    def slow_responder(body: dict[str, Any]) -> dict[str, Any]:
+        time.sleep(0.3)  # 模拟上游延迟，让请求有机会重叠
+        return default_responder(body)
+
+    request = {"model": "deepseek-chat", "messages": [{"role": "user", "content": "Hi there!"}], "temperature": 0}
+    flight = SingleFlight()
+    with StubLLMServer(responder=slow_responder) as server:
+        client = CoalescingClient(OpenAI(api_key="stub", base_url=server.base_url), flight)
+        async_client = CoalescingClient(AsyncOpenAI(api_key="stub", base_url=server.base_url), flight)
+
+        async def async_requests() -> list[str]:
+            async def one(i: int) -> str:
+                if i % 2:
+                    response = await async_client.chat.completions.create(**request)
+                    return response.choices[0].message.content
+                stream = await async_client.chat.completions.create(**request, stream=True)
+                return "".join([chunk.choices[0].delta.content or "" async for chunk in stream if chunk.choices])
+            return await asyncio.gather(*(one(i) for i in range(50)))
+
+        def sync_request(i: int) -> str:
+            return client.chat.completions.create(**request).choices[0].message.content
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=50) as pool:
+            threaded = pool.map(sync_request, range(50))
+            replies = asyncio.run(async_requests()) + list(threaded)
+        elapsed = time.perf_counter() - start
+
+    print(f"🔀 {len(replies)} 个相同请求（线程、协程、流式混合）用时 {elapsed:.2f}s，"
+          f"桩服务器收到 {server.request_count} 个请求，回复一致: {len(set(replies)) == 1}")
+    print(f"📊 {flight.stats.report()}")
+
+
+if __name__ == "__main__":
+    main()
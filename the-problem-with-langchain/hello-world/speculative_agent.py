@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+投机执行工具 - 在模型还在流式输出时就开始调用工具
+
+普通的Agent循环要等模型完整返回后才开始执行 search_recipes 或 calculator。
+这里以流式方式接收模型的 tool_calls：某个工具调用的名称和参数一旦完整
+（参数已经是合法的JSON对象），立刻在后台线程中开始执行，与剩余的流式输出并行。
+流结束后，如果最终的工具调用与投机执行的不一致（参数又变了、工具名不同、
+或者模型最终没有调用工具），就丢弃投机结果，按最终结果重新执行。
+
+已经开始的调用无法撤回，所以只有 speculate 中列出的工具（只读、可以重复执行的，如搜索、计算）
+才会投机执行；下单、发消息这类有副作用的工具总是等流结束后再执行一次。
+
+对以搜索为主的流量，工具延迟和生成延迟可以重叠起来。
+
+用法:
+    agent = SpeculativeAgent(client, tools={"search_recipes": search_recipes}, tool_schemas=[...],
+                             speculate={"search_recipes"})
+    answer = agent.run([{"role": "user", "content": "Find me dessert recipes"}])
+"""
+
+import json
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional, cast
+
+from plan_cache import calculator
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+    from model_router import ModelRouter
+
+
+@dataclass
+class _PendingCall:
+    """流式接收中的一个工具调用"""
+    id: str = ""
+    name: str = ""
+    arguments: str = ""
+    speculative_key: Optional[tuple[str, str]] = None
+    future: Optional[Future] = None
+    started_at: float = 0.0
+
+
+@dataclass
+class SpeculationStats:
+    """投机执行的统计"""
+    speculated: int = 0  # 提前开始的工具调用数
+    confirmed: int = 0  # 与最终结果一致、被采用的次数
+    discarded: int = 0  # 与最终结果不一致、被丢弃的次数
+    overlap_seconds: float = 0.0  # 工具执行与流式生成重叠的时间（即节省的时间）
+
+
+def _canonical(arguments: str) -> Optional[str]:
+    """把参数字符串规范化为排序后的JSON；不是完整的JSON对象时返回None"""
+    try:
+        parsed = json.loads(arguments)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(parsed, dict):
+        return None
+    return json.dumps(parsed, sort_keys=True, ensure_ascii=False)
+
+
+class SpeculativeAgent:
+    """基于原生 tool_calls 的Agent循环，支持工具投机执行"""
+
+    def __init__(
+        self,
+        client: "OpenAI",
+        tools: dict[str, Callable[..., Any]],
+        tool_schemas: list[dict[str, Any]],
+        model: str = "deepseek-chat",
+        max_steps: int = 5,
+        max_workers: int = 4,
+        router: Optional["ModelRouter"] = None,
+        speculate: Iterable[str] = (),
+    ):
+        """
+        Args:
+            client: OpenAI客户端实例
+            tools: 工具名 -> 工具函数（以关键字参数调用）
+            tool_schemas: 传给API的工具定义（OpenAI tools格式）
+            model: 模型名称
+            max_steps: 最多进行几轮模型调用
+            max_workers: 工具执行线程数
+            router: 按复杂度（含已进行的工具调用轮数）为每一步选择模型；设置后 model 不再使用
+                （每一步都带 tools，不支持工具调用的推理模型不会被选中）
+            speculate: 可以投机执行的工具名（没有副作用、重复执行也安全的工具）；默认不投机执行任何工具
+        """
+        self.client = client
+        self.tools = tools
+        self.tool_schemas = tool_schemas
+        self.model = model
+        self.max_steps = max_steps
+        self.router = router
+        self.speculate = frozenset(speculate)
+        self.stats = SpeculationStats()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative-tool")
+
+    def _execute(self, name: str, arguments: str) -> str:
+        """执行工具，返回字符串形式的结果"""
+        func = self.tools.get(name)
+        if func is None:
+            return f"Error: unknown tool {name}"
+        try:
+            result = func(**json.loads(arguments or "{}"))
+        except Exception as e:
+            return f"Error: {type(e).__name__}: {e}"
+        return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+
+    def _maybe_speculate(self, call: _PendingCall):
+        """参数刚好构成完整JSON对象时，提前开始执行工具"""
+        if call.future is not None or not call.name or not call.arguments.rstrip().endswith("}"):
+            return
+        canonical = _canonical(call.arguments)
+        if canonical is None or call.name not in self.tools or call.name not in self.speculate:
+            return
+        call.speculative_key = (call.name, canonical)
+        call.started_at = time.perf_counter()
+        call.future = self._executor.submit(self._execute, call.name, call.arguments)
+        self.stats.speculated += 1
+
+    def step(self, messages: list[dict[str, Any]]) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+        """
+        进行一轮流式模型调用，并执行（或采用投机执行的）工具
+
+        Returns:
+            (assistant消息, tool消息列表)；tool消息列表为空表示得到了最终回答
+        """
+        route = None
+        extra: dict[str, Any] = {}
+        if self.router is not None:
+            tool_depth = sum(1 for message in messages
+                             if message.get("role") == "assistant" and message.get("tool_calls"))
+            route = self.router.route(messages, tool_depth=tool_depth, params={"tools": self.tool_schemas})
+            extra["stream_options"] = {"include_usage": True}
+        started = time.perf_counter()
+        stream = self.client.chat.completions.create(
+            model=route.model if route is not None else self.model,
+            messages=cast(Any, messages),
+            tools=cast(Any, self.tool_schemas),
+            stream=True,
+            **extra,
+        )
+
+        content_parts: list[str] = []
+        calls: dict[int, _PendingCall] = {}
+        finish_reason = None
+        usage = None
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta
+            if delta.content:
+                content_parts.append(delta.content)
+            for tool_delta in delta.tool_calls or []:
+                call = calls.setdefault(tool_delta.index, _PendingCall())
+                if tool_delta.id:
+                    call.id = tool_delta.id
+                if tool_delta.function is not None:
+                    call.name += tool_delta.function.name or ""
+                    call.arguments += tool_delta.function.arguments or ""
+                self._maybe_speculate(call)
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+        stream_done = time.perf_counter()
+        if route is not None and self.router is not None:
+            self.router.record(route, stream_done - started, usage)
+
+        assistant: dict[str, Any] = {"role": "assistant", "content": "".join(content_parts) or None}
+        if finish_reason != "tool_calls" or not calls:
+            # 模型最终没有调用工具：丢弃所有投机结果
+            for call in calls.values():
+                if call.future is not None:
+                    call.future.cancel()
+                    self.stats.discarded += 1
+            return assistant, []
+
+        ordered = [calls[index] for index in sorted(calls)]
+        assistant["tool_calls"] = [
+            {"id": call.id, "type": "function", "function": {"name": call.name, "arguments": call.arguments}}
+            for call in ordered
+        ]
+
+        tool_messages = []
+        for call in ordered:
+            final_key = (call.name, _canonical(call.arguments) or call.arguments)
+            if call.future is not None and call.speculative_key == final_key:
+                self.stats.confirmed += 1
+                # 流结束时工具已经运行了多久，这段时间就是被重叠掉的延迟
+                self.stats.overlap_seconds += max(0.0, stream_done - call.started_at)
+                result = call.future.result()
+            else:
+                if call.future is not None:
+                    call.future.cancel()
+                    self.stats.discarded += 1
+                result = self._execute(call.name, call.arguments)
+            tool_messages.append({"role": "tool", "tool_call_id": call.id, "content": result})
+        return assistant, tool_messages
+
+    def run(self, messages: list[dict[str, Any]]) -> str:
+        """运行完整的Agent循环，返回最终回答"""
+        messages = list(messages)
+        for _ in range(self.max_steps):
+            assistant, tool_messages = self.step(messages)
+            messages.append(assistant)
+            if not tool_messages:
+                return assistant["content"] or ""
+            messages.extend(tool_messages)
+        return "Agent stopped: reached max_steps."
+
+    def close(self):
+        """关闭工具执行线程池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ============================================================================
+# 演示：有DEEPSEEK_API_KEY时调用DeepSeek，否则使用本地桩服务器
+# ============================================================================
+RECIPE_DB = [
+    {"recipe_id": "recipe|167188", "name": "Creamy Strawberry Pie", "category": "dessert"},
+    {"recipe_id": "recipe|1488243", "name": "Summer Strawberry Pie", "category": "dessert"},
+    {"recipe_id": "recipe|836179", "name": "Easy Chicken Casserole", "category": "dinner"},
+]
+
+
+def search_recipes(query: str) -> list[dict[str, str]]:
+    """搜索食谱（模拟一次耗时0.5秒的目录查询）"""
+    time.sleep(0.5)
+    words = query.lower().split()
+    return [r for r in RECIPE_DB if any(w in r["category"] or w in r["name"].lower() for w in words)]
+
+
+TOOL_SCHEMAS = [
+    {"type": "function", "function": {
+        "name": "search_recipes",
+        "description": "Search for recipes by keyword such as 'dessert' or 'dinner'.",
+        "parameters": {"type": "object", "properties": {"query": {"type": "string"}}, "required": ["query"]},
+    }},
+    {"type": "function", "function": {
+        "name": "calculator",
+        "description": "Evaluate a math expression such as '25*4'.",
+        "parameters": {"type": "object", "properties": {"expression": {"type": "string"}}, "required": ["expression"]},
+    }},
+]
+
+
+def _stub_responder(body: dict[str, Any]) -> dict[str, Any]:
+    """桩服务器的响应：第一轮并行调用两次search_recipes，拿到结果后给出最终回答"""
+    messages = body["messages"]
+    if messages[-1]["role"] == "tool":
+        recipes: dict[str, dict[str, str]] = {}
+        for message in reversed(messages):
+            if message["role"] != "tool":
+                break
+            recipes.update((r["recipe_id"], r) for r in json.loads(message["content"]))
+        return {"content": "Here you go: " + ", ".join(f"{r['name']} ({r['recipe_id']})" for r in recipes.values())}
+    return {"content": "Let me look that up for you, one moment please while I search the catalog.", "tool_calls": [
+        {"id": f"call_{i}", "type": "function",
+         "function": {"name": "search_recipes", "arguments": json.dumps({"query": query})}}
+        for i, query in enumerate(["dessert", "pie"], 1)
+    ]}
+
+
+def main():
+    from openai import OpenAI
+
+    server = None
+    if os.environ.get("DEEPSEEK_API_KEY"):
+        client = OpenAI(api_key=os.environ["DEEPSEEK_API_KEY"], base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com"))
+    else:
+        from stub_llm_server import Distribution, LatencyProfile, StubLLMServer
+
+        # 每个流式分块间隔0.1秒：第一个工具调用的参数完整后，第二个调用还要再生成几个分块
+        latency = LatencyProfile(inter_token=Distribution("constant", 0.1))
+        server = StubLLMServer(responder=_stub_responder, latency=latency).start()
+        client = OpenAI(api_key="stub", base_url=server.base_url)
+        print(f"🧪 未设置DEEPSEEK_API_KEY，使用本地桩服务器 {server.base_url}")
+
+    agent = SpeculativeAgent(client, {"search_recipes": search_recipes, "calculator": calculator}, TOOL_SCHEMAS,
+                             speculate={"search_recipes", "calculator"})
+    try:
+        start = time.time()
+        answer = agent.run([
+            {"role": "system", "content": "You are a helpful recipe assistant. Always include Recipe IDs."},
+            {"role": "user", "content": "Find me some dessert recipes"},
+        ])
+        print(f"🤖 {answer}")
+        print(f"⏱️  总耗时: {time.time() - start:.2f}秒")
+        stats = agent.stats
+        print(f"📊 投机执行: {stats.speculated}次, 采用 {stats.confirmed}次, 丢弃 {stats.discarded}次, "
+              f"与生成重叠 {stats.overlap_seconds:.2f}秒")
+    finally:
+        agent.close()
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
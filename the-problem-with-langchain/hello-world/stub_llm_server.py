@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容的桩服务器（Stub Server）
+
+实现 /chat/completions（以及 /v1/chat/completions）接口，支持普通响应和流式（SSE）响应，
+包括 tool_calls（请求带 tools 时）、旧版的 function_call（请求带 functions 时，
+如 create_openai_functions_agent）和 ReAct 格式的Agent。
+无需 API 密钥、无需联网，可以让 OpenAI SDK 和 ChatOpenAI 直接通过 base_url 指向它，
+用于基准测试和离线调试。
+
+为了在注入的故障下测试重试、限流、熔断等功能，还支持：
+- 脚本化响应（ScriptedResponder）：按正则匹配最后一条消息，返回固定回复或依次返回一组回复
+- 延迟分布（LatencyProfile）：首token延迟（TTFT）和token间延迟，支持常数/均匀/正态/对数正态
+- 故障注入（FaultProfile）：按比例返回429（带Retry-After）和5xx、截断流式响应、延迟发送响应头
+- 混沌时间表（ChaosSchedule）：按时间轮换的多个阶段，每个阶段有自己的延迟和故障配置
+
+用法:
+    python stub_llm_server.py --port 8765
+    python stub_llm_server.py --ttft lognormal:0.3,1.5 --itl uniform:0.01,0.05 \\
+        --errors 429=0.1,503=0.05 --truncate 0.05 --slow-first-byte 0.02:8
+    python stub_llm_server.py --script replies.json --chaos chaos.json
+
+    client = OpenAI(api_key="stub", base_url="http://127.0.0.1:8765")
+
+    # 所有演示脚本都读取 DEEPSEEK_BASE_URL，设置后即指向桩服务器
+    DEEPSEEK_API_KEY=stub DEEPSEEK_BASE_URL=http://127.0.0.1:8765 python langchain_critique_demo.py
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional, Union
+
+# responder 接收请求体，返回 {"content": str}、{"content": None, "tool_calls": [...]}
+# 或 {"content": None, "function_call": {"name": ..., "arguments": ...}}
+Responder = Callable[[dict[str, Any]], dict[str, Any]]
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数（约4个字符一个token）"""
+    return max(1, len(text) // 4)
+
+
+_REACT_TOOLS_RE = re.compile(r"Action: [^\n]*?one of \[(?P<names>[^\]]*)\]")
+_REACT_QUESTION_RE = re.compile(r"^Question: (?!the input question)(?P<text>.+)$", re.MULTILINE)
+_REACT_OBSERVATION_RE = re.compile(r"\nObservation: (?!the (?:action )?result)(?P<text>.*?)(?:\nThought:|$)", re.DOTALL)
+
+
+def _first_user_content(messages: list[dict[str, Any]]) -> str:
+    return next((str(msg.get("content") or "") for msg in messages if msg.get("role") == "user"), "")
+
+
+def _call_first_function(function: dict[str, Any], messages: list[dict[str, Any]]) -> dict[str, str]:
+    """{"name", "arguments"}：调用给定的函数，字符串参数都填入用户的问题"""
+    properties = (function.get("parameters") or {}).get("properties") or {}
+    question = str(messages[-1].get("content") or "") if messages else ""
+    arguments = {name: question for name, schema in properties.items() if schema.get("type", "string") == "string"}
+    return {"name": function.get("name", "tool"), "arguments": json.dumps(arguments)}
+
+
+def _tool_call_reply(body: dict[str, Any], messages: list[dict[str, Any]]) -> dict[str, Any]:
+    """带 tools 的请求：用户刚提问时调用第一个工具（字符串参数填入问题），拿到工具结果后给出回答"""
+    if messages and messages[-1].get("role") == "tool":
+        return {"content": f"Here is what I found: {str(messages[-1].get('content') or '')[:300]}"}
+    function = body["tools"][0].get("function") or {}
+    return {"content": None, "tool_calls": [{
+        "id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+        "function": _call_first_function(function, messages),
+    }]}
+
+
+def _function_call_reply(body: dict[str, Any], messages: list[dict[str, Any]]) -> dict[str, Any]:
+    """带旧版 functions 的请求：与 tools 相同，只是用 function_call 调用、结果以 function 角色的消息返回"""
+    if messages and messages[-1].get("role") == "function":
+        return {"content": f"Here is what I found: {str(messages[-1].get('content') or '')[:300]}"}
+    return {"content": None, "function_call": _call_first_function(body["functions"][0], messages)}
+
+
+def _react_reply(prompt: str, messages: list[dict[str, Any]]) -> Optional[dict[str, Any]]:
+    """ReAct格式的Agent：第一步调用第一个工具，看到 Observation 后给出 Final Answer"""
+    tools = _REACT_TOOLS_RE.search(prompt)
+    if tools is None or "Final Answer" not in prompt:
+        return None
+    observations = _REACT_OBSERVATION_RE.findall(prompt)
+    if observations:
+        answer = " ".join(observations[-1].split())[:300]
+        return {"content": f"Thought: I now know the final answer\nFinal Answer: {answer}"}
+    tool = tools.group("names").split(",")[0].strip()
+    questions = _REACT_QUESTION_RE.findall(prompt)
+    question = questions[-1].strip() if questions else _first_user_content(messages).strip()[:200]
+    return {"content": f"Thought: I should use {tool}.\nAction: {tool}\nAction Input: {question}"}
+
+
+def default_responder(body: dict[str, Any]) -> dict[str, Any]:
+    """
+    默认的响应策略，覆盖本项目演示中的几种对话：
+    - 请求带 tools（Function Calling）时先返回工具调用，拿到工具结果后给出回答
+    - 请求带旧版的 functions 时同样先返回 function_call
+    - ReAct格式的Agent先返回 Action，看到 Observation 后返回 Final Answer
+    - 翻译请求返回固定的法语句子
+    - 计算器Agent的第一步返回工具调用JSON，拿到结果后给出最终答案
+    - 其他情况返回一句简短的回复
+    """
+    messages = body.get("messages") or []
+    last = str(messages[-1].get("content") or "") if messages else ""
+    prompt = "\n".join(str(msg.get("content") or "") for msg in messages)
+
+    if body.get("tools"):
+        return _tool_call_reply(body, messages)
+    if body.get("functions") and body.get("function_call") != "none":
+        return _function_call_reply(body, messages)
+    react = _react_reply(prompt, messages)
+    if react is not None:
+        return react
+    if "Calculator result" in last:
+        result = last.split(":", 1)[-1].strip()
+        return {"content": f"The answer is {result}."}
+    numbers = re.findall(r"\d+(?:\.\d+)?", last)
+    if "Calculator" in prompt and len(numbers) >= 2:
+        operator = "+" if ("plus" in last or "+" in last) else "*"
+        return {"content": json.dumps({"tool": "Calculator", "input": f"{numbers[0]}{operator}{numbers[1]}"})}
+    if "French" in prompt:
+        return {"content": "J'adore la programmation."}
+    return {"content": "Hello! This is a stub response."}
+
+
+def build_completion(body: dict[str, Any], reply: dict[str, Any]) -> dict[str, Any]:
+    """按OpenAI格式构造非流式的chat.completion响应"""
+    content = reply.get("content")
+    tool_calls = reply.get("tool_calls")
+    function_call = reply.get("function_call")
+    prompt_text = json.dumps(body.get("messages") or [], ensure_ascii=False)
+    completion_text = (content or "") + json.dumps(tool_calls or function_call or [])
+
+    message: dict[str, Any] = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    if function_call:
+        message["function_call"] = function_call
+    finish_reason = "tool_calls" if tool_calls else "function_call" if function_call else "stop"
+
+    prompt_tokens = estimate_tokens(prompt_text)
+    completion_tokens = estimate_tokens(completion_text)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "deepseek-chat"),
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": finish_reason,
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def iter_stream_chunks(body: dict[str, Any], reply: dict[str, Any]):
+    """按OpenAI格式逐个生成流式的chat.completion.chunk"""
+    completion = build_completion(body, reply)
+    base = {
+        "id": completion["id"],
+        "object": "chat.completion.chunk",
+        "created": completion["created"],
+        "model": completion["model"],
+    }
+
+    def chunk(delta: dict[str, Any], finish_reason: Optional[str] = None) -> dict[str, Any]:
+        return {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+    yield chunk({"role": "assistant", "content": ""})
+
+    content = reply.get("content") or ""
+    # 按空格切分，模拟逐token输出
+    pieces = content.split(" ")
+    for i, piece in enumerate(pieces):
+        yield chunk({"content": piece if i == len(pieces) - 1 else piece + " "})
+
+    for index, call in enumerate(reply.get("tool_calls") or []):
+        # 与真实API一样：先发送工具名，再分片发送参数
+        yield chunk({"tool_calls": [{
+            "index": index,
+            "id": call.get("id"),
+            "type": "function",
+            "function": {"name": call["function"]["name"], "arguments": ""},
+        }]})
+        arguments = call["function"]["arguments"]
+        for start in range(0, len(arguments), 8):
+            yield chunk({"tool_calls": [{"index": index, "function": {"arguments": arguments[start:start + 8]}}]})
+
+    function_call = reply.get("function_call")
+    if function_call:
+        yield chunk({"function_call": {"name": function_call["name"], "arguments": ""}})
+        arguments = function_call["arguments"]
+        for start in range(0, len(arguments), 8):
+            yield chunk({"function_call": {"arguments": arguments[start:start + 8]}})
+
+    yield chunk({}, completion["choices"][0]["finish_reason"])
+
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield {**base, "choices": [], "usage": completion["usage"]}
+
+
+# ---- 延迟和故障注入 ----
+@dataclass
+class Distribution:
+    """延迟分布（秒）"""
+    kind: str = "constant"  # constant / uniform / normal / lognormal
+    a: float = 0.0  # constant: 值；uniform: 下限；normal: 均值；lognormal: p50
+    b: float = 0.0  # uniform: 上限；normal: 标准差；lognormal: p99
+
+    @classmethod
+    def parse(cls, spec: Union[str, float, "Distribution", None]) -> "Distribution":
+        """解析 "0.2"、"uniform:0.05,0.2"、"normal:0.3,0.1"、"lognormal:0.3,1.5"（p50,p99）"""
+        if isinstance(spec, Distribution):
+            return spec
+        if spec is None:
+            return cls()
+        if isinstance(spec, (int, float)):
+            return cls("constant", float(spec))
+        kind, _, params = str(spec).partition(":")
+        if not params:
+            return cls("constant", float(kind))
+        values = [float(v) for v in params.split(",")]
+        if kind not in ("constant", "uniform", "normal", "lognormal") or len(values) != (1 if kind == "constant" else 2):
+            raise ValueError(f"invalid latency distribution {spec!r}")
+        return cls(kind, *values)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            value = rng.uniform(self.a, self.b)
+        elif self.kind == "normal":
+            value = rng.gauss(self.a, self.b)
+        elif self.kind == "lognormal":
+            if self.a <= 0:
+                return 0.0
+            sigma = max(0.0, math.log(max(self.b, self.a) / self.a) / 2.326)  # p99 = p50 * e^(2.326σ)
+            value = rng.lognormvariate(math.log(self.a), sigma)
+        else:
+            value = self.a
+        return max(0.0, value)
+
+
+@dataclass
+class LatencyProfile:
+    """首token延迟（TTFT）和token间延迟"""
+    ttft: Distribution = field(default_factory=Distribution)
+    inter_token: Distribution = field(default_factory=Distribution)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "LatencyProfile":
+        return cls(Distribution.parse(data.get("ttft")), Distribution.parse(data.get("inter_token")))
+
+
+@dataclass
+class FaultProfile:
+    """按比例注入的故障（每个请求独立抽样）"""
+    errors: dict[int, float] = field(default_factory=dict)  # HTTP状态码 → 比例，如 {429: 0.1, 503: 0.05}
+    truncate_rate: float = 0.0  # 响应发到一半时断开连接（流式不发送 [DONE]）
+    slow_first_byte_rate: float = 0.0  # 延迟发送响应头
+    slow_first_byte_seconds: float = 10.0
+    retry_after: float = 1.0  # 429响应的 Retry-After（秒）
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "FaultProfile":
+        return cls(
+            errors={int(status): float(rate) for status, rate in (data.get("errors") or {}).items()},
+            truncate_rate=float(data.get("truncate_rate", 0.0)),
+            slow_first_byte_rate=float(data.get("slow_first_byte_rate", 0.0)),
+            slow_first_byte_seconds=float(data.get("slow_first_byte_seconds", 10.0)),
+            retry_after=float(data.get("retry_after", 1.0)),
+        )
+
+    def pick_error(self, rng: random.Random) -> Optional[int]:
+        draw = rng.random()
+        for status, rate in self.errors.items():
+            if draw < rate:
+                return status
+            draw -= rate
+        return None
+
+
+@dataclass
+class ChaosPhase:
+    """混沌时间表中的一个阶段"""
+    duration: float
+    name: str = ""
+    latency: Optional[LatencyProfile] = None  # None 表示沿用服务器的默认配置
+    faults: Optional[FaultProfile] = None
+
+
+class ChaosSchedule:
+    """按时间循环的阶段列表，如 "正常30秒 → 429风暴10秒 → 5xx突发5秒 → 慢首字节10秒\""""
+
+    def __init__(self, phases: list[ChaosPhase], loop: bool = True):
+        if not phases or any(phase.duration <= 0 for phase in phases):
+            raise ValueError("chaos schedule needs phases with positive durations")
+        self.phases = phases
+        self.loop = loop
+        self.started = time.monotonic()
+
+    @classmethod
+    def load(cls, path: str) -> "ChaosSchedule":
+        """从JSON加载：{"loop": true, "phases": [{"name", "duration", "latency": {...}, "faults": {...}}]}"""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        phases = [ChaosPhase(
+            duration=float(item["duration"]), name=item.get("name", ""),
+            latency=LatencyProfile.from_dict(item["latency"]) if "latency" in item else None,
+            faults=FaultProfile.from_dict(item["faults"]) if "faults" in item else None,
+        ) for item in data["phases"]]
+        return cls(phases, loop=data.get("loop", True))
+
+    def current(self) -> Optional[ChaosPhase]:
+        """当前阶段；不循环且已经结束时返回None"""
+        elapsed = time.monotonic() - self.started
+        cycle = sum(phase.duration for phase in self.phases)
+        if elapsed >= cycle and not self.loop:
+            return None
+        elapsed %= cycle
+        for phase in self.phases:
+            if elapsed < phase.duration:
+                return phase
+            elapsed -= phase.duration
+        return self.phases[-1]
+
+
+class ScriptedResponder:
+    """
+    脚本化响应：按顺序检查规则，第一条匹配的规则给出回复，都不匹配时交给 fallback
+
+    规则格式（JSON文件为规则列表）：
+        {"match": "weather", "reply": {"content": "..."}}
+        {"match": "^Hi", "replies": [{"content": "a"}, {"content": "b"}]}   # 依次返回，最后一个重复
+        {"match": ".*", "reply": {"content": null, "tool_calls": [...]}, "times": 1}  # 只生效一次
+    match 是对最后一条消息内容的正则搜索（忽略大小写）。
+    """
+
+    def __init__(self, rules: list[dict[str, Any]], fallback: Optional[Responder] = None):
+        self.rules = []
+        for rule in rules:
+            replies = rule.get("replies") or [rule["reply"]]
+            self.rules.append({"pattern": re.compile(rule.get("match", ".*"), re.IGNORECASE | re.DOTALL),
+                               "replies": replies, "times": rule.get("times"), "used": 0})
+        self.fallback = fallback or default_responder
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, fallback: Optional[Responder] = None) -> "ScriptedResponder":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), fallback)
+
+    def __call__(self, body: dict[str, Any]) -> dict[str, Any]:
+        messages = body.get("messages") or []
+        last = str(messages[-1].get("content") or "") if messages else ""
+        with self._lock:
+            for rule in self.rules:
+                if rule["times"] is not None and rule["used"] >= rule["times"]:
+                    continue
+                if rule["pattern"].search(last):
+                    reply = rule["replies"][min(rule["used"], len(rule["replies"]) - 1)]
+                    rule["used"] += 1
+                    return dict(reply)
+        return self.fallback(body)
+
+
+class StubLLMServer:
+    """在后台线程中运行的本地桩服务器"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        responder: Optional[Responder] = None,
+        latency: Optional[LatencyProfile] = None,
+        faults: Optional[FaultProfile] = None,
+        chaos: Optional[ChaosSchedule] = None,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动选择空闲端口
+            responder: 自定义响应函数，默认使用 default_responder
+            latency: 默认的延迟分布（不设置时不加延迟）
+            faults: 默认的故障注入配置（不设置时不注入故障）
+            chaos: 混沌时间表，当前阶段的配置覆盖默认配置
+            seed: 随机种子，让故障和延迟可以复现
+        """
+        self.responder = responder or default_responder
+        self.latency = latency or LatencyProfile()
+        self.faults = faults or FaultProfile()
+        self.chaos = chaos
+        self.request_count = 0
+        self.injected: dict[str, int] = {}  # 已注入的故障类型 → 次数
+        self._count_lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._httpd = _Server((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _profiles(self) -> tuple[LatencyProfile, FaultProfile]:
+        phase = self.chaos.current() if self.chaos is not None else None
+        if phase is None:
+            return self.latency, self.faults
+        return phase.latency or self.latency, phase.faults or self.faults
+
+    def _record(self, fault: str):
+        with self._count_lock:
+            self.injected[fault] = self.injected.get(fault, 0) + 1
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):  # noqa: A002 - 覆盖基类方法签名
+                pass
+
+            def do_POST(self):
+                if self.path.rstrip("/") not in ("/chat/completions", "/v1/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError as e:
+                    self._send_json(400, {"error": {"message": f"Invalid JSON: {e}"}})
+                    return
+
+                with server._count_lock:
+                    server.request_count += 1
+                    latency, faults = server._profiles()
+                    rng = random.Random(server._rng.random())  # 每个请求独立的随机源，线程安全
+
+                if rng.random() < faults.slow_first_byte_rate:
+                    server._record("slow_first_byte")
+                    time.sleep(faults.slow_first_byte_seconds)
+                status = faults.pick_error(rng)
+                if status is not None:
+                    server._record(str(status))
+                    self._send_error(status, faults.retry_after)
+                    return
+
+                reply = server.responder(body)
+                truncate = rng.random() < faults.truncate_rate
+                if truncate:
+                    server._record("truncated")
+                if body.get("stream"):
+                    self._send_stream(body, reply, latency, rng, truncate)
+                else:
+                    completion = build_completion(body, reply)
+                    pieces = max(1, len((reply.get("content") or "").split(" ")))
+                    time.sleep(latency.ttft.sample(rng) + sum(latency.inter_token.sample(rng) for _ in range(pieces - 1)))
+                    self._send_json(200, completion, truncate)
+
+            def _send_error(self, status: int, retry_after: float):
+                kind = {429: "rate_limit_exceeded", 500: "server_error", 502: "bad_gateway",
+                        503: "service_unavailable"}.get(status, "error")
+                data = json.dumps({"error": {"message": f"Injected {status} from stub server", "type": kind,
+                                             "code": kind}}).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if status == 429:
+                    self.send_header("Retry-After", f"{retry_after:g}")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_json(self, status: int, payload: dict[str, Any], truncate: bool = False):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if truncate:
+                    # 声明的长度比实际发送的多，客户端读到一半连接就断了
+                    self.wfile.write(data[: len(data) // 2])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self.wfile.write(data)
+
+            def _send_stream(self, body: dict[str, Any], reply: dict[str, Any], latency: LatencyProfile,
+                             rng: random.Random, truncate: bool):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                chunks = list(iter_stream_chunks(body, reply))
+                cut = len(chunks) // 2 if truncate else len(chunks)
+                for i, chunk in enumerate(chunks[:cut]):
+                    time.sleep(latency.ttft.sample(rng) if i == 0 else latency.inter_token.sample(rng))
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                if truncate:
+                    return  # 不发送 [DONE]，直接断开
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> "StubLLMServer":
+        """在后台线程中启动服务器"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务器"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _Server(ThreadingHTTPServer):
+    # 默认的监听队列只有5，几百个并发连接同时到达时会被丢弃后重传（每次至少1秒）
+    request_queue_size = 1024
+
+
+def _parse_errors(spec: str) -> dict[int, float]:
+    """解析 "429=0.1,503=0.05\""""
+    errors = {}
+    for item in filter(None, spec.split(",")):
+        status, _, rate = item.partition("=")
+        errors[int(status)] = float(rate)
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="脚本化响应规则（JSON）")
+    parser.add_argument("--ttft", default="0", help="首token延迟分布，如 0.3、uniform:0.1,0.5、lognormal:0.3,1.5")
+    parser.add_argument("--itl", default="0", help="token间延迟分布，格式同 --ttft")
+    parser.add_argument("--errors", default="", help="按比例返回的错误状态码，如 429=0.1,503=0.05")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应的 Retry-After（秒）")
+    parser.add_argument("--truncate", type=float, default=0.0, help="截断响应的比例")
+    parser.add_argument("--slow-first-byte", default="", metavar="RATE:SECONDS",
+                        help="延迟发送响应头的比例和秒数，如 0.02:8")
+    parser.add_argument("--chaos", help="混沌时间表（JSON）")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    args = parser.parse_args()
+
+    slow_rate, _, slow_seconds = args.slow_first_byte.partition(":")
+    server = StubLLMServer(
+        args.host, args.port,
+        responder=ScriptedResponder.load(args.script) if args.script else None,
+        latency=LatencyProfile(Distribution.parse(args.ttft), Distribution.parse(args.itl)),
+        faults=FaultProfile(_parse_errors(args.errors), args.truncate, float(slow_rate or 0),
+                            float(slow_seconds or 10), args.retry_after),
+        chaos=ChaosSchedule.load(args.chaos) if args.chaos else None,
+        seed=args.seed,
+    )
+    print(f"🧪 Stub LLM server listening on {server.base_url}")
+    print("   按 Ctrl+C 退出")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 已停止")
+        if server.injected:
+            print(f"💥 注入的故障: {server.injected}（共 {server.request_count} 个请求）")
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()